@@ -1,22 +1,103 @@
 # -*- coding: utf-8 -*-
+import boot_profile  # 最先导入：开启启动分析 (ANIMEONE_BOOT_PROFILE=1) 时统计其后所有导入的耗时
 import os
 import re
 import html
 import time
 import json
+import gzip
+import uuid
+import base64
+import hashlib
 import httpx
 import logging
+import functools
 import threading
 import traceback 
 import urllib.parse
 from opencc import OpenCC
-from bs4 import BeautifulSoup
-from pypinyin import pinyin, Style
-from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context
+import metrics
+import multiproc
+import proxy_stream
+import episode_parser
+import sync_events
+import upstream_health
+import search_engine
+import refresh_scheduler
+import backfill
+import response_cache
+import catalogue_bundle
+import rate_limit
+import tracing
+from episode_loader import EpisodeLoader, expected_episode_count
+from catalogue import AnimeRecord
+from cover_index import CoverIndex
+from list_index import ListIndex, SORT_KEYS, FACET_DIMS, mask_from_positions, popcount, bit_tester
+from schedule_index import ScheduleIndex
+from cover_store import hash_from_relpath
+from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context, g, make_response
+boot_profile.mark("imports")
 
 # ================= 配置区 =================
-PORT = 5000
+PORT = int(os.environ.get("ANIMEONE_PORT", 5000))
 DEBUG = False
+# 上游地址（压测时可用环境变量指向 bench/fake_upstream.py）
+ANIME1_BASE = os.environ.get("ANIMEONE_UPSTREAM", "https://anime1.me").rstrip("/")
+ANIME1_VIDEO_API = os.environ.get("ANIMEONE_VIDEO_API", "https://v.anime1.me/api")
+BGM_API = os.environ.get("ANIMEONE_BGM_API", "https://api.bgm.tv").rstrip("/")
+BATCH_META_LIMIT = 200  # 批量元数据接口单次最多查询的番剧数
+LIST_PAGE_SIZE = 24  # /api/list 默认每页条数
+LIST_PAGE_SIZE_MAX = 100  # /api/list 每页条数上限
+SUGGEST_LIMIT = 8  # /api/suggest 默认返回条数
+SUGGEST_LIMIT_MAX = 20
+SUGGEST_MAX_AGE = 300  # /api/suggest 响应的浏览器缓存时间 (秒)
+RESPONSE_CACHE_BYTES = 32 * 1024 * 1024  # 只读接口响应缓存的字节上限，0 为关闭
+RESPONSE_CACHE_REDIS = os.environ.get("ANIMEONE_RESPONSE_CACHE_REDIS", "")  # 设为 redis://... 时多进程共享响应缓存
+RESPONSE_CACHE_TTL = 600  # 共享响应缓存条目的过期时间 (秒)
+STREAM_JSON_THRESHOLD = 500  # 追番 / 播放记录列表超过该条数时流式输出 JSON
+PROXY_SHARED_STREAMS = True  # 视频代理是否复用上游连接（关闭后每个 Range 请求直连上游）
+RATE_LIMIT = os.environ.get("ANIMEONE_RATE_LIMIT", "1") == "1"  # 是否按客户端限制访问上游的接口 (集数列表、播放地址、视频代理)
+UPSTREAM_CLIENT_RATE = 2.0  # 每个客户端每秒可请求的集数列表 / 播放地址次数
+UPSTREAM_CLIENT_BURST = 20  # 允许的突发次数
+UPSTREAM_SLOTS = 16  # 同时处理的集数列表 / 播放地址请求数，超出的排队
+UPSTREAM_SLOTS_PER_CLIENT = 4  # 单个客户端同时占用的名额上限
+UPSTREAM_QUEUE_TIMEOUT = 10  # 排队超过该秒数返回 503
+VIDEO_CLIENT_RATE = 10.0  # 每个客户端每秒可新开的视频代理请求数
+VIDEO_CLIENT_BURST = 40
+VIDEO_CLIENT_BYTES = 8 * 1024 * 1024  # 每个客户端的视频转发速率上限 (字节/秒)，超出时放慢而不是拒绝
+VIDEO_CLIENT_BYTES_BURST = 64 * 1024 * 1024
+VIDEO_STREAMS = 64  # 同时转发的视频流总数
+VIDEO_STREAMS_PER_CLIENT = 6  # 单个客户端同时转发的视频流上限；<video> 请求带不了 X-AnimeOne-Client 头，同一 NAT 后的设备共用
+VIDEO_QUEUE_TIMEOUT = 5
+SLOW_REQUEST_THRESHOLD = 1.0  # 超过该秒数的请求打印各阶段耗时 (上游、解析、OpenCC、锁等待、JSON)
+SLOW_REQUEST_KEEP = 50  # 保留最近多少条慢请求供 /api/debug/slow_requests 查询
+DEBUG_API = os.environ.get("ANIMEONE_DEBUG_API", "") == "1"  # 是否开放 /api/debug/* (慢请求记录、采样分析)
+PROFILE_MAX_SECONDS = 60  # 一次采样分析的最长时间 (秒)
+EPISODE_FETCH_WORKERS = 8  # 多页分类并发请求的线程数
+EPISODE_FULL_TTL = 3600  # 分类页缓存多久后整页重取 (秒)，期间只重取第一页
+SYNC_HISTORY = 1024  # 变更推送保留最近多少条事件用于断线补发
+SYNC_QUEUE_SIZE = 256  # 每个推送连接最多积压多少条事件，超出后重置该连接
+SYNC_KEEPALIVE = 15  # 推送连接空闲时发送心跳的间隔 (秒)
+SYNC_MAX_STREAMS = int(os.environ.get("ANIMEONE_SYNC_MAX_STREAMS", 0))  # 每个进程同时保持的推送连接上限，超出返回 503；0 表示按线程数自动取
+if not SYNC_MAX_STREAMS:
+    # gunicorn 的 gthread worker 线程数固定 (ANIMEONE_THREADS，与 gunicorn.conf.py 的默认值一致)，
+    # 每条推送连接一直占一个线程，留一半给普通请求；单进程服务器每个请求一个新线程，只需防止无限增长
+    SYNC_MAX_STREAMS = int(os.environ.get("ANIMEONE_THREADS", 32)) // 2 if multiproc.ENABLED else 64
+UPSTREAM_FAILURE_THRESHOLD = 5  # 同一上游主机连续失败多少次后熔断
+UPSTREAM_COOLDOWN = 10  # 熔断后首次探测前的等待 (秒)，探测失败则翻倍，最多 UPSTREAM_MAX_COOLDOWN
+UPSTREAM_MAX_COOLDOWN = 300
+UPSTREAM_MAX_INFLIGHT = 32  # 同一上游主机同时进行的请求上限
+CATALOGUE_STALE_AFTER = 3 * 3600  # 番剧列表超过多久未成功刷新时在响应中标记为过期 (秒)
+REFRESH_BASE_INTERVAL = 1800  # 番剧列表轮询的基础间隔 (秒)，按在播番剧数和历史变化时段伸缩
+REFRESH_MIN_INTERVAL = 300  # 刚发现变化或高峰时段的最短轮询间隔 (秒)
+REFRESH_MAX_INTERVAL = 7200  # 长时间没有变化时的最长轮询间隔 (秒)
+STATIC_RELOAD_INTERVAL = 7200  # 封面映射、季度表等本地静态数据的重新加载间隔 (秒)
+INFO_BACKFILL = os.environ.get("ANIMEONE_INFO_BACKFILL", "1") == "1"  # 是否在后台为缺封面 / 简介的番剧查询 bgm.tv（关闭后仍可手动运行 download_infos.py）
+INFO_BACKFILL_INTERVAL = 2.0  # 两次 bgm.tv 查询之间的最小间隔 (秒)
+INFO_BACKFILL_MAX_ATTEMPTS = 5  # 单个标题连续失败多少次后暂时放弃 (重试间隔从 1 分钟起翻倍)
+INFO_BACKFILL_RECHECK = 7 * 86400  # 处理过 (含查不到) 的标题多久后才会再次入队 (秒)
+CATALOGUE_BUNDLE_SPAN = 256  # 离线目录包每个分块包含的 id 区间大小
+CATALOGUE_BUNDLE_GRACE = 3600  # 不再被清单引用的分块保留多久 (秒)，供按旧清单下载的客户端使用
 
 # ================= 初始化 =================
 log = logging.getLogger('werkzeug')
@@ -32,146 +113,242 @@ if not os.path.exists(COVER_FOLDER):
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CACHE_FILE = os.path.join(BASE_DIR, "static", "json", "cover_map.json")
 DESC_FILE = os.path.join(BASE_DIR, "static", "json", "desc_map.json")
+FAVORITES_FILE = os.path.join(BASE_DIR, "static", "json", "favorites.json")
+PLAYBACK_FILE = os.path.join(BASE_DIR, "static", "json", "playback_history.json")
+SYNC_STATE_FILE = os.path.join(BASE_DIR, "static", "json", "sync_state.json")
+MANUAL_FIXES_FILE = os.path.join(BASE_DIR, "static", "json", "manual_fixes.json")
+BACKFILL_FILE = os.path.join(BASE_DIR, "static", "json", "backfill_queue.json")
+COVER_INDEX = CoverIndex(os.path.join(BASE_DIR, COVER_FOLDER))
 
-ANIME_DB = []
+ANIME_DB = []  # AnimeRecord 列表，按 id 倒序
 COVER_MAP = {}
 DESC_MAP = {}
 SCHEDULE_CACHE = {}
+SCHEDULE_INDEX = ScheduleIndex()  # 由 SCHEDULE_CACHE 构建，封面已解析
 FAVORITES_CACHE = []
 PLAYBACK_CACHE = {}
-ANIME_METADATA = {}  # 统一的内存元数据结构
+ANIME_METADATA = {}  # id -> AnimeRecord，与 ANIME_DB 共享同一批记录
+LIST_INDEX = ListIndex([])  # /api/list 的筛选位图和排序数组
+SEARCH_ENGINE = None  # search_engine.SearchEngine，与 LIST_INDEX 一起重建
+CATALOGUE_GENERATION = 0  # 目录数据 (番剧、封面、介绍、季度表) 每次变化加一，响应缓存据此失效
+BOOT_ID = uuid.uuid4().hex[:8]  # 本进程启动标识，区分重启前后从 0 开始的代号
+CATALOGUE_EPOCH = BOOT_ID  # 当前目录快照的发布者标识，与快照代号一起构成共享缓存的目录代号
 cc = OpenCC('t2s')
-DATA_LOCK = threading.Lock()
+traced_convert = tracing.wrap("opencc", cc.convert)  # 集数标题的简繁转换，耗时计入当前请求
+DATA_LOCK = metrics.TimedLock("data")
+SYNC_VERSIONS = sync_events.VersionStore(SYNC_STATE_FILE)  # 追番 / 播放记录各条目的变更序号
+CHANGE_FEED = sync_events.ChangeFeed(SYNC_VERSIONS, SYNC_HISTORY, SYNC_QUEUE_SIZE,
+                                     max_subscribers=SYNC_MAX_STREAMS)  # 变更推送
+
+# 多进程部署 (gunicorn.conf.py 设置 ANIMEONE_MULTIPROC=1)
+MULTIPROC = multiproc.ENABLED
+LEADER = None     # multiproc.LeaderElection，领导者负责定时刷新
+CATALOGUE = None  # multiproc.SnapshotStore，番剧目录快照
+BUNDLE = catalogue_bundle.BundleStore(os.path.join(multiproc.RUN_DIR, "bundle"),
+                                      chunk_span=CATALOGUE_BUNDLE_SPAN, grace=CATALOGUE_BUNDLE_GRACE)
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
     "Referer": "https://anime1.me/"
 }
-client = httpx.Client(headers=HEADERS, timeout=15.0, follow_redirects=True)
+client = httpx.Client(headers=HEADERS, timeout=15.0, follow_redirects=True, event_hooks=metrics.httpx_hooks())
+# anime1.me 各主机的熔断和自适应超时，上游宕机时请求立即失败而不是占着线程等超时
+UPSTREAM = upstream_health.UpstreamHealth(
+    failure_threshold=UPSTREAM_FAILURE_THRESHOLD, cooldown=UPSTREAM_COOLDOWN,
+    max_cooldown=UPSTREAM_MAX_COOLDOWN, max_timeout=15.0, max_inflight=UPSTREAM_MAX_INFLIGHT
+)
+CATALOGUE_UPDATED_AT = None  # 番剧列表最后一次成功刷新 (或确认没有变化) 的时间
+CATALOGUE_FETCH = refresh_scheduler.ConditionalFetch()  # animelist.json 的校验头和内容哈希
+TITLE_FIELDS = {}  # 繁体标题 -> (简体标题, 搜索字段)，刷新时标题没变的番剧不再重新转换和注音
+# 视频代理专用连接池
+proxy_client = httpx.Client(
+    timeout=30.0, verify=False, follow_redirects=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+    event_hooks=metrics.httpx_hooks()
+)
 
 # ================= 数据加载 =================
-def load_data():
-    global COVER_MAP, DESC_MAP, SCHEDULE_CACHE, FAVORITES_CACHE, PLAYBACK_CACHE
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                COVER_MAP = json.load(f)
-        except:
-            COVER_MAP = {}
-    
+def _schedule_poster(title, stored):
+    filename = COVER_MAP.get(title)
+    if filename and filename in COVER_INDEX:
+        return f"/covers/{filename}"
+    # 季度表里保存的旧地址，文件仍在时继续使用
+    if stored.startswith("/covers/") and stored[len("/covers/"):] in COVER_INDEX:
+        return stored
+    return ""
 
-    if os.path.exists(DESC_FILE):
-        try:
-            with open(DESC_FILE, 'r', encoding='utf-8') as f:
-                DESC_MAP = json.load(f)
-        except:
-            DESC_MAP = {}
-    
-    schedule_file = os.path.join(BASE_DIR, "static", "json", "schedule.json")
-    if os.path.exists(schedule_file):
-        try:
-            with open(schedule_file, 'r', encoding='utf-8') as f:
-                SCHEDULE_CACHE = json.load(f)
-        except:
-            SCHEDULE_CACHE = {}
-    else:
-        SCHEDULE_CACHE = {}
 
-    favorites_file = os.path.join(BASE_DIR, "static", "json", "favorites.json")
-    if os.path.exists(favorites_file):
-        try:
-            with open(favorites_file, 'r', encoding='utf-8') as f:
-                FAVORITES_CACHE = json.load(f)
-        except:
-            FAVORITES_CACHE = []
-    else:
-        FAVORITES_CACHE = []
+def rebuild_schedule_index():
+    global SCHEDULE_INDEX, CATALOGUE_GENERATION
+    SCHEDULE_INDEX = ScheduleIndex(SCHEDULE_CACHE, _schedule_poster)
+    CATALOGUE_GENERATION += 1
+
 
-    playback_file = os.path.join(BASE_DIR, "static", "json", "playback_history.json")
-    if os.path.exists(playback_file):
+def _read_json(path, default):
+    """读取 JSON 文件，不存在或损坏时返回 default；开启启动分析时单独计时"""
+    with boot_profile.phase(f"json {os.path.basename(path)}"):
+        if not os.path.exists(path):
+            return default
         try:
-            with open(playback_file, 'r', encoding='utf-8') as f:
-                PLAYBACK_CACHE = json.load(f)
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
         except:
-            PLAYBACK_CACHE = {}
-    else:
-        PLAYBACK_CACHE = {}
+            return default
+
+
+def load_data():
+    global COVER_MAP, DESC_MAP, SCHEDULE_CACHE, FAVORITES_CACHE, PLAYBACK_CACHE
+    COVER_MAP = _read_json(CACHE_FILE, {})
+    DESC_MAP = _read_json(DESC_FILE, {})
+    SCHEDULE_CACHE = _read_json(os.path.join(BASE_DIR, "static", "json", "schedule.json"), {})
+    FAVORITES_CACHE = _read_json(FAVORITES_FILE, [])
+    PLAYBACK_CACHE = _read_json(PLAYBACK_FILE, {})
+    # 旧记录是服务器本地时间，统一成 UTC，下次写入时落盘
+    sync_events.normalize_timestamps(PLAYBACK_CACHE)
 
 load_data()
+with boot_profile.phase("cover index scan"):
+    COVER_INDEX.scan()
+with boot_profile.phase("schedule index"):
+    rebuild_schedule_index()
+
+
+def _cover_file(title):
+    """cover_map 中的封面路径，文件不存在时返回 None"""
+    filename = COVER_MAP.get(title)
+    if filename and filename in COVER_INDEX:
+        return filename
+    return None
 
 
 def build_anime_metadata():
-    """构建统一的内存元数据结构"""
-    global ANIME_METADATA
+    """在 ANIME_DB 的记录上填充封面、追番和播放记录，并重建 id 索引"""
+    global ANIME_METADATA, LIST_INDEX, SEARCH_ENGINE, CATALOGUE_GENERATION
     
     print("[INFO] 构建统一元数据...", flush=True)
-    new_metadata = {}
+    records = ANIME_DB
+    dangling = 0
     
-    for anime in ANIME_DB:
-        anime_id = anime['id']
-        title = anime['title']
-        
-        # 基础信息
-        metadata = {
-            'id': anime_id,
-            'title': title,
-            'status': anime.get('status', ''),  # 已在 update_database 中转换为简体
-            'year': anime.get('year', ''),
-            'season': anime.get('season', ''),
-            'cover': None,
-            'description': None,
-            'is_favorite': False,
-            'playback': None
-        }
-        
-        # 封面
-        if title in COVER_MAP and COVER_MAP[title]:
-            metadata['cover'] = f"/covers/{COVER_MAP[title]}"
-        
-        # 介绍
-        if title in DESC_MAP:
-            metadata['description'] = DESC_MAP[title]
-        
-        # 追番状态
-        if anime_id in FAVORITES_CACHE:
-            metadata['is_favorite'] = True
-        
-        # 播放记录
-        if anime_id in PLAYBACK_CACHE:
-            record = PLAYBACK_CACHE[anime_id]
-            metadata['playback'] = {
-                'episode_title': record.get('episode_title', ''),
-                'position': record.get('playback_position', 0),
-                'last_played': record.get('timestamp', '')
-            }
-        
-        new_metadata[anime_id] = metadata
+    for record in records:
+        # 封面（映射里有但文件不存在的不输出，避免客户端拿到 404 的地址）
+        record.cover_file = _cover_file(record.title)
+        if record.cover_file is None and COVER_MAP.get(record.title):
+            dangling += 1
     
-    ANIME_METADATA = new_metadata
+    # 追番 / 播放记录的读取、索引构建和替换都在 DATA_LOCK 内：
+    # 期间的写入要么已在快照里，要么等替换完成后写到新索引上，不会丢失
+    with DATA_LOCK:
+        favorites = set(FAVORITES_CACHE)
+        for record in records:
+            record.is_favorite = record.id in favorites
+            record.playback_record = PLAYBACK_CACHE.get(record.id)
+        index = ListIndex(records, FAVORITES_CACHE, PLAYBACK_CACHE)
+        engine = search_engine.SearchEngine(
+            index, to_pinyin=get_full_pinyin, convert=cc.convert, previous=SEARCH_ENGINE
+        )
+        ANIME_METADATA = {record.id: record for record in records}
+        LIST_INDEX = index
+        SEARCH_ENGINE = engine
+        CATALOGUE_GENERATION += 1
+    if dangling:
+        print(f"[WARN] {dangling} 部番剧的封面文件缺失，已忽略映射", flush=True)
     print(f"[SUCCESS] 元数据构建完成: {len(ANIME_METADATA)} 部番剧", flush=True)
 
 
+def refresh_metadata_covers():
+    """封面目录变化后只刷新元数据中的封面地址"""
+    for record in list(ANIME_METADATA.values()):
+        record.cover_file = _cover_file(record.title)
+    rebuild_schedule_index()
+
+
+COVER_INDEX.on_change = refresh_metadata_covers
+
+
+def reload_favorites():
+    """其他进程修改了 favorites.json 后重新加载并同步元数据"""
+    global FAVORITES_CACHE
+    try:
+        with open(FAVORITES_FILE, 'r', encoding='utf-8') as f:
+            FAVORITES_CACHE = json.load(f)
+    except (OSError, ValueError):
+        return
+    favorites = set(FAVORITES_CACHE)
+    for anime_id, record in ANIME_METADATA.items():
+        record.is_favorite = anime_id in favorites
+    LIST_INDEX.reset_user_state(FAVORITES_CACHE, PLAYBACK_CACHE)
+
+
+def reload_playback():
+    """其他进程修改了 playback_history.json 后重新加载并同步元数据"""
+    global PLAYBACK_CACHE
+    try:
+        with open(PLAYBACK_FILE, 'r', encoding='utf-8') as f:
+            PLAYBACK_CACHE = json.load(f)
+    except (OSError, ValueError):
+        return
+    sync_events.normalize_timestamps(PLAYBACK_CACHE)
+    for anime_id, record in ANIME_METADATA.items():
+        record.playback_record = PLAYBACK_CACHE.get(anime_id)
+    LIST_INDEX.reset_user_state(FAVORITES_CACHE, PLAYBACK_CACHE)
+
+
+# 用户状态写入：多进程模式下跨进程串行化，单进程时不做额外处理
+USER_STATE = multiproc.UserStateSync(multiproc.RUN_DIR, {
+    "favorites": (FAVORITES_FILE, reload_favorites),
+    "playback": (PLAYBACK_FILE, reload_playback),
+}, enabled=MULTIPROC)
+
+
 # ================= 工具函数 =================
 def get_pinyin_initials(text):
+    # pypinyin 导入要加载词典 (约 0.2 秒)，只有刷新番剧列表和汉字搜索用到，延迟到第一次调用
+    from pypinyin import pinyin, Style
     initials = pinyin(text, style=Style.FIRST_LETTER, errors='default')
     return "".join([i[0] for i in initials]).lower()
 
+def get_full_pinyin(text):
+    from pypinyin import lazy_pinyin
+    return "".join(lazy_pinyin(text, errors='default')).lower()
+
 def get_cover_smart(title):
-    if title in COVER_MAP and COVER_MAP[title]:
-        filename = COVER_MAP[title]
-        if os.path.exists(os.path.join(COVER_FOLDER, filename)):
-            return f"/covers/{filename}"
+    filename = COVER_MAP.get(title)
+    if filename and filename in COVER_INDEX:
+        return f"/covers/{filename}"
     return ""
 
 
-def update_database():
-    global ANIME_DB
+def ensure_database():
+    """番剧列表为空时立即拉取；多进程模式下只有领导者拉取，其他进程等待快照"""
+    if ANIME_DB:
+        return
+    if LEADER is not None and not LEADER.is_leader:
+        return
+    update_database()
+
+
+def update_database(conditional=False):
+    """
+    拉取番剧列表并重建目录。conditional 为 True 时带上次的校验头请求，
+    内容没有变化 (304 或哈希相同) 时不重建。
+    返回是否有变化，失败时返回 None。
+    """
+    global ANIME_DB, CATALOGUE_UPDATED_AT, TITLE_FIELDS
     print("[INFO] 更新番剧列表...", flush=True)
     try:
         timestamp = int(time.time() * 1000)
-        res = client.get(f"https://anime1.me/animelist.json?_={timestamp}")
-        raw_data = res.json()
+        # 完整列表本身较大，超时下限保持原来的 15 秒
+        res = UPSTREAM.request(client, "GET", f"{ANIME1_BASE}/animelist.json?_={timestamp}", min_timeout=15.0,
+                               headers=CATALOGUE_FETCH.headers() if conditional else None)
+        body = CATALOGUE_FETCH.check(res)
+        if body is None and ANIME_DB:
+            CATALOGUE_UPDATED_AT = time.time()
+            print("[INFO] 番剧列表没有变化", flush=True)
+            return False
+        raw_data = json.loads(body if body is not None else res.content)
         new_db = []
+        title_fields = {}
+        statuses = {}
         
         for item in raw_data:
             raw_id, raw_title = item[0], item[1]
@@ -193,25 +370,50 @@ def update_database():
                 clean_title_tc = raw_title
             
             clean_title_tc = html.unescape(clean_title_tc)
-            title_sc = cc.convert(clean_title_tc)
+            fields = title_fields.get(clean_title_tc) or TITLE_FIELDS.get(clean_title_tc)
+            if fields is None:
+                title_sc = cc.convert(clean_title_tc)
+                fields = (title_sc, search_engine.build_search_field(
+                    title_sc, clean_title_tc, get_pinyin_initials(title_sc), get_full_pinyin(title_sc)
+                ))
+            title_fields[clean_title_tc] = fields
+            status = statuses.get(raw_status)
+            if status is None:
+                status = statuses[raw_status] = cc.convert(raw_status)  # 🔥 修复：在存储时就转换为简体
             
-            new_db.append({
-                "id": valid_id,
-                "title": title_sc,
-                "status": cc.convert(raw_status),  # 🔥 修复：在存储时就转换为简体
-                "year": str(item[3]),
-                "season": item[4],
-                "_search": f"{title_sc}|{clean_title_tc}|{get_pinyin_initials(title_sc)}".lower()
-            })
+            new_db.append(AnimeRecord(
+                valid_id,
+                fields[0],
+                status,
+                str(item[3]),
+                item[4],
+                fields[1]
+            ))
         
-        new_db.sort(key=lambda x: int(x['id']), reverse=True)
+        new_db.sort(key=lambda x: int(x.id), reverse=True)
+        invalidate_changed_episodes(ANIME_DB, new_db)
         ANIME_DB = new_db
+        TITLE_FIELDS = title_fields
+        CATALOGUE_UPDATED_AT = time.time()
         print(f"[SUCCESS] 数据库更新完毕: {len(ANIME_DB)} 条", flush=True)
         
         # 重建元数据
         build_anime_metadata()
+        CATALOGUE_FETCH.commit(res.content)
+        return True
     except Exception as e:
+        # 失败时保留上一次的列表继续服务
         print(f"[ERROR] 更新失败: {e}", flush=True)
+        return None
+
+
+def invalidate_changed_episodes(old_db, new_db):
+    """状态字符串变化 (通常是集数更新) 的番剧，丢弃其集数缓存"""
+    changed = refresh_scheduler.changed_statuses(old_db, new_db)
+    for anime_id in changed:
+        EPISODE_LOADER.invalidate(anime_id)
+    if changed:
+        print(f"[INFO] {len(changed)} 部番剧状态变化，已清除其集数缓存", flush=True)
 
 
 def resolve_video_token(token):
@@ -219,15 +421,16 @@ def resolve_video_token(token):
         if not token:
             return None, "缺少播放令牌"
 
-        with httpx.Client(headers=HEADERS, timeout=15.0, follow_redirects=True) as temp_client:
-            api_res = temp_client.post(
-                "https://v.anime1.me/api",
-                data={"d": urllib.parse.unquote(token)},
-                headers={
-                    "Content-Type": "application/x-www-form-urlencoded", 
-                    "Referer": "https://anime1.me/" 
-                }
-            )
+        with httpx.Client(headers=HEADERS, timeout=15.0, follow_redirects=True, event_hooks=metrics.httpx_hooks()) as temp_client:
+            with tracing.span("upstream"):
+                api_res = UPSTREAM.request(
+                    temp_client, "POST", ANIME1_VIDEO_API,
+                    data={"d": urllib.parse.unquote(token)},
+                    headers={
+                        "Content-Type": "application/x-www-form-urlencoded", 
+                        "Referer": "https://anime1.me/" 
+                    }
+                )
             
             if api_res.status_code == 200:
                 data = api_res.json()
@@ -247,6 +450,272 @@ def resolve_video_token(token):
         return None, str(e)
 
 
+# ================= 监控指标 =================
+SLOW_LOG = tracing.SlowLog(SLOW_REQUEST_THRESHOLD, SLOW_REQUEST_KEEP)
+SLOW_REQUESTS = metrics.Counter("animeone_slow_requests_total", "超过慢请求阈值的请求数（按路由）")
+_SECRET_ARGS = frozenset(("token", "u", "c"))  # 播放令牌、视频地址和 Cookie 不写进日志
+
+
+def _trace_label():
+    args = "&".join(f"{k}={'…' if k in _SECRET_ARGS else v}" for k, v in request.args.items(multi=True))
+    return f"{request.method} {request.path}" + (f"?{args}" if args else "")
+
+
+@app.before_request
+def _metrics_start():
+    g.metrics_t0 = time.perf_counter()
+    if request.endpoint != "api_debug_profile":  # 采样本身要持续数秒，不算慢请求
+        tracing.start(request.endpoint or "unmatched")
+
+
+@app.after_request
+def _metrics_finish(response):
+    t0 = g.pop('metrics_t0', None)
+    if t0 is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - t0, route=route)
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+        trace = tracing.current()
+        if trace is not None and SLOW_LOG.record(trace, _trace_label(), response.status_code):
+            SLOW_REQUESTS.inc(route=route)
+    return response
+
+
+@app.teardown_request
+def _trace_finish(exc):
+    tracing.finish()
+
+
+# 读取番剧目录的接口：上游熔断或目录长时间未刷新时标记数据可能过期
+_CATALOGUE_ENDPOINTS = frozenset((
+    "api_list", "api_meta_batch", "api_season_schedule", "api_schedule_today", "api_schedule_anime",
+))
+
+
+def catalogue_age():
+    """目录距上次成功刷新的秒数，从未刷新时返回 None"""
+    return None if CATALOGUE_UPDATED_AT is None else time.time() - CATALOGUE_UPDATED_AT
+
+
+@app.after_request
+def _mark_stale_catalogue(response):
+    if request.endpoint in _CATALOGUE_ENDPOINTS and CATALOGUE_UPDATED_AT is not None:
+        age = catalogue_age()
+        if age > CATALOGUE_STALE_AFTER or UPSTREAM.is_open(ANIME1_BASE):
+            response.headers['X-AnimeOne-Stale'] = str(int(age))
+    return response
+
+
+def _memory_sizes():
+    return {
+        (("structure", "anime_db"),): len(ANIME_DB),
+        (("structure", "anime_metadata"),): len(ANIME_METADATA),
+        (("structure", "cover_map"),): len(COVER_MAP),
+        (("structure", "cover_index"),): len(COVER_INDEX),
+        (("structure", "desc_map"),): len(DESC_MAP),
+        (("structure", "schedule_seasons"),): len(SCHEDULE_INDEX),
+        (("structure", "schedule_anime"),): len(SCHEDULE_INDEX.by_anime),
+        (("structure", "favorites"),): len(FAVORITES_CACHE),
+        (("structure", "playback"),): len(PLAYBACK_CACHE),
+        (("structure", "proxy_streams"),): proxy_stream.REGISTRY.active_count(),
+        (("structure", "sync_subscribers"),): CHANGE_FEED.subscriber_count,
+    }
+
+
+def _proxy_stream_stats():
+    return {(("event", k),): v for k, v in proxy_stream.STATS.items()}
+
+
+metrics.Gauge("animeone_memory_items", "内存数据结构的条目数", callback=_memory_sizes)
+metrics.Gauge("animeone_proxy_stream_events", "视频代理共享流累计事件数（上游打开/复用/字节）", callback=_proxy_stream_stats)
+metrics.Gauge(
+    "animeone_episode_loader_events", "分类页加载累计事件数（请求页数/只取第一页拼接/整页加载）",
+    callback=lambda: {(("event", k),): v for k, v in EPISODE_LOADER.stats.items()}
+)
+metrics.Gauge(
+    "animeone_upstream_state", "上游熔断状态（0 正常 / 1 半开探测 / 2 熔断）",
+    callback=lambda: {(("host", h),): {"closed": 0, "half_open": 1, "open": 2}[st]
+                      for h, (st, _, _) in UPSTREAM.states().items()}
+)
+metrics.Gauge(
+    "animeone_upstream_timeout_seconds", "按观测延迟自适应的上游请求超时",
+    callback=lambda: {(("host", h),): rto for h, (_, rto, _) in UPSTREAM.states().items()}
+)
+metrics.Gauge(
+    "animeone_upstream_breaker_events", "上游请求累计结果（成功/失败/被熔断拒绝/熔断次数）",
+    callback=lambda: {(("host", h), ("event", k)): v for h, st in UPSTREAM.stats().items() for k, v in st.items()}
+)
+metrics.Gauge(
+    "animeone_catalogue_polls", "番剧列表轮询累计结果（轮询/304/内容未变/有变化）",
+    callback=lambda: {(("result", k),): v for k, v in CATALOGUE_FETCH.stats.items()}
+)
+metrics.Gauge("animeone_refresh_next_delay_seconds", "距下一次番剧列表轮询的秒数",
+              callback=lambda: REFRESH.next_delay)
+def _backfill_stats():
+    if BACKFILL is None:
+        return {}
+    stats = {(("event", k),): v for k, v in BACKFILL.stats.items()}
+    stats[(("event", "pending"),)] = len(BACKFILL)
+    return stats
+
+
+metrics.Gauge("animeone_info_backfill", "封面/简介补全队列（待处理数与累计入队/完成/重试/放弃）",
+              callback=_backfill_stats)
+metrics.Gauge(
+    "animeone_catalogue_bundle", "离线目录包累计事件数（发布/内容未变/写入分块）",
+    callback=lambda: {(("event", k),): v for k, v in BUNDLE.stats.items()}
+)
+metrics.Gauge(
+    "animeone_sync_events", "变更推送累计事件数（发布/连接溢出重置）",
+    callback=lambda: {(("event", k),): v for k, v in CHANGE_FEED.stats.items()}
+)
+
+
+def _count_proxy_bytes(body):
+    for chunk in body:
+        metrics.PROXY_BYTES.inc(len(chunk))
+        yield chunk
+
+
+@app.route('/metrics')
+def api_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+PROFILE_LOCK = threading.Lock()
+
+
+@app.route('/api/debug/slow_requests')
+def api_debug_slow_requests():
+    """最近的慢请求及其各阶段耗时 (需 ANIMEONE_DEBUG_API=1)"""
+    if not DEBUG_API:
+        return jsonify({"code": 404, "msg": "未开启调试接口"}), 404
+    return jsonify({"code": 200, "threshold_ms": SLOW_REQUEST_THRESHOLD * 1000, "data": list(SLOW_LOG.recent)})
+
+
+@app.route('/api/debug/profile')
+def api_debug_profile():
+    """
+    对运行中的服务采样 seconds 秒，返回折叠栈文本 (flamegraph.pl / speedscope 可直接打开)。
+    interval 为采样间隔 (毫秒)，idle=1 时保留停在等待上的线程。需 ANIMEONE_DEBUG_API=1，同一时间只允许一个。
+    """
+    if not DEBUG_API:
+        return jsonify({"code": 404, "msg": "未开启调试接口"}), 404
+    try:
+        seconds = min(PROFILE_MAX_SECONDS, max(0.1, float(request.args.get('seconds', 10))))
+        interval = min(100.0, max(1.0, float(request.args.get('interval', 5)))) / 1000
+    except ValueError:
+        return jsonify({"code": 400, "msg": "seconds / interval 必须是数字"})
+    if not PROFILE_LOCK.acquire(blocking=False):
+        return jsonify({"code": 409, "msg": "已有采样正在进行"}), 409
+    try:
+        counts = tracing.sample_stacks(seconds, interval, include_idle=_bool_arg('idle') is True)
+    finally:
+        PROFILE_LOCK.release()
+    return Response(tracing.collapsed(counts), mimetype='text/plain; charset=utf-8')
+
+
+# ================= 响应缓存 =================
+def _catalogue_token():
+    # 共享缓存时用目录快照代号，各进程一致；本地缓存用本进程的代号，封面变化也能立即反映。
+    # 代号在重启后 (或 run/ 被清空后) 会从头开始，带上发布者的启动标识，Redis 里的旧条目不会被误用
+    if RESPONSE_CACHE_REDIS and CATALOGUE is not None:
+        return f"{CATALOGUE_EPOCH}:{CATALOGUE.generation}"
+    if RESPONSE_CACHE_REDIS:
+        return f"{BOOT_ID}:{CATALOGUE_GENERATION}"
+    return CATALOGUE_GENERATION
+
+
+def _before_cache_miss(depends):
+    # 变更日志可能先于用户状态文件被本进程读到，计算前先加载其他进程的写入
+    if MULTIPROC and ("favorites" in depends or "playback" in depends):
+        with DATA_LOCK:
+            USER_STATE.refresh()
+
+
+def _make_response_cache():
+    backend = None
+    if RESPONSE_CACHE_REDIS:
+        try:
+            backend = response_cache.RedisBackend(RESPONSE_CACHE_REDIS, ttl=RESPONSE_CACHE_TTL)
+            print(f"[INFO] 响应缓存使用 Redis: {RESPONSE_CACHE_REDIS}", flush=True)
+        except ImportError:
+            print("[WARN] 未安装 redis 包，响应缓存改用进程内缓存", flush=True)
+    if backend is None:
+        backend = response_cache.LocalBackend(max(RESPONSE_CACHE_BYTES, 1))
+    return response_cache.ResponseCache(backend, {
+        "catalogue": _catalogue_token,
+        # 追番和播放记录分开计代号：播放进度每隔几秒保存一次，只让读取播放记录的响应失效
+        "favorites": lambda: CHANGE_FEED.position("favorite"),
+        "playback": lambda: CHANGE_FEED.position("playback"),
+        "day": lambda: time.strftime("%Y-%m-%d"),
+    }, before_miss=_before_cache_miss, enabled=RESPONSE_CACHE_BYTES > 0)
+
+
+RESPONSE_CACHE = _make_response_cache()
+metrics.Gauge("animeone_response_cache", "响应缓存状态（命中/未命中/条目数/字节数/淘汰数/命中率）",
+              callback=lambda: {(("stat", k),): v for k, v in RESPONSE_CACHE.snapshot().items()})
+
+
+# ================= 限速与公平调度 =================
+UPSTREAM_BUCKETS = rate_limit.ClientBuckets("upstream", UPSTREAM_CLIENT_RATE, UPSTREAM_CLIENT_BURST)
+UPSTREAM_SCHEDULER = rate_limit.FairScheduler("upstream", UPSTREAM_SLOTS, UPSTREAM_SLOTS_PER_CLIENT)
+VIDEO_BUCKETS = rate_limit.ClientBuckets("video", VIDEO_CLIENT_RATE, VIDEO_CLIENT_BURST)
+VIDEO_BYTES = rate_limit.ClientBuckets("video_bytes", VIDEO_CLIENT_BYTES, VIDEO_CLIENT_BYTES_BURST)
+VIDEO_SCHEDULER = rate_limit.FairScheduler("video", VIDEO_STREAMS, VIDEO_STREAMS_PER_CLIENT)
+
+
+def client_key():
+    """限速按 IP 区分客户端，同一 IP 后的多台设备可用 X-AnimeOne-Client 头区分"""
+    device = request.headers.get('X-AnimeOne-Client', '')[:64]
+    addr = request.remote_addr or "-"
+    return f"{addr}/{device}" if device else addr
+
+
+def _throttled_response(e):
+    status = 429 if e.reason == "rate" else 503
+    response = jsonify({"code": status, "msg": str(e)})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return response
+
+
+def upstream_limited(view):
+    """会请求上游的元数据接口：先扣客户端的请求预算，再排队取得并发名额"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not RATE_LIMIT:
+            return view(*args, **kwargs)
+        client = client_key()
+        try:
+            UPSTREAM_BUCKETS.check(client)
+            with tracing.span("queue"):
+                UPSTREAM_SCHEDULER.acquire(client, UPSTREAM_QUEUE_TIMEOUT)
+        except rate_limit.Throttled as e:
+            return _throttled_response(e)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            UPSTREAM_SCHEDULER.release(client)
+    return wrapper
+
+
+def _rate_limit_stats():
+    stats = {}
+    for scheduler in (UPSTREAM_SCHEDULER, VIDEO_SCHEDULER):
+        for k, v in scheduler.snapshot().items():
+            stats[(("budget", scheduler.name), ("stat", k))] = v
+    for buckets in (UPSTREAM_BUCKETS, VIDEO_BUCKETS, VIDEO_BYTES):
+        for k, v in buckets.stats.items():
+            stats[(("budget", buckets.name), ("stat", k))] = v
+        stats[(("budget", buckets.name), ("stat", "clients"))] = len(buckets)
+    return stats
+
+
+metrics.Gauge("animeone_rate_limit", "限速与公平调度状态（占用名额/排队数/放行/限速次数，按预算区分）",
+              callback=_rate_limit_stats)
+
+
 # ================= Flask 路由 =================
 
 @app.route('/')
@@ -256,68 +725,249 @@ def index():
 
 @app.route('/covers/<path:filename>')
 def serve_cover(filename):
-    response = send_from_directory(COVER_FOLDER, filename)
+    # 内容寻址的封面直接以内容哈希作为强 ETag
+    digest = hash_from_relpath(filename)
+    if digest and digest in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = send_from_directory(COVER_FOLDER, filename)
+    if digest:
+        response.set_etag(digest)
     response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
     return response
 
 
+def _bool_arg(name):
+    value = request.args.get(name)
+    if value in ("1", "true"):
+        return True
+    if value in ("0", "false"):
+        return False
+    return None
+
+
+# 游标 = base64url(JSON [排序字段, 是否倒序, 上一页最后一条的排序键])，对客户端不透明
+_CURSOR_KEY_LEN = {"id": (1,), "title": (2,), "year": (2,), "last_played": (2, 3), "favorite": (2,),
+                   "relevance": (1,)}
+
+
+def _encode_cursor(sort, reverse, key):
+    raw = json.dumps([sort, int(reverse), key], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    """返回 (sort, reverse, key)，格式不对时抛 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort, reverse, key = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError("cursor 无效")
+    if sort not in _CURSOR_KEY_LEN or not isinstance(key, list) or len(key) not in _CURSOR_KEY_LEN[sort]:
+        raise ValueError("cursor 无效")
+    if not all(isinstance(k, str) for k in key):
+        raise ValueError("cursor 无效")
+    id_part = key[-1]
+    if not id_part.isdigit():
+        raise ValueError("cursor 无效")
+    return sort, bool(reverse), key
+
+
+def _json_list_response(items, count, extra=None):
+    """
+    {"code": 200, "data": [...], **extra}
+    条数超过 STREAM_JSON_THRESHOLD 时逐条序列化并流式发送，不在内存里拼出整个响应体
+    """
+    body = {"code": 200}
+    if extra:
+        body.update(extra)
+    if count <= STREAM_JSON_THRESHOLD:
+        body["data"] = list(items)
+        return jsonify(body)
+    dumps = app.json.dumps
+    head = dumps(body)[:-1]
+
+    def generate():
+        yield head + ', "data": ['
+        first = True
+        for item in items:
+            if first:
+                first = False
+                yield dumps(item)
+            else:
+                yield ', ' + dumps(item)
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
 @app.route('/api/list')
+@RESPONSE_CACHE.cached("catalogue", "favorites", "playback")
 def api_list():
-    if not ANIME_DB:
-        update_database()
+    """
+    番剧列表。可选参数：
+      q        关键字（标题 / 繁体标题 / 拼音首字母 / 全拼，容忍少量错字）
+      year, season, status   筛选，多个值用逗号分隔；status 取 连载中 / 完结 / 剧场版 / OVA
+      favorite, played       1 / 0，只看追番 / 有播放记录（或相反）
+      sort     id / title / year / last_played / favorite / relevance，order 为 asc / desc；
+               带 q 且不指定 sort 时按相关度 (relevance) 排序；last_played / favorite 的 asc
+               把最早播放 / 最早追番的排在前面，其余番剧随后按 id 升序
+      size     每页条数，上限 LIST_PAGE_SIZE_MAX
+      facets   为 1 时附带各筛选值的计数
+      cursor   上一页返回的 next_cursor；带上时忽略 page / sort / order，筛选参数需与上一页相同
+    第一页和游标翻页的响应带 next_cursor（没有更多时为 null）。
+    """
+    ensure_database()
+    # 排名和位图必须来自同一次重建：搜索引擎持有构建它的列表索引
+    engine = SEARCH_ENGINE
+    index = engine.index if engine is not None else LIST_INDEX
     
-    page = int(request.args.get('page', 1))
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        size = min(LIST_PAGE_SIZE_MAX, max(1, int(request.args.get('size', LIST_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({"code": 400, "msg": "page / size 必须是整数"})
     keyword = request.args.get('q', '').strip().lower()
+    cursor = request.args.get('cursor')
+    after = None
+    if cursor:
+        try:
+            sort, reverse, after = _decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": str(e)})
+    else:
+        sort = request.args.get('sort') or ('relevance' if keyword else 'id')
+        if sort not in SORT_KEYS and not (sort == 'relevance' and keyword):
+            return jsonify({"code": 400, "msg": f"sort 只能是 {', '.join(SORT_KEYS)}"})
+        order = request.args.get('order')
+        reverse = (order == 'desc') if sort == 'title' else (order == 'asc')
     
+    keyword_mask = ranked = None
     if keyword:
-        filtered = [x for x in ANIME_DB if keyword in x['_search']]
-    else:
-        filtered = ANIME_DB
+        ranked = engine.search(keyword)
+        keyword_mask = mask_from_positions(ranked, index.size)
+    filters = {dim: [v for v in request.args.get(dim, '').split(',') if v] for dim in FACET_DIMS}
+    masks = index.filter_masks(filters, _bool_arg('favorite'), _bool_arg('played'), keyword_mask)
     
-    size = 24
-    start = (page - 1) * size
-    end = start + size
-    page_data = filtered[start:end]
+    mask = index.combine(masks)
+    next_cursor = None
+    if sort == 'relevance':
+        # 相关度取决于查询本身，游标里记录的是偏移量
+        has = bit_tester(mask)
+        matched = [p for p in ranked if has(p)]
+        if reverse:
+            matched.reverse()
+        offset = int(after[0]) if after else (page - 1) * size
+        rows, total = matched[offset:offset + size], len(matched)
+        if offset + size < total:
+            next_cursor = _encode_cursor(sort, reverse, [str(offset + size)])
+    elif cursor or page == 1:
+        # 按排序键定位，目录刷新后行号变化也不会重复或漏掉
+        rows, next_key = index.keyset_page(mask, sort, reverse, after, size)
+        total = popcount(mask)
+        if next_key is not None:
+            next_cursor = _encode_cursor(sort, reverse, next_key)
+    else:
+        rows, total = index.page(mask, sort, reverse, (page - 1) * size, size)
+    page_data = [index.records[i] for i in rows]
     
     result = []
-    for item in page_data:
-        anime_id = item['id']
+    for record in page_data:
+        c = {
+            'id': record.id,
+            'title': record.title,
+            'status': record.status,
+            'year': record.year,
+            'season': record.season,
+            'poster': record.cover or "",
+            'is_favorite': record.is_favorite,
+        }
         
-        # 🔥 优化：从 ANIME_METADATA 获取完整信息
-        if anime_id in ANIME_METADATA:
-            metadata = ANIME_METADATA[anime_id]
-            c = {
-                'id': anime_id,
-                'title': metadata['title'],
-                'status': metadata['status'],
-                'year': metadata['year'],
-                'season': metadata['season'],
-                'poster': metadata['cover'] or "",
-                'is_favorite': metadata['is_favorite'],
+        # 添加播放记录（如果有）
+        playback = record.playback
+        if playback:
+            c['playback'] = {
+                'episode_title': playback['episode_title'],
+                'position': playback['position'],
             }
-            
-            # 添加播放记录（如果有）
-            if metadata['playback']:
-                c['playback'] = {
-                    'episode_title': metadata['playback']['episode_title'],
-                    'position': metadata['playback']['position'],
-                }
-            else:
-                c['playback'] = None
         else:
-            # 降级处理：如果 ANIME_METADATA 中没有，使用原有逻辑
-            c = item.copy()
-            del c['_search']
-            c['poster'] = ""
-            c['status'] = cc.convert(c['status'])
-            if item['title'] in COVER_MAP:
-                c['poster'] = f"/covers/{COVER_MAP[item['title']]}" if COVER_MAP[item['title']] else ""
-            c['is_favorite'] = False
             c['playback'] = None
         
         result.append(c)
     
-    return jsonify({"code": 200, "data": result, "total": len(filtered)})
+    body = {"code": 200, "data": result, "total": total}
+    if cursor or page == 1 or sort == 'relevance':
+        body["next_cursor"] = next_cursor
+    if request.args.get('facets') == '1':
+        body["facets"] = index.facet_counts(masks)
+    return jsonify(body)
+
+
+@app.route('/api/suggest')
+@RESPONSE_CACHE.cached("catalogue")
+def api_suggest():
+    """
+    搜索框输入联想：标题 / 繁体标题 / 拼音首字母 / 全拼以 q 开头的番剧，只返回 id 和标题。
+    结果只随番剧目录变化，允许浏览器缓存，并带 ETag 支持 304。
+    """
+    ensure_database()
+    keyword = request.args.get('q', '').strip()
+    try:
+        limit = min(SUGGEST_LIMIT_MAX, max(1, int(request.args.get('limit', SUGGEST_LIMIT))))
+    except ValueError:
+        return jsonify({"code": 400, "msg": "limit 必须是整数"})
+    engine = SEARCH_ENGINE
+    records = engine.index.records
+    data = [{'id': records[i].id, 'title': records[i].title} for i in engine.suggest(keyword, limit)]
+    response = jsonify({"code": 200, "data": data})
+    response.set_etag(hashlib.md5(response.get_data()).hexdigest())
+    response.headers['Cache-Control'] = f'public, max-age={SUGGEST_MAX_AGE}'
+    return response.make_conditional(request)
+
+
+@app.route('/api/catalogue/manifest')
+def api_catalogue_manifest():
+    """
+    离线目录包清单：客户端保存上次的清单，只下载哈希变化了的分块。
+    ETag 为目录包版本号，内容没有变化时返回 304。
+    """
+    manifest = BUNDLE.manifest()
+    if manifest is None:
+        ensure_database()
+        publish_bundle()
+        manifest = BUNDLE.manifest()
+    if manifest is None:
+        return jsonify({"code": 503, "msg": "目录包尚未生成"})
+    if manifest['version'] in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify({"code": 200, "data": manifest})
+    response.set_etag(manifest['version'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/catalogue/chunks/<name>')
+def api_catalogue_chunk(name):
+    """目录包分块 (JSON Lines)，按内容哈希命名，永久缓存；客户端不接受 gzip 时解压后返回"""
+    path = BUNDLE.chunk_path(name)
+    if path is None:
+        return jsonify({"code": 404, "msg": "分块不存在或已过期"}), 404
+    digest = name[:-len(catalogue_bundle.SUFFIX)]
+    if digest in request.if_none_match:
+        response = Response(status=304)
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if 'gzip' in request.accept_encodings:
+            response = Response(data, mimetype='application/x-ndjson')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(gzip.decompress(data), mimetype='application/x-ndjson')
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/api/get_cover_lazy')
@@ -327,60 +977,102 @@ def api_get_cover_lazy():
     return jsonify({"url": url})
 
 
+@app.route('/api/meta/batch', methods=['GET', 'POST'])
+@RESPONSE_CACHE.cached("catalogue", "favorites", "playback")
+def api_meta_batch():
+    """批量获取番剧卡片信息（封面、状态、追番、播放记录，可选介绍），全部来自内存"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"code": 400, "msg": "请求体必须是 JSON 对象"})
+        ids = data.get('ids') or []
+        if not isinstance(ids, list):
+            return jsonify({"code": 400, "msg": "ids 必须是数组"})
+        with_desc = bool(data.get('desc'))
+    else:
+        ids = [x for x in request.args.get('ids', '').split(',') if x]
+        with_desc = request.args.get('desc') == '1'
+    
+    if len(ids) > BATCH_META_LIMIT:
+        return jsonify({"code": 400, "msg": f"一次最多查询 {BATCH_META_LIMIT} 部番剧"})
+    
+    favorites = set(FAVORITES_CACHE)
+    result = {}
+    for anime_id in ids:
+        anime_id = str(anime_id)
+        metadata = ANIME_METADATA.get(anime_id)
+        record = PLAYBACK_CACHE.get(anime_id)
+        
+        item = {
+            'id': anime_id,
+            'title': metadata['title'] if metadata else '',
+            'status': metadata['status'] if metadata else '',
+            'poster': (metadata['cover'] or "") if metadata else "",
+            'is_favorite': anime_id in favorites,
+            'playback': None
+        }
+        if record:
+            item['playback'] = {
+                'episode_title': record.get('episode_title', ''),
+                'position': record.get('playback_position', 0),
+                'last_played': record.get('timestamp', '')
+            }
+        if with_desc:
+            item['description'] = (DESC_MAP.get(metadata.title) if metadata else None) or ""
+        
+        result[anime_id] = item
+    
+    return jsonify({"code": 200, "data": result})
+
+
+def fetch_category_page(cat_id, page):
+    url = f"{ANIME1_BASE}/?cat={cat_id}"
+    if page > 1:
+        url += f"&paged={page}"
+    with tracing.span("upstream"):
+        res = UPSTREAM.request(client, "GET", url)
+    if res.status_code >= 500:
+        # 上游出错的页面不能当作内容解析，抛出后走熔断 / 过期缓存的处理
+        raise httpx.HTTPStatusError(f"上游返回 {res.status_code}", request=res.request, response=res)
+    if page > 1 and res.status_code == 404:
+        return None
+    return res.text
+
+
+EPISODE_LOADER = EpisodeLoader(fetch_category_page, max_workers=EPISODE_FETCH_WORKERS, full_ttl=EPISODE_FULL_TTL)
+
+
 @app.route('/api/episodes')
+@upstream_limited
 def api_episodes():
     cat_id = request.args.get('id')
-    url = f"https://anime1.me/?cat={cat_id}"
     
     try:
-        with httpx.Client(headers=HEADERS, timeout=15.0, follow_redirects=True) as temp_client:
-            res = temp_client.get(url)
-            
-            soup = BeautifulSoup(res.text, 'html.parser')
-            main = soup.find(id='main')
-            if not main:
-                return jsonify({"code": 404, "msg": "未找到番剧页面"})
-            
-            eps = []
-            articles = main.find_all('article')
-            
-            for idx, art in enumerate(articles):
-                title_tag = art.find('h2', class_='entry-title')
-                full_title = title_tag.text.strip() if title_tag else f"第 {idx+1} 集"
-                full_title = cc.convert(full_title)
-
-                short_title = full_title
-                brackets_matches = re.findall(r'[\[\(【]\s*(\d+(\.\d+)?)\s*[\]\)】]', full_title)
-                special_match = re.search(r'(OVA|OAD|SP|Ep)\.?\s*(\d+(\.\d+)?)', full_title, re.IGNORECASE)
-                
-                if special_match:
-                    prefix = special_match.group(1).upper()
-                    num = special_match.group(2)
-                    short_title = f"{prefix} {num}"
-                elif brackets_matches:
-                    num = brackets_matches[-1][0] 
-                    if '.' not in num and num.isdigit() and int(num) < 10:
-                        num = num.zfill(2)
-                    short_title = num
-                else:
-                    all_nums = re.findall(r'\d+(\.\d+)?', full_title)
-                    if all_nums:
-                        num = all_nums[-1][0]
-                        if '.' not in num and num.isdigit() and int(num) < 10:
-                            num = num.zfill(2)
-                        short_title = num
-                
-                match_token = re.search(r'data-apireq="([^"]+)"', str(art))
-                token = match_token.group(1) if match_token else ""
-                
-                eps.append({
-                    "index": idx, 
-                    "title": short_title, 
-                    "full_title": full_title,
-                    "token": token
-                })
-            
-            return jsonify({"code": 200, "data": eps})
+        metadata = ANIME_METADATA.get(cat_id)
+        expected = expected_episode_count(metadata['status']) if metadata else None
+        stale_age = None
+        try:
+            with tracing.span("load_episodes"):
+                articles = EPISODE_LOADER.load(cat_id, expected)
+        except (upstream_health.CircuitOpen, httpx.HTTPError) as e:
+            # 上游不可用：有缓存就返回最后一次成功的列表并标记过期，否则告诉客户端稍后重试
+            cached = EPISODE_LOADER.cached(cat_id)
+            if cached is None:
+                retry = getattr(e, 'retry_after', UPSTREAM_COOLDOWN)
+                response = jsonify({"code": 503, "msg": f"上游暂不可用: {e}"})
+                response.headers['Retry-After'] = str(max(1, int(retry)))
+                return response
+            articles, stale_age = cached
+        if articles is None:
+            return jsonify({"code": 404, "msg": "未找到番剧页面"})
+        
+        with tracing.span("build_episodes"):
+            eps = episode_parser.build_episodes(articles, convert=traced_convert)
+        with tracing.span("json"):
+            response = jsonify({"code": 200, "data": eps})
+        if stale_age is not None:
+            response.headers['X-AnimeOne-Stale'] = str(int(stale_age))
+        return response
 
     except Exception as e:
         print(f"[ERROR] 获取集数列表失败: {e}", flush=True)
@@ -388,6 +1080,7 @@ def api_episodes():
 
 
 @app.route('/api/play_info')
+@upstream_limited
 def api_play_info():
     token = request.args.get('token')
     if not token:
@@ -400,52 +1093,97 @@ def api_play_info():
         safe_url = base64.urlsafe_b64encode(data['url'].encode()).decode()
         safe_cookie = base64.urlsafe_b64encode(json.dumps(data['cookies']).encode()).decode()
         proxy_url = f"/video_proxy?u={safe_url}&c={safe_cookie}"
-        return jsonify({"code": 200, "url": proxy_url})
+        with tracing.span("json"):
+            return jsonify({"code": 200, "url": proxy_url})
     
     return jsonify({"code": 500, "msg": err})
 
 
 @app.route('/api/season_schedule')
+@RESPONSE_CACHE.cached("catalogue", "favorites", "playback")
 def api_season_schedule():
-    if not ANIME_DB:
-        update_database()
+    ensure_database()
     
     year = request.args.get('year', '2017')
     season = request.args.get('season', '秋季')
-    cache_key = f"{year}_{season}"
     
-    if SCHEDULE_CACHE and cache_key in SCHEDULE_CACHE:
-        cached_data = json.loads(json.dumps(SCHEDULE_CACHE[cache_key]))
-        
-        # 🔥 优化：从 ANIME_METADATA 获取完整信息
-        for day_list in cached_data:
-            for anime in day_list:
-                anime_id = str(anime['id'])
-                
-                if anime_id in ANIME_METADATA:
-                    metadata = ANIME_METADATA[anime_id]
-                    anime['status'] = metadata['status']
-                    anime['is_favorite'] = metadata['is_favorite']
-                    
-                    # 添加播放记录
-                    if metadata['playback']:
-                        anime['playback'] = {
-                            'episode_title': metadata['playback']['episode_title'],
-                            'position': metadata['playback']['position'],
-                        }
-                    else:
-                        anime['playback'] = None
-                else:
-                    # 降级处理
-                    anime['is_favorite'] = False
-                    anime['playback'] = None
-        
-        return jsonify({"code": 200, "data": cached_data})
+    week = SCHEDULE_INDEX.week(year, season)
+    if week is None:
+        return jsonify({"code": 404, "msg": f"本地无数据"})
     
-    return jsonify({"code": 404, "msg": f"本地无数据"})
+    return jsonify({"code": 200, "data": [[_schedule_item(entry) for entry in day] for day in week]})
+
+
+def _schedule_item(entry):
+    """季度表条目 + 当前的连载状态、追番和播放记录"""
+    item = dict(entry)
+    metadata = ANIME_METADATA.get(entry['id'])
+    if metadata:
+        item['status'] = metadata['status']
+        item['is_favorite'] = metadata['is_favorite']
+        playback = metadata.playback
+        if playback:
+            item['playback'] = {
+                'episode_title': playback['episode_title'],
+                'position': playback['position'],
+            }
+        else:
+            item['playback'] = None
+    else:
+        # 降级处理
+        item['is_favorite'] = False
+        item['playback'] = None
+    return item
+
+
+@app.route('/api/schedule/today')
+@RESPONSE_CACHE.cached("catalogue", "favorites", "playback", "day")
+def api_schedule_today():
+    """当前季度今天更新的番剧"""
+    result = SCHEDULE_INDEX.today()
+    if result is None:
+        return jsonify({"code": 404, "msg": "本地无数据"})
+    year, season, weekday, entries = result
+    return jsonify({"code": 200, "data": {
+        "year": year,
+        "season": season,
+        "weekday": weekday,
+        "items": [_schedule_item(entry) for entry in entries]
+    }})
+
+
+@app.route('/api/schedule/anime/<anime_id>')
+@RESPONSE_CACHE.cached("catalogue")
+def api_schedule_anime(anime_id):
+    """某部番剧出现在哪些季度、星期几更新"""
+    data = [{"year": y, "season": s, "weekday": w} for y, s, w in SCHEDULE_INDEX.appearances(anime_id)]
+    return jsonify({"code": 200, "data": data})
 
 @app.route('/video_proxy')
 def video_proxy():
+    if not RATE_LIMIT:
+        return _video_proxy()
+    client = client_key()
+    try:
+        VIDEO_BUCKETS.check(client)
+        VIDEO_SCHEDULER.acquire(client, VIDEO_QUEUE_TIMEOUT)
+    except rate_limit.Throttled as e:
+        return _throttled_response(e)
+    try:
+        response = make_response(_video_proxy())
+    except Exception:
+        VIDEO_SCHEDULER.release(client)
+        raise
+    if not response.is_streamed:
+        VIDEO_SCHEDULER.release(client)
+        return response
+    # 名额一直占到视频流结束 (服务器关闭响应体) 为止；直通响应不会触发 call_on_close，由响应体负责归还
+    response.response = rate_limit.ThrottledBody(
+        response.response, VIDEO_BYTES, client, on_close=lambda: VIDEO_SCHEDULER.release(client))
+    return response
+
+
+def _video_proxy():
     import base64
     u = request.args.get('u')
     c = request.args.get('c')
@@ -456,22 +1194,58 @@ def video_proxy():
     cookies_dict = json.loads(base64.urlsafe_b64decode(c).decode()) if c else {}
     cookie_header = "; ".join([f"{k}={v}" for k, v in cookies_dict.items()])
     
+    client_range = request.headers.get('Range')
+    parsed = proxy_stream.parse_range(client_range) if PROXY_SHARED_STREAMS else None
+    if parsed is None:
+        return _proxy_passthrough(real_url, cookie_header, client_range or 'bytes=0-')
+
+    def opener(start):
+        headers = {
+            "User-Agent": HEADERS["User-Agent"],
+            "Referer": "https://anime1.me/",
+            "Range": f"bytes={start}-",
+            "Cookie": cookie_header
+        }
+        req = proxy_client.build_request("GET", real_url, headers=headers)
+        return proxy_client.send(req, stream=True)
+
+    start, end = parsed
+    try:
+        status, resp_headers, body = proxy_stream.serve_range((real_url, cookie_header), start, end, opener)
+    except proxy_stream.StreamUnavailable:
+        return _proxy_passthrough(real_url, cookie_header, client_range or 'bytes=0-')
+
+    if status is None:
+        if body.status_code == 206:
+            # 上游返回的区间与对齐后的请求不符，改为原样转发客户端的 Range
+            body.close()
+            return _proxy_passthrough(real_url, cookie_header, client_range or 'bytes=0-')
+        # 上游不支持 Range 或出错，直接透传这条响应
+        return _stream_upstream(body, None)
+    return Response(stream_with_context(_count_proxy_bytes(body)), status=status, headers=resp_headers, direct_passthrough=True)
+
+
+def _proxy_passthrough(real_url, cookie_header, range_header):
+    """原样转发 Range，每个请求独占一条上游连接"""
     headers = {
         "User-Agent": HEADERS["User-Agent"],
         "Referer": "https://anime1.me/",
-        "Range": request.headers.get('Range', 'bytes=0-'),
+        "Range": range_header,
         "Cookie": cookie_header
     }
     
-    proxy_client = httpx.Client(timeout=30.0, verify=False, follow_redirects=True)
+    temp_client = httpx.Client(timeout=30.0, verify=False, follow_redirects=True, event_hooks=metrics.httpx_hooks())
     
     try:
-        req = proxy_client.build_request("GET", real_url, headers=headers)
-        r = proxy_client.send(req, stream=True)
+        req = temp_client.build_request("GET", real_url, headers=headers)
+        r = temp_client.send(req, stream=True)
     except Exception as e:
-        proxy_client.close()
+        temp_client.close()
         return str(e), 500
-    
+    return _stream_upstream(r, temp_client)
+
+
+def _stream_upstream(r, owned_client):
     excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
     resp_headers = [(k, v) for k, v in r.headers.items() if k.lower() not in excluded_headers]
     if 'content-length' in r.headers:
@@ -480,18 +1254,19 @@ def video_proxy():
     def generate():
         try:
             for chunk in r.iter_bytes(chunk_size=1024*64):
+                metrics.PROXY_BYTES.inc(len(chunk))
                 yield chunk
         except:
             pass
         finally:
             r.close()
-            proxy_client.close()
+            if owned_client is not None:
+                owned_client.close()
     
     return Response(stream_with_context(generate()), status=r.status_code, headers=resp_headers, direct_passthrough=True)
 
 
 # ================= 追番功能 API (内存缓存版) =================
-FAVORITES_FILE = os.path.join(BASE_DIR, "static", "json", "favorites.json")
 
 @app.route('/api/favorites/add', methods=['POST'])
 def api_add_favorite():
@@ -501,15 +1276,16 @@ def api_add_favorite():
         if not anime_id:
             return jsonify({"code": 400, "msg": "Missing anime_id"})
         
-        with DATA_LOCK:
+        with DATA_LOCK, USER_STATE.writing("favorites"):
             if anime_id not in FAVORITES_CACHE:
                 FAVORITES_CACHE.append(anime_id)
                 # 同步更新元数据
                 if anime_id in ANIME_METADATA:
-                    ANIME_METADATA[anime_id]['is_favorite'] = True
+                    ANIME_METADATA[anime_id].is_favorite = True
+                LIST_INDEX.set_favorite(anime_id, True)
                 # 写入文件
-                with open(FAVORITES_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(FAVORITES_CACHE, f, ensure_ascii=False, indent=2)
+                multiproc.write_json_atomic(FAVORITES_FILE, FAVORITES_CACHE, indent=2)
+                CHANGE_FEED.publish("favorite", anime_id, {"is_favorite": True})
         
         return jsonify({"code": 200, "msg": "success"})
     except Exception as e:
@@ -524,15 +1300,16 @@ def api_remove_favorite():
         if not anime_id:
             return jsonify({"code": 400, "msg": "Missing anime_id"})
         
-        with DATA_LOCK:
+        with DATA_LOCK, USER_STATE.writing("favorites"):
             if anime_id in FAVORITES_CACHE:
                 FAVORITES_CACHE.remove(anime_id)
                 # 同步更新元数据
                 if anime_id in ANIME_METADATA:
-                    ANIME_METADATA[anime_id]['is_favorite'] = False
+                    ANIME_METADATA[anime_id].is_favorite = False
+                LIST_INDEX.set_favorite(anime_id, False)
                 # 写入文件
-                with open(FAVORITES_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(FAVORITES_CACHE, f, ensure_ascii=False, indent=2)
+                multiproc.write_json_atomic(FAVORITES_FILE, FAVORITES_CACHE, indent=2)
+                CHANGE_FEED.publish("favorite", anime_id, {"is_favorite": False})
                     
         return jsonify({"code": 200, "msg": "success"})
     except Exception as e:
@@ -540,6 +1317,7 @@ def api_remove_favorite():
 
 
 @app.route('/api/favorites/list', methods=['GET'])
+@RESPONSE_CACHE.cached("favorites")
 def api_list_favorites():
     try:
         # 直接返回内存数据，无需读取文件
@@ -548,41 +1326,67 @@ def api_list_favorites():
         return jsonify({"code": 500, "msg": str(e)})
 
 
+def _favorite_item(metadata):
+    anime_data = {
+        'id': metadata.id,
+        'title': metadata.title,
+        'status': metadata.status,
+        'year': metadata.year,
+        'season': metadata.season,
+        'poster': metadata.cover or "",
+        'is_favorite': True,
+    }
+    
+    # 🔥 添加播放记录
+    playback = metadata.playback
+    if playback:
+        anime_data['playback'] = {
+            'episode_title': playback['episode_title'],
+            'position': playback['position'],
+        }
+    else:
+        anime_data['playback'] = None
+    return anime_data
+
+
+def _history_rows(index, mask, sort):
+    """
+    追番 / 播放记录列表共用：不带 size 时返回全部行；
+    带 size (可配合 cursor) 时按游标分页，返回 (行号列表, 附加字段)
+    """
+    cursor = request.args.get('cursor')
+    if 'size' not in request.args and not cursor:
+        return index.ordered_rows(mask, sort), None
+    try:
+        size = min(LIST_PAGE_SIZE_MAX, max(1, int(request.args.get('size', LIST_PAGE_SIZE))))
+    except ValueError:
+        raise ValueError("page / size 必须是整数") from None
+    after = None
+    if cursor:
+        cursor_sort, _, after = _decode_cursor(cursor)
+        if cursor_sort != sort:
+            raise ValueError("cursor 无效")
+    rows, next_key = index.keyset_page(mask, sort, False, after, size)
+    next_cursor = _encode_cursor(sort, False, next_key) if next_key is not None else None
+    return rows, {"total": popcount(mask), "next_cursor": next_cursor}
+
+
 @app.route('/api/favorites/list_with_details', methods=['GET'])
+@RESPONSE_CACHE.cached("catalogue", "favorites", "playback")
 def api_list_favorites_with_details():
+    """追番列表，最新追的在前；可选 size / cursor 分页"""
     try:
-        result = []
-        # 倒序：最新追的在前
-        for anime_id in reversed(FAVORITES_CACHE):
-            if anime_id in ANIME_METADATA:
-                metadata = ANIME_METADATA[anime_id]
-                anime_data = {
-                    'id': anime_id,
-                    'title': metadata['title'],
-                    'status': metadata['status'],
-                    'year': metadata['year'],
-                    'season': metadata['season'],
-                    'poster': metadata['cover'] or "",
-                    'is_favorite': True,
-                }
-                
-                # 🔥 添加播放记录
-                if metadata['playback']:
-                    anime_data['playback'] = {
-                        'episode_title': metadata['playback']['episode_title'],
-                        'position': metadata['playback']['position'],
-                    }
-                else:
-                    anime_data['playback'] = None
-                
-                result.append(anime_data)
-        
-        return jsonify({"code": 200, "data": result})
+        index = LIST_INDEX
+        try:
+            rows, extra = _history_rows(index, index.fav_mask, "favorite")
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": str(e)})
+        records = index.records
+        return _json_list_response((_favorite_item(records[p]) for p in rows), len(rows), extra)
     except Exception as e:
         return jsonify({"code": 500, "msg": str(e)})
 
 # ================= 播放记录 API (内存缓存版) =================
-PLAYBACK_FILE = os.path.join(BASE_DIR, "static", "json", "playback_history.json")
 
 @app.route('/api/playback/save', methods=['POST'])
 def api_save_playback():
@@ -595,31 +1399,85 @@ def api_save_playback():
         if not anime_id or not episode_title:
             return jsonify({"code": 400, "msg": "Missing required fields"})
         
-        from datetime import datetime
-        
-        with DATA_LOCK:
+        with DATA_LOCK, USER_STATE.writing("playback"):
             record = {
                 'episode_title': episode_title,
                 'playback_position': playback_position,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': sync_events.utc_iso()
             }
             PLAYBACK_CACHE[anime_id] = record
             # 同步更新元数据
             if anime_id in ANIME_METADATA:
-                ANIME_METADATA[anime_id]['playback'] = {
-                    'episode_title': episode_title,
-                    'position': playback_position,
-                    'last_played': record['timestamp']
-                }
+                ANIME_METADATA[anime_id].playback_record = record
+            LIST_INDEX.set_playback(anime_id, record['timestamp'])
             # 写入文件
-            with open(PLAYBACK_FILE, 'w', encoding='utf-8') as f:
-                json.dump(PLAYBACK_CACHE, f, ensure_ascii=False, indent=2)
+            multiproc.write_json_atomic(PLAYBACK_FILE, PLAYBACK_CACHE, indent=2)
+            CHANGE_FEED.publish("playback", anime_id, record)
         
         return jsonify({"code": 200, "msg": "success"})
     except Exception as e:
         return jsonify({"code": 500, "msg": str(e)})
 
 
+@app.route('/api/playback/batch', methods=['POST'])
+def api_batch_playback():
+    """
+    批量上传离线期间积压的播放进度：{"updates": [{anime_id, episode_title, playback_position, timestamp}]}
+    timestamp 为客户端观看时的时间 (ISO，建议 UTC)；同一番剧以时间最新者为准 (last-writer-wins)，
+    比服务器上已有记录或清除时间旧的更新会被跳过
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"code": 400, "msg": "请求体必须是 JSON 对象"})
+        updates = data.get('updates') or []
+        if not isinstance(updates, list):
+            return jsonify({"code": 400, "msg": "updates 必须是数组"})
+        
+        now = sync_events.parse_ts(sync_events.utc_iso())
+        parsed = []
+        for item in updates:
+            if not isinstance(item, dict):
+                return jsonify({"code": 400, "msg": "updates 的每一项必须是对象"})
+            if not item.get('anime_id') or not item.get('episode_title'):
+                return jsonify({"code": 400, "msg": "Missing required fields"})
+            # 没带时间或时间在未来 (设备时钟偏快) 时按收到的时间算
+            when = sync_events.parse_ts(item.get('timestamp'))
+            if when is None or when > now:
+                when = now
+            parsed.append((when, item))
+        parsed.sort(key=lambda x: x[0])
+        
+        applied, skipped = [], []
+        with DATA_LOCK, USER_STATE.writing("playback"):
+            for when, item in parsed:
+                anime_id = str(item['anime_id'])
+                current = PLAYBACK_CACHE.get(anime_id)
+                current_ts = sync_events.parse_ts(current.get('timestamp')) if current else None
+                removed_at = SYNC_VERSIONS.removed_at("playback", anime_id)
+                if (current_ts is not None and current_ts >= when) or \
+                        (removed_at is not None and removed_at >= when.timestamp()):
+                    skipped.append(anime_id)
+                    continue
+                record = {
+                    'episode_title': item['episode_title'],
+                    'playback_position': item.get('playback_position', 0),
+                    'timestamp': sync_events.utc_iso(when)
+                }
+                PLAYBACK_CACHE[anime_id] = record
+                if anime_id in ANIME_METADATA:
+                    ANIME_METADATA[anime_id].playback_record = record
+                LIST_INDEX.set_playback(anime_id, record['timestamp'])
+                CHANGE_FEED.publish("playback", anime_id, record)
+                applied.append(anime_id)
+            if applied:
+                multiproc.write_json_atomic(PLAYBACK_FILE, PLAYBACK_CACHE, indent=2)
+        
+        return jsonify({"code": 200, "applied": applied, "skipped": skipped})
+    except Exception as e:
+        return jsonify({"code": 500, "msg": str(e)})
+
+
 @app.route('/api/playback/get/<anime_id>', methods=['GET'])
 def api_get_playback(anime_id):
     try:
@@ -638,15 +1496,16 @@ def api_clear_playback():
         if not anime_id:
             return jsonify({"code": 400, "msg": "Missing anime_id"})
         
-        with DATA_LOCK:
+        with DATA_LOCK, USER_STATE.writing("playback"):
             if anime_id in PLAYBACK_CACHE:
                 del PLAYBACK_CACHE[anime_id]
                 # 同步更新元数据
                 if anime_id in ANIME_METADATA:
-                    ANIME_METADATA[anime_id]['playback'] = None
+                    ANIME_METADATA[anime_id].playback_record = None
+                LIST_INDEX.set_playback(anime_id, None)
                 # 写入文件
-                with open(PLAYBACK_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(PLAYBACK_CACHE, f, ensure_ascii=False, indent=2)
+                multiproc.write_json_atomic(PLAYBACK_FILE, PLAYBACK_CACHE, indent=2)
+                CHANGE_FEED.publish("playback", anime_id, None)
         
         return jsonify({"code": 200, "msg": "success"})
     except Exception as e:
@@ -654,32 +1513,215 @@ def api_clear_playback():
 
 
 @app.route('/api/playback/list', methods=['GET'])
+@RESPONSE_CACHE.cached("catalogue", "playback")
 def api_list_playback():
+    """播放记录，最近播放的在前 (列表索引维护时间顺序，请求时不再排序)；可选 size / cursor 分页"""
     try:
-        result = []
-        # 直接使用统一元数据
-        for anime_id, record in PLAYBACK_CACHE.items():
-            if anime_id in ANIME_METADATA:
-                metadata = ANIME_METADATA[anime_id]
-                item = {
-                    'anime_id': anime_id,
-                    'title': metadata['title'],
-                    'status': metadata['status'],
-                    'year': metadata['year'],
-                    'season': metadata['season'],
-                    'poster': metadata['cover'] or "",
-                    'episode_title': record.get('episode_title', ''),
-                    'playback_position': record.get('playback_position', 0),
-                    'timestamp': record.get('timestamp', '')
-                }
-                result.append(item)
-        
-        result.sort(key=lambda x: x['timestamp'], reverse=True)
-        return jsonify({"code": 200, "data": result})
+        index = LIST_INDEX
+        try:
+            rows, extra = _history_rows(index, index.played_mask, "last_played")
+        except ValueError as e:
+            return jsonify({"code": 400, "msg": str(e)})
+        records = index.records
+        # 流式输出期间记录可能被清除，逐条再检查一次
+        items = (_playback_item(r) for r in map(records.__getitem__, rows) if r.playback_record)
+        return _json_list_response(items, len(rows), extra)
     except Exception as e:
         return jsonify({"code": 500, "msg": str(e)})
 
 
+def _playback_item(metadata):
+    record = metadata.playback_record
+    return {
+        'anime_id': metadata.id,
+        'title': metadata.title,
+        'status': metadata.status,
+        'year': metadata.year,
+        'season': metadata.season,
+        'poster': metadata.cover or "",
+        'episode_title': record.get('episode_title', ''),
+        'playback_position': record.get('playback_position', 0),
+        'timestamp': record.get('timestamp', '')
+    }
+
+
+# ================= 变更推送 (SSE) =================
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False))
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route('/api/sync/events')
+def api_sync_events():
+    """
+    追番 / 播放记录的变更推送 (text/event-stream)
+      ready   连接建立，data 为当前位置 "epoch:seq"
+      change  一条变更，id 为 "epoch:seq"
+      reset   无法补发 (服务重启、断线太久或本连接积压过多)，客户端应通过 /api/sync/delta 补齐
+    断线重连时浏览器会自动带上 Last-Event-ID；也可以用 ?since=epoch:seq 指定
+    每条连接一直占用一个工作线程，连接数超过 SYNC_MAX_STREAMS 时返回 503
+    """
+    feed = CHANGE_FEED
+    last = request.headers.get('Last-Event-ID') or request.args.get('since')
+    # 先订阅再取积压，中间发布的事件两边都有，按序号去重
+    try:
+        sub = feed.subscribe()
+    except sync_events.TooManySubscribers:
+        response = jsonify({"code": 503, "msg": "推送连接过多，请稍后重试"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    backlog = feed.since(last) if last else []
+    position = feed.position()
+    
+    def generate():
+        epoch = feed.epoch
+        sent = int(last.rsplit(':', 1)[1]) if backlog else 0
+        try:
+            yield "retry: 3000\n\n"
+            if backlog is None:
+                yield _sse("reset", {"position": position})
+            else:
+                yield _sse("ready", {"position": position})
+            
+            pending = backlog or []
+            while True:
+                for event in pending:
+                    if event["seq"] <= sent:
+                        continue
+                    sent = event["seq"]
+                    yield _sse("change", event, f"{epoch}:{sent}")
+                pending = sub.get(SYNC_KEEPALIVE)
+                if not pending:
+                    yield ": keepalive\n\n"
+        except sync_events.Overflow:
+            yield _sse("reset", {"position": feed.position()})
+        finally:
+            sub.close()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/sync/delta')
+def api_sync_delta():
+    """
+    增量同步：since 为上次同步返回的 position ("epoch:seq")
+    返回之后新增 / 删除的追番和更新 / 清除的播放记录；
+    不带 since、服务重置过或位置太旧时 full 为 true，返回全量，客户端整体替换
+    """
+    with DATA_LOCK:
+        position, changes = CHANGE_FEED.changes_since(request.args.get('since'))
+        # 先取位置再加载其他进程的写入，缓存至少和位置一样新
+        USER_STATE.refresh()
+        if changes is None:
+            return jsonify({
+                "code": 200, "position": position, "full": True,
+                "favorites": {"added": list(FAVORITES_CACHE), "removed": []},
+                "playback": {"updated": dict(PLAYBACK_CACHE), "removed": []},
+            })
+        favorites = set(FAVORITES_CACHE)
+        added, removed, updated, cleared = [], [], {}, []
+        for kind, anime_id, _ in changes:
+            if kind == "favorite":
+                (added if anime_id in favorites else removed).append(anime_id)
+            elif anime_id in PLAYBACK_CACHE:
+                updated[anime_id] = PLAYBACK_CACHE[anime_id]
+            else:
+                cleared.append(anime_id)
+        return jsonify({
+            "code": 200, "position": position, "full": False,
+            "favorites": {"added": added, "removed": removed},
+            "playback": {"updated": updated, "removed": cleared},
+        })
+
+
+# ================= 封面 / 简介补全 =================
+def backfill_title(title):
+    """为一个标题查询 bgm.tv 并补上缺少的封面 / 简介；网络错误抛出，由队列重试"""
+    need_cover = _cover_file(title) is None
+    need_desc = not DESC_MAP.get(title)
+    if not (need_cover or need_desc):
+        return
+    fixes = backfill.load_json(MANUAL_FIXES_FILE, {})
+    if fixes.get(title) == "":
+        # 已在 manual_fixes.json 中等待人工填写搜索词
+        return
+    query = fixes.get(title) or title
+    
+    def get(url):
+        return UPSTREAM.request(client, "GET", url)
+    
+    match = backfill.search_bgm(get, BGM_API, query)
+    if match is None:
+        if title not in fixes:
+            backfill.merge_json(MANUAL_FIXES_FILE, {title: ""}, indent=4)
+            print(f"[INFO] bgm.tv 查不到 {title}，已加入 manual_fixes.json", flush=True)
+        return
+    
+    cover = desc = None
+    if need_desc:
+        desc = match.get('summary') or None
+    if need_cover:
+        url = backfill.cover_url(match, BGM_API)
+        if url:
+            cover = backfill.download_cover(get, url, COVER_INDEX.folder)
+            if cover is None:
+                raise RuntimeError(f"封面下载失败: {url}")
+    if cover or desc:
+        apply_backfill(title, cover, desc)
+
+
+def apply_backfill(title, cover, desc):
+    """把补全结果写回映射文件，并只更新该标题对应的记录"""
+    global CATALOGUE_GENERATION
+    with DATA_LOCK:
+        if cover:
+            COVER_MAP[title] = cover
+            backfill.merge_json(CACHE_FILE, {title: cover})
+            COVER_INDEX.add(cover)
+        if desc:
+            DESC_MAP[title] = desc
+            backfill.merge_json(DESC_FILE, {title: desc})
+        if cover:
+            for record in ANIME_DB:
+                if record.title == title:
+                    record.cover_file = cover
+            rebuild_schedule_index()
+        CATALOGUE_GENERATION += 1
+    print(f"[SUCCESS] 已补全 {title}: {'封面 ' if cover else ''}{'简介' if desc else ''}", flush=True)
+
+
+def enqueue_missing_infos():
+    """缺封面或简介的番剧入队，新番优先"""
+    if BACKFILL is None:
+        return
+    items = [(record.title, int(record.id)) for record in ANIME_DB
+             if record.cover_file is None or not DESC_MAP.get(record.title)]
+    added = BACKFILL.enqueue(items)
+    if added:
+        print(f"[INFO] {added} 部番剧缺少封面或简介，已加入后台补全队列 (共 {len(BACKFILL)} 条待处理)", flush=True)
+
+
+def _backfill_idle():
+    """补全完一批封面 / 简介后发布新的目录快照和离线目录包"""
+    publish_catalogue()
+    publish_bundle()
+
+
+BACKFILL = backfill.BackfillQueue(
+    BACKFILL_FILE, backfill_title, interval=INFO_BACKFILL_INTERVAL,
+    max_attempts=INFO_BACKFILL_MAX_ATTEMPTS, recheck=INFO_BACKFILL_RECHECK,
+    on_idle=_backfill_idle
+) if INFO_BACKFILL else None
+
+
 # ================= 定时任务 =================
 def reload_static_data():
     """重新加载静态数据（封面、手动修正、季度表、介绍）"""
@@ -711,30 +1753,154 @@ def reload_static_data():
         except Exception as e:
             print(f"[ERROR] 加载季度表失败: {e}", flush=True)
     
+    # 封面目录可能被独立运行的 download_infos.py 修改过
+    COVER_INDEX.refresh_if_changed()
+    rebuild_schedule_index()
+    
     # 重建元数据
     if ANIME_DB:
         build_anime_metadata()
 
+def _airing_counts():
+    """(今天在播数, 昨天在播数, 本季日均在播数)，供刷新调度判断是否是更新高峰"""
+    today = SCHEDULE_INDEX.today()
+    if today is None:
+        return None
+    year, season, weekday, entries = today
+    week = SCHEDULE_INDEX.week(year, season)
+    return len(entries), len(week[(weekday - 1) % 7]), sum(len(day) for day in week) / 7
+
+
+REFRESH = refresh_scheduler.RefreshScheduler(
+    _airing_counts, base_interval=REFRESH_BASE_INTERVAL,
+    min_interval=REFRESH_MIN_INTERVAL, max_interval=REFRESH_MAX_INTERVAL
+)
+
+
 def scheduled_task():
+    static_at = published_at = 0
+    if BACKFILL is not None:
+        BACKFILL.start()
     while True:
         try:
             print(f"[INFO] 开始执行定时更新任务: {time.strftime('%Y-%m-%d %H:%M:%S')}", flush=True)
-            update_database()
-            reload_static_data()
+            loaded = bool(ANIME_DB)
+            with metrics.REFRESH_DURATION.time(job="update_database"):
+                changed = update_database(conditional=True)
+            # 首次加载不算作上游变化，不计入变化时段统计
+            if changed is not None and loaded:
+                REFRESH.record(changed)
+            if time.time() - static_at >= STATIC_RELOAD_INTERVAL:
+                with metrics.REFRESH_DURATION.time(job="reload_static_data"):
+                    reload_static_data()
+                static_at = time.time()
+                changed = True
+            enqueue_missing_infos()
+            # 没有变化时也定期发布，其他进程据此知道目录仍是新的
+            if changed or time.time() - published_at >= CATALOGUE_STALE_AFTER / 2:
+                publish_catalogue()
+                published_at = time.time()
+            if changed or BUNDLE.manifest() is None:
+                publish_bundle()
         except Exception as e:
             # 捕获所有异常，防止线程退出
             print(f"[ERROR] 定时任务发生未处理异常: {e}", flush=True)
             traceback.print_exc()
         
-        # 无论成功失败，都休眠 2 小时
-        time.sleep(7200)
+        # 无论成功失败，都按调度结果休眠
+        delay = REFRESH.delay()
+        print(f"[INFO] {delay / 60:.0f} 分钟后再次检查番剧列表", flush=True)
+        time.sleep(delay)
+
+# ================= 多进程部署 =================
+def apply_catalogue(payload):
+    """用领导者发布的快照替换本进程的目录数据"""
+    global ANIME_DB, COVER_MAP, DESC_MAP, SCHEDULE_CACHE, CATALOGUE_UPDATED_AT, CATALOGUE_EPOCH
+    CATALOGUE_EPOCH = payload.get("epoch", "")
+    COVER_MAP = payload["cover_map"]
+    DESC_MAP = payload["desc_map"]
+    SCHEDULE_CACHE = payload["schedule"]
+    COVER_INDEX.refresh_if_changed()
+    rebuild_schedule_index()
+    new_db = [AnimeRecord.from_row(row) for row in payload["anime_db"]]
+    invalidate_changed_episodes(ANIME_DB, new_db)
+    ANIME_DB = new_db
+    CATALOGUE_UPDATED_AT = payload.get("updated_at")
+    build_anime_metadata()
+    print(f"[INFO] 已加载目录快照 第 {CATALOGUE.generation} 代: {len(ANIME_DB)} 条", flush=True)
+
+
+def publish_catalogue():
+    """领导者刷新完成后发布新一代快照，单进程模式下什么都不做"""
+    global CATALOGUE_EPOCH
+    if CATALOGUE is None or not LEADER.is_leader:
+        return
+    CATALOGUE_EPOCH = BOOT_ID
+    gen = CATALOGUE.publish({
+        "anime_db": [record.to_row() for record in ANIME_DB],
+        "cover_map": COVER_MAP,
+        "desc_map": DESC_MAP,
+        "schedule": SCHEDULE_CACHE,
+        "updated_at": CATALOGUE_UPDATED_AT,
+        "epoch": CATALOGUE_EPOCH,
+    })
+    print(f"[SUCCESS] 已发布目录快照 第 {gen} 代", flush=True)
+
+
+def publish_bundle():
+    """按当前目录发布离线目录包，只写入内容变化了的分块"""
+    with metrics.REFRESH_DURATION.time(job="publish_bundle"):
+        manifest, changed = BUNDLE.publish(list(ANIME_DB), DESC_MAP, CATALOGUE_UPDATED_AT)
+    if changed:
+        print(f"[SUCCESS] 已发布离线目录包 {manifest['version']}: {manifest['count']} 部番剧, "
+              f"{len(manifest['chunks'])} 个列表分块, {len(manifest['descriptions'])} 个介绍分块", flush=True)
+
+
+def start_multiprocess():
+    """gunicorn 的每个 worker 导入 app 时调用"""
+    global LEADER, CATALOGUE, CHANGE_FEED
+    os.makedirs(multiproc.RUN_DIR, exist_ok=True)
+    CATALOGUE = multiproc.SnapshotStore(multiproc.RUN_DIR)
+    payload = CATALOGUE.load_latest()
+    if payload is not None:
+        apply_catalogue(payload)
+    CATALOGUE.follow(apply_catalogue)
+    
+    USER_STATE.mark_loaded()
+    USER_STATE.poll(DATA_LOCK)
+    CHANGE_FEED = sync_events.ChangeFeed(SYNC_VERSIONS, SYNC_HISTORY, SYNC_QUEUE_SIZE,
+                                         log_path=os.path.join(multiproc.RUN_DIR, "changes.log"),
+                                         max_subscribers=SYNC_MAX_STREAMS)
+    CHANGE_FEED.follow()
+    COVER_INDEX.start_watcher()
+    
+    def on_elected():
+        threading.Thread(target=scheduled_task, daemon=True, name="scheduled-task").start()
+    
+    LEADER = multiproc.LeaderElection(os.path.join(multiproc.RUN_DIR, "leader.lock"), on_elected)
+    LEADER.start()
+
+
+if MULTIPROC:
+    with boot_profile.phase("multiprocess setup"):
+        start_multiprocess()
+boot_profile.mark("app loaded")
+
+if boot_profile.ENABLED:
+    @app.before_request
+    def _boot_report():
+        boot_profile.report()
+
 
 if __name__ == '__main__':
-    # 启动后台更新线程
-    t = threading.Thread(target=scheduled_task)
-    t.daemon = True
-    t.start()
+    if not MULTIPROC:
+        # 启动后台更新线程
+        t = threading.Thread(target=scheduled_task)
+        t.daemon = True
+        t.start()
+        COVER_INDEX.start_watcher()
     
     print(f"[INFO] 服务已启动...", flush=True)
+    boot_profile.mark("ready")
     # 关闭 Flask 自带的 debug 重载器 (use_reloader=False)，避免多线程环境下的重复执行问题
     app.run(host='0.0.0.0', port=PORT, threaded=True, debug=DEBUG, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+封面 / 简介后台补全
+
+番剧列表刷新后，缺封面或简介的标题进入一个持久化的工作队列，由后台线程按固定速率
+向 bgm.tv 查询并下载封面，结果由调用方逐条写回内存元数据，不需要整体重建。
+
+队列状态保存在 JSON 文件里，重启后继续：
+  pending  标题 -> {priority, attempts, next_at, error}，取到期条目中 priority 最大的
+           (番剧 id 越大越新，新番先处理)
+  settled  标题 -> 结束时间；处理完成 (包括查不到、需要手动修正) 的标题在 recheck
+           秒内不再入队，避免每次刷新都把同一批查不到的标题重新排队
+失败时按指数退避重试，超过 max_attempts 次后放弃，等 recheck 后再试。
+
+download_infos.py 与这里共用 bgm.tv 的查询和封面下载函数。
+"""
+import os
+import json
+import time
+import random
+import threading
+import urllib.parse
+
+import cover_store
+from upstream_health import CircuitOpen
+
+SAVE_EVERY = 10  # 每处理多少条落盘一次，队列清空时也会落盘
+
+
+# ================= bgm.tv =================
+def search_bgm(get, bgm_api, query):
+    """按标题搜索 bgm.tv 动画条目，返回第一个结果 (含 summary / images)，查不到时返回 None"""
+    url = f"{bgm_api}/search/subject/{urllib.parse.quote(query)}?type=2&responseGroup=large"
+    data = get(url).json()
+    items = data.get('list') or []
+    return items[0] if items else None
+
+
+def cover_url(match, bgm_api):
+    url = (match.get('images') or {}).get('large', '')
+    if url and bgm_api.startswith('https://'):
+        url = url.replace('http://', 'https://')
+    return url
+
+
+def download_cover(get, url, folder):
+    """下载封面存入内容寻址目录，返回相对路径；下载失败返回 None"""
+    res = get(url)
+    if res.status_code != 200 or not res.content:
+        return None
+    ext = url.split('.')[-1].split('?')[0]
+    relpath, _ = cover_store.store_bytes(folder, res.content, ext)
+    return relpath
+
+
+# ================= JSON 文件 =================
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def merge_json(path, updates, indent=2):
+    """
+    把 updates 合并进 path 中的字典后原子写回，返回合并后的字典。
+    先读后写，手动运行的 download_infos.py 同时写入的条目不会被覆盖。
+    """
+    data = load_json(path, {})
+    data.update(updates)
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp, path)
+    return data
+
+
+# ================= 队列 =================
+class BackfillQueue:
+    """
+    handler(title) 处理一个标题，正常返回即完成，抛异常表示暂时失败需要重试。
+    interval 为两次调用 handler 之间的最小间隔 (秒)。
+    on_idle() 在处理过条目之后、队列里暂时没有到期条目时调用 (如发布目录快照)。
+    """
+
+    def __init__(self, path, handler, interval=2.0, max_attempts=5,
+                 backoff=60.0, max_backoff=6 * 3600, recheck=7 * 86400, on_idle=None):
+        self.path = path
+        self.handler = handler
+        self.on_idle = on_idle
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.recheck = recheck
+        state = load_json(path, {})
+        self.pending = state.get("pending") or {}
+        self.settled = state.get("settled") or {}
+        self.stats = {"enqueued": 0, "done": 0, "retried": 0, "gave_up": 0}
+        self._dirty = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # ---------- 入队 ----------
+    def enqueue(self, items):
+        """items: [(标题, 优先级)]，已在队列中或近期处理过的标题跳过，返回新入队数"""
+        now = time.time()
+        added = 0
+        with self._cond:
+            for title, priority in items:
+                if title in self.pending:
+                    continue
+                settled_at = self.settled.get(title)
+                if settled_at is not None and now - settled_at < self.recheck:
+                    continue
+                self.settled.pop(title, None)
+                self.pending[title] = {"priority": priority, "attempts": 0, "next_at": now, "error": None}
+                added += 1
+            if added:
+                self.stats["enqueued"] += added
+                self._save()
+                self._cond.notify()
+        return added
+
+    # ---------- 调度 ----------
+    def _next_due(self, now):
+        """(到期条目中优先级最高的标题, 最早的到期时间)"""
+        best = None
+        earliest = None
+        for title, item in self.pending.items():
+            if item["next_at"] <= now:
+                if best is None or item["priority"] > self.pending[best]["priority"]:
+                    best = title
+            elif earliest is None or item["next_at"] < earliest:
+                earliest = item["next_at"]
+        return best, earliest
+
+    def _run(self):
+        last = 0.0
+        busy = False
+        while True:
+            with self._cond:
+                title, earliest = self._next_due(time.time())
+                if title is None and self._dirty:
+                    self._save()
+            if title is None and busy and self.on_idle is not None:
+                busy = False
+                try:
+                    self.on_idle()
+                except Exception as e:
+                    print(f"[ERROR] 补全队列回调失败: {e}", flush=True)
+            with self._cond:
+                while True:
+                    now = time.time()
+                    title, earliest = self._next_due(now)
+                    if title is not None:
+                        break
+                    self._cond.wait(None if earliest is None else earliest - now)
+            busy = True
+            # 限速：两次请求之间至少间隔 interval
+            wait = last + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last = time.monotonic()
+            self._process(title)
+
+    def _process(self, title):
+        error = retry_after = None
+        try:
+            self.handler(title)
+        except CircuitOpen as e:
+            # 上游熔断时不计失败次数，等熔断结束再试
+            retry_after = e.retry_after
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        with self._cond:
+            item = self.pending.get(title)
+            if item is None:
+                return
+            if retry_after is not None:
+                item["next_at"] = time.time() + retry_after
+            elif error is None:
+                del self.pending[title]
+                self.settled[title] = time.time()
+                self.stats["done"] += 1
+            else:
+                item["attempts"] += 1
+                item["error"] = error
+                if item["attempts"] >= self.max_attempts:
+                    del self.pending[title]
+                    self.settled[title] = time.time()
+                    self.stats["gave_up"] += 1
+                    print(f"[WARN] 补全 {title} 连续失败 {item['attempts']} 次，暂时放弃: {error}", flush=True)
+                else:
+                    delay = min(self.max_backoff, self.backoff * 2 ** (item["attempts"] - 1))
+                    item["next_at"] = time.time() + delay * random.uniform(0.8, 1.2)
+                    self.stats["retried"] += 1
+            self._dirty += 1
+            if self._dirty >= SAVE_EVERY:
+                self._save()
+
+    def _save(self):
+        now = time.time()
+        self.settled = {t: at for t, at in self.settled.items() if now - at < self.recheck}
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"pending": self.pending, "settled": self.settled}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._dirty = 0
+        except OSError as e:
+            print(f"[ERROR] 保存补全队列失败: {e}", flush=True)
+
+    # ---------- 线程 ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="info-backfill")
+            self._thread.start()
+
+    def __len__(self):
+        return len(self.pending)
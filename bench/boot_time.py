@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+冷启动耗时：从启动 `python app.py` 到第一个请求 (GET /) 返回 200 的时间
+
+每轮启动一个新进程 (指向本地假上游)，轮询端口直到首页可用，记录耗时后结束进程。
+最后一轮开启 ANIMEONE_BOOT_PROFILE=1，打印服务端的分阶段耗时和最重的导入。
+
+用法:
+    python bench/boot_time.py --runs 5 --target 1.0
+超过 --target (秒) 时以非零状态退出，可用于部署前检查。
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import statistics
+
+import httpx
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from bench.fake_upstream import FakeUpstream  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def boot_once(env, profile=False, timeout=30.0):
+    """返回 (到第一个成功请求的秒数, 服务端输出)"""
+    port = free_port()
+    env = dict(env, ANIMEONE_PORT=str(port), PYTHONUNBUFFERED="1")
+    if profile:
+        env["ANIMEONE_BOOT_PROFILE"] = "1"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "app.py"], cwd=BASE_DIR, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        with httpx.Client(timeout=1.0) as c:
+            while time.perf_counter() - t0 < timeout:
+                try:
+                    if c.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                        return time.perf_counter() - t0, _drain(proc)
+                except httpx.TransportError:
+                    pass
+                if proc.poll() is not None:
+                    break
+                time.sleep(0.005)
+        raise RuntimeError(f"服务未能启动:\n{_drain(proc)}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def _drain(proc):
+    if proc.poll() is None:
+        proc.kill()
+    return proc.communicate()[0] or ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动到第一个请求的耗时")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--size", type=int, default=2000, help="假上游的番剧数")
+    parser.add_argument("--target", type=float, default=0, help="中位数超过该秒数时返回非零状态")
+    args = parser.parse_args()
+
+    fake = FakeUpstream(size=args.size, video_mb=0)
+    fake.start()
+    # 每轮结束时直接杀掉服务进程，正在传输的番剧列表会断开，不打印这类错误
+    fake.server.handle_error = lambda request, client_address: None
+    # 不启动后台补全，避免把假上游的封面写进 static/json 和 local_covers
+    env = dict(os.environ, ANIMEONE_INFO_BACKFILL="0", **fake.env())
+
+    times = []
+    for i in range(args.runs):
+        seconds, _ = boot_once(env)
+        times.append(seconds)
+        print(f"  第 {i + 1} 次: {seconds * 1000:.0f} ms", flush=True)
+    median = statistics.median(times)
+    print(f"冷启动到第一个请求: 中位数 {median * 1000:.0f} ms, 最快 {min(times) * 1000:.0f} ms", flush=True)
+
+    _, output = boot_once(env, profile=True)
+    lines = output.splitlines()
+    start = next((i for i, line in enumerate(lines) if "启动分析" in line), None)
+    if start is not None:
+        end = start + 1
+        while end < len(lines) and (lines[end].startswith(" ") or not lines[end].startswith("[")):
+            end += 1
+        print("\n".join(lines[start:end]))
+
+    if args.target and median > args.target:
+        print(f"[FAIL] 超过目标 {args.target * 1000:.0f} ms", flush=True)
+        sys.exit(1)
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
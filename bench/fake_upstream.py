@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+本地假上游，用于压测和离线调试
+
+模拟 anime1.me / v.anime1.me / api.bgm.tv 的接口，数据按番剧 id 确定性生成：
+    GET  /animelist.json            番剧列表 (条目数可调)
+    GET  /?cat=<id>[&paged=<n>]     分类页 (带 data-apireq 的 article 列表和翻页导航)
+    GET  /<year>年<season>新番       季度表页面
+    POST /api                       播放令牌解析，返回视频地址和 Cookie
+    GET  /video/<name>.mp4          支持 Range 的合成视频
+    GET  /bgm/search/subject/<kw>   bgm.tv 搜索结果 (简介 + 封面地址)
+    GET  /img/<name>.jpg            封面图片
+
+单独运行:
+    python bench/fake_upstream.py --port 8901 --size 2000
+然后用环境变量让服务指向它:
+    ANIMEONE_UPSTREAM=http://127.0.0.1:8901 ANIMEONE_VIDEO_API=http://127.0.0.1:8901/api \\
+    ANIMEONE_BGM_API=http://127.0.0.1:8901/bgm python app.py
+"""
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+import urllib.parse
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PAGE_SIZE = 14
+BLOCK = 4096
+WORDS = ["異世界", "轉生", "魔法", "戀愛", "學園", "冒險", "龍", "騎士", "貓", "偶像",
+         "惡役", "千金", "勇者", "魔王", "後宮", "機器人", "偵探", "料理", "黑歷史", "公主"]
+SEASONS = ["冬季", "春季", "夏季", "秋季"]
+STATUSES = ["連載中", "連載中(04)", "1-12", "1-24", "劇場版", "OVA"]
+
+
+def make_video(size):
+    """每 4KB 块写入自己的块号，方便校验代理返回的字节是否错位"""
+    return b"".join(k.to_bytes(4, 'big') * (BLOCK // 4) for k in range(size // BLOCK))
+
+
+def anime_title(anime_id):
+    rnd = random.Random(anime_id)
+    title = "".join(rnd.sample(WORDS, rnd.randint(2, 4)))
+    if anime_id % 7 == 0:
+        title += " 第二季"
+    return f"{title}{anime_id}"
+
+
+def anime_season(anime_id):
+    year = 2017 + anime_id % 9
+    return year, SEASONS[anime_id % 4]
+
+
+def episode_count(anime_id):
+    if anime_id % 50 == 0:
+        return 150
+    return (anime_id * 7919) % 26 + 1
+
+
+def episode_title(title, n, anime_id):
+    if anime_id % 11 == 0 and n % 5 == 0:
+        return f"{title} OVA {n // 5}"
+    if anime_id % 13 == 0 and n == 3:
+        return f"{title} [{n - 1}.5]"
+    return f"{title} [{n:02d}]"
+
+
+class FakeUpstream:
+    def __init__(self, size=2000, latency=0.0, video_mb=32, rate=0):
+        self.size = size
+        self.latency = latency
+        self.rate = rate
+        self.video = make_video(video_mb * 1024 * 1024)
+        self.stats = Counter()
+        self.video_bytes = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.base = None
+
+    # ---------- 生命周期 ----------
+    def start(self, port=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        return self.base
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+
+    def env(self):
+        """让 app.py / 脚本指向本假上游的环境变量"""
+        return {
+            "ANIMEONE_UPSTREAM": self.base,
+            "ANIMEONE_VIDEO_API": f"{self.base}/api",
+            "ANIMEONE_BGM_API": f"{self.base}/bgm",
+        }
+
+    def set_catalogue(self, size):
+        self.size = size
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+            self.video_bytes = 0
+
+    def count(self, kind):
+        with self.lock:
+            self.stats[kind] += 1
+
+    # ---------- 内容生成 ----------
+    def animelist(self):
+        items = []
+        for anime_id in range(self.size, 0, -1):
+            year, season = anime_season(anime_id)
+            status = STATUSES[anime_id % len(STATUSES)]
+            items.append([anime_id, anime_title(anime_id), status, year, season, ""])
+        # 外链条目 (id 为 0，标题里带 cat 链接)
+        items.append([0, f'<a href="https://anime1.me/?cat={self.size + 1}">{anime_title(self.size + 1)}</a>',
+                      "1-12", 2020, "春季", ""])
+        return json.dumps(items, ensure_ascii=False).encode()
+
+    def category_page(self, anime_id, page):
+        title = anime_title(anime_id)
+        total = episode_count(anime_id)
+        # 最新一集在第一页最上面
+        numbers = list(range(total, 0, -1))
+        chunk = numbers[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        if not chunk and page > 1:
+            return None
+        parts = ['<!DOCTYPE html><html><head><title>', title, '</title></head><body>',
+                 '<div id="page"><header id="masthead"><nav>menu</nav></header>',
+                 '<main id="main" class="site-main" role="main">']
+        for n in chunk:
+            token = urllib.parse.quote(json.dumps({"c": str(anime_id), "e": str(n), "t": 1700000000, "p": 0, "s": "x" * 32}))
+            parts.append(
+                f'<article id="post-{anime_id * 1000 + n}" class="post type-post status-publish">'
+                f'<header class="entry-header"><h2 class="entry-title">'
+                f'<a href="https://anime1.me/{anime_id * 1000 + n}" rel="bookmark">{episode_title(title, n, anime_id)}</a></h2>'
+                f'<div class="entry-meta"><span class="posted-on">2024-01-01</span></div></header>'
+                f'<div class="entry-content"><div class="vjscontainer">'
+                f'<video playsinline controls class="video-js vjs-big-play-centered" data-apireq="{token}" '
+                f'data-vid="{anime_id}-{n}" poster=""></video></div><p>{"內容簡介 " * 20}</p></div>'
+                f'<footer class="entry-footer"><span class="cat-links"><a href="https://anime1.me/?cat={anime_id}">{title}</a></span></footer>'
+                f'</article>'
+            )
+        if page * PAGE_SIZE < total:
+            parts.append(
+                '<nav class="navigation posts-navigation" role="navigation"><div class="nav-links">'
+                f'<div class="nav-previous"><a href="{self.base}/?cat={anime_id}&amp;paged={page + 1}">上一頁</a></div>'
+                '</div></nav>'
+            )
+        parts.append('</main></div><footer id="colophon">footer</footer></body></html>')
+        return "".join(parts).encode()
+
+    def season_page(self, year, season):
+        week = [[] for _ in range(7)]
+        for anime_id in range(1, self.size + 1):
+            if anime_season(anime_id) == (year, season):
+                week[anime_id % 7].append(anime_id)
+        rows = max((len(d) for d in week), default=0)
+        html_rows = []
+        for r in range(rows):
+            cols = []
+            for d in range(7):
+                if r < len(week[d]):
+                    aid = week[d][r]
+                    cols.append(f'<td><a href="https://anime1.me/?cat={aid}">{anime_title(aid)}</a></td>')
+                else:
+                    cols.append('<td></td>')
+            html_rows.append("<tr>" + "".join(cols) + "</tr>")
+        return ("<html><body><table><thead><tr>" + "<th>d</th>" * 7 + "</tr></thead><tbody>"
+                + "".join(html_rows) + "</tbody></table></body></html>").encode()
+
+    def bgm_search(self, keyword):
+        digest = zlib.crc32(keyword.encode()) % 100000
+        if digest % 10 == 0:
+            return json.dumps({"results": 0, "list": []}).encode()
+        return json.dumps({"results": 1, "list": [{
+            "id": digest,
+            "name": keyword,
+            "summary": f"{keyword} 的简介。" * 5,
+            # 部分条目共用同一张图片，用来验证封面去重
+            "images": {"large": f"{self.base}/img/{digest % 500}.jpg"},
+        }]}, ensure_ascii=False).encode()
+
+    # ---------- HTTP ----------
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, ctype="text/html; charset=utf-8", headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+                if self.path.startswith("/api"):
+                    fake.count("token")
+                    if fake.latency:
+                        time.sleep(fake.latency)
+                    try:
+                        d = json.loads(form.get("d", ["{}"])[0])
+                        name = f"{d.get('c', '0')}-{d.get('e', '0')}"
+                    except ValueError:
+                        return self._send(400, b"{}", "application/json")
+                    body = json.dumps({"s": [{"src": f"{fake.base}/video/{name}.mp4", "type": "video/mp4"}]}).encode()
+                    return self._send(200, body, "application/json",
+                                      headers=[("Set-Cookie", "e=1700000000; path=/"), ("Set-Cookie", f"h={name}; path=/")])
+                self._send(404, b"")
+
+            def do_GET(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                path = urllib.parse.unquote(parsed.path)
+                query = urllib.parse.parse_qs(parsed.query)
+
+                if path.startswith("/video/"):
+                    fake.count("video")
+                    return self._video()
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if path == "/animelist.json":
+                    fake.count("animelist")
+                    body = fake.animelist()
+                    etag = '"%08x"' % zlib.crc32(body)
+                    if self.headers.get("If-None-Match") == etag:
+                        return self._send(304, b"", headers=[("ETag", etag)])
+                    return self._send(200, body, "application/json", headers=[("ETag", etag)])
+                if path == "/" and "cat" in query:
+                    fake.count("category")
+                    page = int(query.get("paged", ["1"])[0])
+                    body = fake.category_page(int(query["cat"][0]), page)
+                    if body is None:
+                        return self._send(404, b"<html><body>Not Found</body></html>")
+                    return self._send(200, body)
+                if path.endswith("新番") and "年" in path:
+                    fake.count("season")
+                    year, _, season = path.strip("/")[:-2].partition("年")
+                    return self._send(200, fake.season_page(int(year), season))
+                if path.startswith("/bgm/search/subject/"):
+                    fake.count("bgm")
+                    return self._send(200, fake.bgm_search(path[len("/bgm/search/subject/"):]), "application/json")
+                if path.startswith("/img/"):
+                    fake.count("image")
+                    name = path[len("/img/"):]
+                    return self._send(200, b"\xff\xd8\xff\xe0" + name.encode() * 64, "image/jpeg")
+                self._send(404, b"")
+
+            def _video(self):
+                video = fake.video
+                total = len(video)
+                start, end = 0, total - 1
+                rng = self.headers.get('Range')
+                if rng and rng.startswith('bytes='):
+                    a, _, b = rng[6:].partition('-')
+                    start = int(a) if a else 0
+                    end = min(int(b), total - 1) if b else total - 1
+                self.send_response(206 if rng else 200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                if rng:
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+                self.end_headers()
+                pos = start
+                piece = 64 * 1024
+                try:
+                    while pos <= end:
+                        data = video[pos:min(pos + piece, end + 1)]
+                        self.wfile.write(data)
+                        with fake.lock:
+                            fake.video_bytes += len(data)
+                        pos += len(data)
+                        if fake.rate:
+                            time.sleep(len(data) / fake.rate)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假上游")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--size", type=int, default=2000, help="番剧数量")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟 (秒)")
+    parser.add_argument("--video-mb", type=int, default=32)
+    args = parser.parse_args()
+
+    fake = FakeUpstream(size=args.size, latency=args.latency, video_mb=args.video_mb)
+    fake.start(args.port)
+    print(f"[INFO] 假上游已启动: {fake.base}")
+    for k, v in fake.env().items():
+        print(f"    {k}={v}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
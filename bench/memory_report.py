@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+番剧目录内存占用报告
+
+用 tracemalloc 比较旧的字典表示 (ANIME_DB 字典 + ANIME_METADATA 字典 + 嵌套 playback)
+和 catalogue.AnimeRecord 表示在不同目录规模下的内存。
+标题等输入字符串在计量前生成，两种表示共享，不计入结果。
+
+用法:
+    python bench/memory_report.py --sizes 2000,50000,200000
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+from opencc import OpenCC
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from catalogue import AnimeRecord  # noqa: E402
+from bench.fake_upstream import anime_title, anime_season, STATUSES  # noqa: E402
+
+cc = OpenCC('t2s')
+
+
+def make_inputs(size):
+    """模拟 update_database 读到的原始条目和用户数据"""
+    rnd = random.Random(size)
+    rows = []
+    cover_map = {}
+    for anime_id in range(size, 0, -1):
+        title_tc = anime_title(anime_id)
+        title_sc = cc.convert(title_tc)
+        year, season = anime_season(anime_id)
+        # 新建字符串模拟 JSON 解析结果：同样的状态/年份每条都是独立对象
+        status = "".join(STATUSES[anime_id % len(STATUSES)])
+        initials = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(len(title_sc)))
+        rows.append((str(anime_id), title_sc, title_tc, status, "%d" % year, "".join(season), initials))
+        if rnd.random() < 0.8:
+            cover_map[title_sc] = "%02x/%02x/%s.jpg" % (rnd.randrange(256), rnd.randrange(256), "0" * 64)
+    ids = [r[0] for r in rows]
+    playback = {i: {"episode_title": "05", "playback_position": 120.5, "timestamp": "2024-01-01T00:00:00"}
+                for i in rnd.sample(ids, max(1, size // 20))}
+    favorites = set(rnd.sample(ids, max(1, size // 50)))
+    desc_map = {r[1]: "简介" for r in rows[::3]}
+    return rows, cover_map, playback, favorites, desc_map
+
+
+def build_legacy(rows, cover_map, playback, favorites, desc_map):
+    db = []
+    for anime_id, title_sc, title_tc, status, year, season, initials in rows:
+        db.append({
+            "id": anime_id, "title": title_sc, "status": status, "year": year, "season": season,
+            "_search": f"{title_sc}|{title_tc}|{initials}".lower()
+        })
+    metadata = {}
+    for anime in db:
+        title = anime['title']
+        meta = {
+            'id': anime['id'], 'title': title, 'status': anime['status'],
+            'year': anime['year'], 'season': anime['season'],
+            'cover': None, 'description': None, 'is_favorite': False, 'playback': None
+        }
+        if cover_map.get(title):
+            meta['cover'] = f"/covers/{cover_map[title]}"
+        if title in desc_map:
+            meta['description'] = desc_map[title]
+        meta['is_favorite'] = anime['id'] in favorites
+        record = playback.get(anime['id'])
+        if record:
+            meta['playback'] = {
+                'episode_title': record.get('episode_title', ''),
+                'position': record.get('playback_position', 0),
+                'last_played': record.get('timestamp', '')
+            }
+        metadata[anime['id']] = meta
+    return db, metadata
+
+
+def build_compact(rows, cover_map, playback, favorites, desc_map):
+    db = []
+    for anime_id, title_sc, title_tc, status, year, season, initials in rows:
+        db.append(AnimeRecord(anime_id, title_sc, status, year, season,
+                              f"{title_sc}|{title_tc}|{initials}".lower()))
+    for record in db:
+        record.cover_file = cover_map.get(record.title) or None
+        record.is_favorite = record.id in favorites
+        record.playback_record = playback.get(record.id)
+    return db, {record.id: record for record in db}
+
+
+def measure(builder, inputs):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = builder(*inputs)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="番剧目录内存占用报告")
+    parser.add_argument("--sizes", default="2000,50000,200000")
+    args = parser.parse_args()
+
+    print(f"{'size':>8}{'legacy MB':>12}{'compact MB':>12}{'legacy B/条':>13}{'compact B/条':>14}{'ratio':>8}")
+    for size in [int(x) for x in args.sizes.split(",") if x]:
+        inputs = make_inputs(size)
+        legacy = measure(build_legacy, inputs)
+        compact = measure(build_compact, inputs)
+        print(f"{size:>8}{legacy / 1048576:>12.1f}{compact / 1048576:>12.1f}"
+              f"{legacy / size:>13.0f}{compact / size:>14.0f}{legacy / compact:>7.1f}x", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+集数解析的金标准校验 + 解析耗时基准
+
+bench/golden/ 下每个 *.html 都有同名的 *.json 作为期望输出。
+两个解析引擎 (regex / bs4) 都必须与期望输出完全一致，否则返回 1。
+之后用假上游生成的多页分类 (150 集的长篇) 比较各引擎的解析耗时。
+
+用法:
+    python bench/parse_bench.py                    # 校验 + 基准
+    python bench/parse_bench.py --check-only
+    python bench/parse_bench.py --update-golden    # 解析器行为有意变更后重新生成期望输出 (以 bs4 为准)
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+from opencc import OpenCC
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import episode_parser  # noqa: E402
+from bench.fake_upstream import FakeUpstream, PAGE_SIZE, episode_count  # noqa: E402
+
+GOLDEN_DIR = os.path.join(BASE_DIR, "bench", "golden")
+cc = OpenCC('t2s')
+
+
+def engines():
+    return ["regex", "bs4"]
+
+
+def fake_pages(anime_id):
+    """生成某部番剧分类的全部页面"""
+    fake = FakeUpstream(video_mb=0)
+    fake.base = "https://anime1.me"
+    pages = []
+    page = 1
+    while True:
+        body = fake.category_page(anime_id, page)
+        if body is None:
+            break
+        pages.append(body.decode('utf-8'))
+        if page * PAGE_SIZE >= episode_count(anime_id):
+            break
+        page += 1
+    return pages
+
+
+# ================= 金标准 =================
+def golden_files():
+    return sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.html")))
+
+
+def update_golden():
+    for path in golden_files():
+        with open(path, 'r', encoding='utf-8') as f:
+            page = f.read()
+        expected = episode_parser.parse_episode_page(page, convert=cc.convert, engine="bs4")
+        out = path[:-5] + ".json"
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(expected, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"[SUCCESS] 已更新 {os.path.relpath(out, BASE_DIR)}")
+
+
+def check_golden():
+    ok = True
+    for path in golden_files():
+        with open(path, 'r', encoding='utf-8') as f:
+            page = f.read()
+        with open(path[:-5] + ".json", 'r', encoding='utf-8') as f:
+            expected = json.load(f)
+        for engine in engines():
+            got = episode_parser.parse_episode_page(page, convert=cc.convert, engine=engine)
+            name = os.path.basename(path)
+            if got == expected:
+                print(f"[SUCCESS] {name:<28} {engine}")
+                continue
+            ok = False
+            print(f"[ERROR] {name:<28} {engine} 与期望输出不一致")
+            for i, (g, e) in enumerate(zip(got or [], expected)):
+                if g != e:
+                    print(f"        #{i}: 期望 {e}\n             实际 {g}")
+                    break
+            else:
+                print(f"        条目数: 期望 {len(expected)} 实际 {len(got or [])}")
+    return ok
+
+
+# ================= 基准 =================
+def bench(ids, rounds):
+    categories = {anime_id: fake_pages(anime_id) for anime_id in ids}
+    total_pages = sum(len(p) for p in categories.values())
+    total_eps = sum(episode_count(i) for i in ids)
+    total_kb = sum(len(p) for pages in categories.values() for p in pages) / 1024
+    print(f"\n{len(ids)} 个分类, {total_pages} 页, {total_eps} 集, {total_kb:.0f} KB HTML, 每引擎 {rounds} 轮")
+    print(f"{'engine':<8}{'total ms':>10}{'ms/page':>10}{'us/ep':>9}{'speedup':>9}")
+
+    results = {}
+    for engine in engines():
+        best = None
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for pages in categories.values():
+                index = 0
+                for page in pages:
+                    articles = episode_parser.extract_articles(page, engine)
+                    index += len(episode_parser.build_episodes(articles, cc.convert, index))
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        results[engine] = best
+
+    base = results["bs4"]
+    for engine, t in results.items():
+        print(f"{engine:<8}{t * 1000:>10.1f}{t * 1000 / total_pages:>10.2f}"
+              f"{t * 1e6 / total_eps:>9.1f}{base / t:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="集数解析校验与基准")
+    parser.add_argument("--check-only", action="store_true")
+    parser.add_argument("--update-golden", action="store_true")
+    parser.add_argument("--ids", default="50,100,150,143,7", help="参与基准的番剧 id (id 为 50 的倍数时有 150 集)")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.update_golden:
+        update_golden()
+        return
+    if not check_golden():
+        sys.exit(1)
+    if not args.check_only:
+        bench([int(x) for x in args.ids.split(",") if x], args.rounds)
+
+
+if __name__ == '__main__':
+    main()
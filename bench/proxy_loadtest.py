@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+video_proxy 压测脚本
+
+本地起假上游 (bench/fake_upstream.py) 和真实的 Flask 服务，模拟浏览器播放时的请求模式
+（探测后立即中断、尾部 moov 读取、重叠的重复请求、拖动进度条），
+分别在直连模式和共享流模式下统计上游连接数和每观看分钟的上游字节数。
+
+用法:
+    python bench/proxy_loadtest.py --viewers 8 --size-mb 64
+"""
+import os
+import sys
+import time
+import base64
+import argparse
+import threading
+
+import httpx
+from werkzeug.serving import make_server
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.chdir(BASE_DIR)
+# 所有观看者来自同一个地址，不关掉按客户端限速时多余的流会被 503 拒绝并计为内容不符
+os.environ["ANIMEONE_RATE_LIMIT"] = "0"
+
+import app as server  # noqa: E402
+from bench.fake_upstream import FakeUpstream  # noqa: E402
+
+BITRATE_BPS = 2_000_000  # 计算"观看分钟"用的码率
+
+
+def fetch(base, u, start, limit, video, errors):
+    """读取 limit 字节后主动断开；返回实际收到的字节数"""
+    got = 0
+    headers = {"Range": f"bytes={start}-"}
+    with httpx.Client(timeout=60.0) as c:
+        with c.stream("GET", f"{base}/video_proxy?u={u}", headers=headers) as r:
+            for chunk in r.iter_bytes():
+                expect = video[start + got:start + got + len(chunk)]
+                if chunk != expect[:len(chunk)]:
+                    errors.append(f"mismatch at {start + got}")
+                    break
+                got += len(chunk)
+                if got >= limit:
+                    break
+    return got
+
+
+def viewer(base, upstream_url, video, watch_bytes, errors, watched):
+    u = base64.urlsafe_b64encode(upstream_url.encode()).decode()
+    total = len(video)
+
+    def run(*jobs):
+        ts = [threading.Thread(target=j) for j in jobs]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+    # 1. 首次打开：探测请求 + 正式播放请求几乎同时发出
+    run(lambda: fetch(base, u, 0, 128 * 1024, video, errors),
+        lambda: watched.append(fetch(base, u, 0, watch_bytes, video, errors)))
+    # 2. 读取尾部 moov
+    fetch(base, u, total - 512 * 1024, 512 * 1024, video, errors)
+    # 3. 拖动进度条：重复的重叠请求很快被取消
+    seek = total // 2 + 1234
+    run(lambda: fetch(base, u, seek, 64 * 1024, video, errors),
+        lambda: fetch(base, u, seek + 32 * 1024, 64 * 1024, video, errors),
+        lambda: watched.append(fetch(base, u, seek, watch_bytes // 2, video, errors)))
+
+
+def run_mode(shared, args, fake, proxy_base):
+    server.PROXY_SHARED_STREAMS = shared
+    fake.reset_stats()
+    video = fake.video
+    errors = []
+    watched = []
+    t0 = time.perf_counter()
+    threads = [
+        threading.Thread(target=viewer, args=(
+            proxy_base, f"{fake.base}/video/{i}.mp4", video,
+            args.watch_mb * 1024 * 1024, errors, watched))
+        for i in range(args.viewers)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    # 给上游一点时间记录被中断连接的字节数
+    time.sleep(0.5)
+    minutes = sum(watched) / (BITRATE_BPS / 8) / 60
+    connections = fake.stats["video"]
+    upstream_mb = fake.video_bytes / 1024 / 1024
+    return {
+        "mode": "shared" if shared else "direct",
+        "upstream_connections": connections,
+        "upstream_mb": upstream_mb,
+        "watched_minutes": minutes,
+        "conn_per_min": connections / minutes if minutes else 0,
+        "mb_per_min": upstream_mb / minutes if minutes else 0,
+        "seconds": elapsed,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="video_proxy 压测")
+    parser.add_argument("--viewers", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--watch-mb", type=int, default=16)
+    parser.add_argument("--rate-mbps", type=float, default=0, help="单连接上游限速 (MB/s)，0 为不限速")
+    args = parser.parse_args()
+
+    fake = FakeUpstream(video_mb=args.size_mb, rate=args.rate_mbps * 1024 * 1024)
+    fake.start()
+
+    proxy = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    proxy_base = f"http://127.0.0.1:{proxy.server_port}"
+
+    rows = [run_mode(False, args, fake, proxy_base),
+            run_mode(True, args, fake, proxy_base)]
+
+    print(f"{'mode':<8}{'conns':>8}{'up MB':>10}{'watch min':>11}{'conn/min':>10}{'MB/min':>9}{'sec':>8}{'err':>5}")
+    for r in rows:
+        print(f"{r['mode']:<8}{r['upstream_connections']:>8}{r['upstream_mb']:>10.1f}{r['watched_minutes']:>11.2f}"
+              f"{r['conn_per_min']:>10.2f}{r['mb_per_min']:>9.2f}{r['seconds']:>8.2f}{r['errors']:>5}")
+
+    proxy.shutdown()
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+接口基准测试
+
+启动假上游 (bench/fake_upstream.py) 和真实的 Flask 服务，按不同的番剧数量和并发数
+压测各个接口，输出吞吐量和 p50/p99 延迟，并可与保存的基线对比。
+
+用法:
+    python bench/run_bench.py                                  # 默认规模
+    python bench/run_bench.py --sizes 2000,50000 --concurrency 1,8,32
+    python bench/run_bench.py --save-baseline before           # 保存为 bench/baselines/before.json
+    python bench/run_bench.py --compare before                 # 与基线对比，p99 退化超过容差时返回 1
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+import urllib.parse
+
+import httpx
+from werkzeug.serving import make_server
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.chdir(BASE_DIR)
+
+from bench.fake_upstream import FakeUpstream, anime_title  # noqa: E402
+
+BASELINE_DIR = os.path.join(BASE_DIR, "bench", "baselines")
+
+# 假上游必须在导入 app 之前启动，app 在导入时读取上游地址
+FAKE = FakeUpstream()
+FAKE.start()
+os.environ.update(FAKE.env())
+# 压测从同一个地址发出所有请求，不关掉按客户端限速会测到大量 429 / 503
+os.environ["ANIMEONE_RATE_LIMIT"] = "0"
+
+import app as server  # noqa: E402
+
+
+# ================= 各接口的请求生成 =================
+def path_list(rnd, size):
+    return "/api/list?page=%d" % rnd.randint(1, max(1, min(size // 24, 50)))
+
+
+def path_list_search(rnd, size):
+    # 取一个真实标题的片段作为关键字
+    title = anime_title(rnd.randint(1, size))
+    start = rnd.randint(0, max(0, len(title) - 3))
+    return "/api/list?q=" + urllib.parse.quote(title[start:start + 2])
+
+
+def path_season_schedule(rnd, size):
+    year = rnd.randint(2017, 2025)
+    season = rnd.choice(["冬季", "春季", "夏季", "秋季"])
+    return f"/api/season_schedule?year={year}&season={urllib.parse.quote(season)}"
+
+
+def path_episodes(rnd, size):
+    return "/api/episodes?id=%d" % rnd.randint(1, size)
+
+
+def path_video_proxy(rnd, size):
+    u = base64.urlsafe_b64encode(f"{FAKE.base}/video/{rnd.randint(1, 20)}.mp4".encode()).decode()
+    return f"/video_proxy?u={u}"
+
+
+ENDPOINTS = {
+    "list": path_list,
+    "list_search": path_list_search,
+    "season_schedule": path_season_schedule,
+    "episodes": path_episodes,
+    "video_proxy": path_video_proxy,
+}
+
+VIDEO_READ = 256 * 1024
+
+
+# ================= 压测 =================
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run_load(base, name, size, concurrency, duration):
+    make_path = ENDPOINTS[name]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        local = []
+        errs = 0
+        with httpx.Client(base_url=base, timeout=30.0) as c:
+            while time.perf_counter() < deadline:
+                path = make_path(rnd, size)
+                t0 = time.perf_counter()
+                try:
+                    if name == "video_proxy":
+                        start = rnd.randint(0, 64) * 64 * 1024
+                        headers = {"Range": f"bytes={start}-"}
+                        got = 0
+                        with c.stream("GET", path, headers=headers) as r:
+                            for chunk in r.iter_bytes():
+                                got += len(chunk)
+                                if got >= VIDEO_READ:
+                                    break
+                        ok = r.status_code in (200, 206)
+                    else:
+                        r = c.get(path)
+                        ok = r.status_code == 200 and r.json().get("code") in (200, 404)
+                except Exception:
+                    ok = False
+                local.append(time.perf_counter() - t0)
+                if not ok:
+                    errs += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += errs
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "size": size,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors[0],
+    }
+
+
+def load_catalogue(size):
+    FAKE.set_catalogue(size)
+    server.update_database()
+
+
+# ================= 基线 =================
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name, results):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), 'w', encoding='utf-8') as f:
+        json.dump({"created": time.strftime('%Y-%m-%d %H:%M:%S'), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"[SUCCESS] 基线已保存: {baseline_path(name)}")
+
+
+def compare(name, results, tolerance):
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        print(f"[ERROR] 基线不存在: {path}")
+        return False
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = {(r["endpoint"], r["size"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    ok = True
+    print(f"\n对比基线 {name} (容差 {tolerance:.0%})")
+    print(f"{'endpoint':<18}{'size':>8}{'conc':>6}{'rps':>18}{'p99 ms':>22}")
+    for r in results:
+        b = baseline.get((r["endpoint"], r["size"], r["concurrency"]))
+        if not b:
+            continue
+        rps_delta = (r["rps"] - b["rps"]) / b["rps"] if b["rps"] else 0.0
+        p99_delta = (r["p99_ms"] - b["p99_ms"]) / b["p99_ms"] if b["p99_ms"] else 0.0
+        flag = ""
+        if p99_delta > tolerance:
+            flag = "  <-- 退化"
+            ok = False
+        print(f"{r['endpoint']:<18}{r['size']:>8}{r['concurrency']:>6}"
+              f"{b['rps']:>8.0f} ->{r['rps']:>6.0f} ({rps_delta:+.0%})"
+              f"{b['p99_ms']:>8.1f} ->{r['p99_ms']:>6.1f} ({p99_delta:+.0%}){flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接口基准测试")
+    parser.add_argument("--sizes", default="2000,20000", help="番剧数量，逗号分隔")
+    parser.add_argument("--concurrency", default="1,8", help="并发数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=3.0, help="每组压测时长 (秒)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="要压测的接口，逗号分隔")
+    parser.add_argument("--latency", type=float, default=0.0, help="假上游每个请求的模拟延迟 (秒)")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p99 允许退化的比例")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    levels = [int(x) for x in args.concurrency.split(",") if x]
+    endpoints = [x for x in args.endpoints.split(",") if x]
+    FAKE.latency = args.latency
+
+    app_server = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{app_server.server_port}"
+
+    results = []
+    print(f"{'endpoint':<18}{'size':>8}{'conc':>6}{'reqs':>8}{'rps':>9}{'p50 ms':>9}{'p99 ms':>9}{'err':>6}")
+    for size in sizes:
+        load_catalogue(size)
+        for name in endpoints:
+            for level in levels:
+                r = run_load(base, name, size, level, args.duration)
+                results.append(r)
+                print(f"{r['endpoint']:<18}{r['size']:>8}{r['concurrency']:>6}{r['requests']:>8}"
+                      f"{r['rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['errors']:>6}", flush=True)
+
+    app_server.shutdown()
+    FAKE.shutdown()
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare and not compare(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
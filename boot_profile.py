@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时分析
+
+设置 ANIMEONE_BOOT_PROFILE=1 后：
+  - 统计之后导入的每个顶层模块的耗时 (包含其依赖，以及扣除依赖的自身耗时)
+  - app.py 用 phase() 标出的各个启动阶段 (JSON 加载、封面扫描、元数据构建……) 的耗时
+  - 第一个请求到达时打印报告，包括从进程启动到第一个请求的时间
+
+未开启时 phase() 只是一个空的上下文管理器，不影响正常启动。
+本模块必须在其他模块之前导入，否则更早的导入不会被统计。
+
+    ANIMEONE_BOOT_PROFILE=1 python app.py
+    python bench/boot_time.py          # 多次冷启动取中位数
+"""
+import os
+import sys
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("ANIMEONE_BOOT_PROFILE", "") == "1"
+TOP_IMPORTS = 15
+
+try:
+    # 解释器启动时间 (Linux)，取不到时以本模块导入时间为起点
+    _clock_ticks = os.sysconf("SC_CLK_TCK")
+    with open("/proc/self/stat") as f:
+        _start_ticks = int(f.read().rpartition(")")[2].split()[19])
+    with open("/proc/uptime") as f:
+        _uptime = float(f.read().split()[0])
+    STARTED = time.perf_counter() - (_uptime - _start_ticks / _clock_ticks)
+except (OSError, ValueError, AttributeError, IndexError):
+    STARTED = time.perf_counter()
+
+PHASES = []    # [(阶段名, 秒)]，按完成顺序
+IMPORTS = {}   # 模块名 -> [含依赖耗时, 自身耗时]
+_reported = False
+_lock = threading.Lock()
+
+
+@contextmanager
+def phase(name):
+    if not ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASES.append((name, time.perf_counter() - t0))
+
+
+def mark(name):
+    """记录一个时间点 (距进程启动)，如 "ready" """
+    if ENABLED:
+        PHASES.append((f"@{name}", time.perf_counter() - STARTED))
+
+
+# ================= 导入计时 =================
+_original_import = builtins.__import__
+_stack = []  # 正在导入的 [顶层包名, 其中导入其他包花的时间]
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # 只统计首次的绝对导入；其他线程的导入直接放行，避免计时错乱
+    if level or name in sys.modules or threading.current_thread() is not threading.main_thread():
+        return _original_import(name, globals, locals, fromlist, level)
+    top = name.partition(".")[0]
+    frame = [top, 0.0]
+    _stack.append(frame)
+    t0 = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - t0
+        _stack.pop()
+        parent = _stack[-1] if _stack else None
+        if parent is not None and parent[0] == top:
+            # 包内子模块的导入算在外层那次里，其中导入其他包的时间继续往上传
+            parent[1] += frame[1]
+        else:
+            if parent is not None:
+                parent[1] += elapsed
+            entry = IMPORTS.setdefault(top, [0.0, 0.0])
+            if not any(f[0] == top for f in _stack):
+                entry[0] += elapsed
+            entry[1] += elapsed - frame[1]
+
+
+if ENABLED:
+    builtins.__import__ = _timed_import
+
+
+# ================= 报告 =================
+def report(out=None):
+    """打印启动报告 (只打印一次)，返回距进程启动的秒数"""
+    global _reported
+    total = time.perf_counter() - STARTED
+    with _lock:
+        if _reported or not ENABLED:
+            return total
+        _reported = True
+    builtins.__import__ = _original_import
+    out = out or sys.stdout
+    w = lambda line: print(line, file=out, flush=True)
+    w(f"[INFO] 启动分析：进程启动到第一个请求 {total * 1000:.0f} ms")
+    w(f"{'阶段':<28}{'ms':>10}")
+    for name, seconds in PHASES:
+        w(f"  {name:<26}{seconds * 1000:>10.1f}")
+    heaviest = sorted(IMPORTS.items(), key=lambda kv: kv[1][0], reverse=True)[:TOP_IMPORTS]
+    w(f"{'最重的顶层导入':<24}{'含依赖 ms':>12}{'自身 ms':>10}")
+    for name, (inclusive, own) in heaviest:
+        w(f"  {name:<24}{inclusive * 1000:>10.1f}{own * 1000:>10.1f}")
+    return total
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+番剧目录的紧凑内存表示
+
+每部番剧只有一个 AnimeRecord (__slots__，无实例字典)，ANIME_DB (排序后的列表)
+和 ANIME_METADATA (id -> 记录的索引) 引用的是同一批对象：
+  - 状态、年份、季度取值很少，用 sys.intern 共享
+  - 封面只保存 cover_map 里的相对路径，访问时再拼 /covers/ 前缀
+  - 播放记录直接引用 PLAYBACK_CACHE 中的条目，不再复制一份
+  - 介绍不进入记录，需要时按标题查 DESC_MAP
+记录支持 record['title'] 形式的读取，与原先的字典用法兼容。
+"""
+import sys
+
+_intern = sys.intern
+
+
+class AnimeRecord:
+    __slots__ = ("id", "title", "status", "year", "season", "search",
+                 "cover_file", "is_favorite", "playback_record")
+
+    def __init__(self, anime_id, title, status, year, season, search):
+        self.id = anime_id
+        self.title = title
+        self.status = _intern(status)
+        self.year = _intern(year)
+        self.season = _intern(season)
+        self.search = search
+        self.cover_file = None
+        self.is_favorite = False
+        self.playback_record = None
+
+    # ---------- 派生字段 ----------
+    @property
+    def cover(self):
+        return f"/covers/{self.cover_file}" if self.cover_file else None
+
+    @property
+    def playback(self):
+        record = self.playback_record
+        if not record:
+            return None
+        return {
+            'episode_title': record.get('episode_title', ''),
+            'position': record.get('playback_position', 0),
+            'last_played': record.get('timestamp', '')
+        }
+
+    # ---------- 兼容字典读取 ----------
+    _KEYS = frozenset(("id", "title", "status", "year", "season", "cover", "is_favorite", "playback"))
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._KEYS else default
+
+    # ---------- 快照 ----------
+    def to_row(self):
+        return [self.id, self.title, self.status, self.year, self.season, self.search]
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
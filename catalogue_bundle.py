@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+离线目录包
+
+客户端原先每次启动都要翻页拉完 /api/list，再下载整份 desc_map.json。现在每次目录刷新后
+发布一份分块的目录包，客户端保存在本地，之后只需比对清单、下载变化了的分块：
+
+  manifest.json   版本号、字段顺序、各分块的哈希 / 条数 / 字节数
+  <hash>.jsonl.gz 一个分块：gzip 压缩的 JSON Lines，每行一个数组，顺序见 manifest 的 fields
+                  列表分块: [id, 标题, 状态, 年份, 季度, 封面地址]
+                  介绍分块: [id, 介绍]，与列表分块分开，客户端需要时再下载
+
+按 id 区间分块 (每 chunk_span 个 id 一块)：新集数只改变在播番剧的状态，而在播番剧多是
+id 最大的那几块，旧番所在的分块内容不变、哈希不变，客户端不必重新下载。
+分块以未压缩内容的 sha256 命名，gzip 头部不含时间戳，同样的内容总是同样的文件。
+不再被清单引用的分块保留 grace 秒，正在按旧清单下载的客户端不会遇到 404。
+"""
+import os
+import io
+import json
+import gzip
+import time
+import hashlib
+import threading
+
+FORMAT = 1
+FIELDS = ["id", "title", "status", "year", "season", "poster"]
+DESC_FIELDS = ["id", "description"]
+MANIFEST = "manifest.json"
+SUFFIX = ".jsonl.gz"
+
+
+def _bucket(anime_id, span):
+    try:
+        return int(anime_id) // span
+    except ValueError:
+        return -1  # 非数字 id 单独一块
+
+
+def _encode(rows):
+    """rows -> (哈希, gzip 字节)；同样的行总是得到同样的字节"""
+    raw = "".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows).encode("utf-8")
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as f:
+        f.write(raw)
+    return hashlib.sha256(raw).hexdigest(), buf.getvalue()
+
+
+def is_chunk_name(name):
+    digest = name[:-len(SUFFIX)] if name.endswith(SUFFIX) else ""
+    return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest)
+
+
+class BundleStore:
+    """
+    publish() 由负责刷新的进程调用；manifest() 可在任意进程调用，按文件修改时间重新读取。
+    """
+
+    def __init__(self, folder, chunk_span=256, grace=3600):
+        self.folder = folder
+        self.chunk_span = chunk_span
+        self.grace = grace
+        self.stats = {"published": 0, "unchanged": 0, "chunks_written": 0}
+        self._cached = (None, None)  # (manifest 的 mtime_ns, 清单)
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST)
+
+    # ---------- 发布 ----------
+    def _write_chunks(self, groups):
+        """groups: {分块键: 行列表}，返回清单里的分块描述 (按键排序)"""
+        chunks = []
+        for key in sorted(groups):
+            digest, data = _encode(groups[key])
+            name = digest + SUFFIX
+            path = os.path.join(self.folder, name)
+            if not os.path.exists(path):
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                self.stats["chunks_written"] += 1
+            chunks.append({"key": key, "hash": digest, "file": name,
+                           "count": len(groups[key]), "bytes": len(data)})
+        return chunks
+
+    def publish(self, records, descriptions, updated_at=None):
+        """
+        records: AnimeRecord 列表；descriptions: 标题 -> 介绍。
+        返回 (清单, 是否有变化)。内容没有变化时不改写清单，版本号和 ETag 保持不变。
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        rows = {}
+        descs = {}
+        for record in records:
+            key = _bucket(record.id, self.chunk_span)
+            rows.setdefault(key, []).append(
+                [record.id, record.title, record.status, record.year, record.season, record.cover or ""])
+            desc = descriptions.get(record.title)
+            if desc:
+                descs.setdefault(key, []).append([record.id, desc])
+        for group in list(rows.values()) + list(descs.values()):
+            group.sort(key=lambda row: row[0])
+
+        with self._lock:
+            chunks = self._write_chunks(rows)
+            desc_chunks = self._write_chunks(descs)
+            digests = [c["hash"] for c in chunks] + ["|"] + [c["hash"] for c in desc_chunks]
+            version = hashlib.sha256("".join(digests).encode()).hexdigest()[:16]
+            old = self.manifest()
+            if old is not None and old.get("version") == version:
+                self.stats["unchanged"] += 1
+                return old, False
+            manifest = {
+                "format": FORMAT,
+                "version": version,
+                "generated_at": int(time.time()),
+                "updated_at": updated_at,
+                "count": len(records),
+                "fields": FIELDS,
+                "chunks": chunks,
+                "description_fields": DESC_FIELDS,
+                "descriptions": desc_chunks,
+            }
+            tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.manifest_path)
+            self._retire(old, manifest)
+            self._prune(manifest)
+            self.stats["published"] += 1
+            return manifest, True
+
+    def _retire(self, old, new):
+        """刚离开清单的分块把修改时间更新为现在，从此刻开始计算保留期"""
+        if old is None:
+            return
+        keep = {c["file"] for c in new["chunks"] + new["descriptions"]}
+        for c in old["chunks"] + old["descriptions"]:
+            if c["file"] not in keep:
+                try:
+                    os.utime(os.path.join(self.folder, c["file"]))
+                except OSError:
+                    pass
+
+    def _prune(self, manifest):
+        keep = {c["file"] for c in manifest["chunks"] + manifest["descriptions"]}
+        cutoff = time.time() - self.grace
+        for name in os.listdir(self.folder):
+            if not is_chunk_name(name) or name in keep:
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ---------- 读取 ----------
+    def manifest(self):
+        """当前清单，尚未发布过时返回 None"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+        cached_mtime, cached = self._cached
+        if cached_mtime == mtime:
+            return cached
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return cached
+        self._cached = (mtime, manifest)
+        return manifest
+
+    def chunk_path(self, name):
+        """分块文件路径；名字不合法或文件不存在时返回 None"""
+        if not is_chunk_name(name):
+            return None
+        path = os.path.join(self.folder, name)
+        return path if os.path.exists(path) else None
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+本地封面存在性索引
+
+启动时用 os.scandir 扫描一次封面目录（包括 ab/cd/ 两级分片目录），
+之后的查询都只查内存集合，不再逐个 stat。
+索引由下载器写入后主动更新，另有监视线程 (inotify，不可用时退化为目录 mtime 轮询)
+捕捉外部进程（例如单独运行的 download_infos.py）对目录的修改。
+inotify 只监视顶层目录；分片目录里的删除没有顶层事件，监视线程每隔 interval 秒
+比较一次各分片目录的 mtime，发现变化时重新扫描。
+"""
+import os
+import select
+import ctypes
+import ctypes.util
+import threading
+import time
+
+# inotify 事件掩码
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+# 写入分片子目录不会产生顶层目录的事件，cover_store.store_bytes 会触碰顶层目录 mtime (IN_ATTRIB)
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class CoverIndex:
+    def __init__(self, folder):
+        self.folder = folder
+        self._names = frozenset()
+        self._lock = threading.Lock()
+        self._mtimes = None  # 顶层和各分片目录的 mtime {相对路径: mtime_ns}，扫描时记录
+        self.on_change = None  # 目录被外部修改并重新扫描后的回调
+
+    # ---------- 查询 (无系统调用) ----------
+    def __contains__(self, relpath):
+        return relpath in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    # ---------- 维护 ----------
+    def scan(self):
+        """全量扫描目录，返回文件数"""
+        names = set()
+        mtimes = {}
+        try:
+            _scan_dir(self.folder, "", 2, names, mtimes)
+        except FileNotFoundError:
+            mtimes = None
+        with self._lock:
+            self._names = frozenset(names)
+            self._mtimes = mtimes
+        return len(names)
+
+    def add(self, relpath):
+        with self._lock:
+            self._names = self._names | {relpath}
+
+    def discard(self, relpath):
+        with self._lock:
+            self._names = self._names - {relpath}
+
+    def refresh_if_changed(self):
+        """顶层或任一分片目录的 mtime 变化时重新扫描，返回文件集合是否发生了变化"""
+        mtimes = {}
+        try:
+            _dir_mtimes(self.folder, "", 2, mtimes)
+        except FileNotFoundError:
+            mtimes = None
+        if mtimes == self._mtimes:
+            return False
+        before = self._names
+        self.scan()
+        return self._names != before
+
+    # ---------- 监视线程 ----------
+    def start_watcher(self, interval=10.0):
+        t = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        t.start()
+        return t
+
+    def _notify(self):
+        if self.on_change:
+            try:
+                self.on_change()
+            except Exception as e:
+                print(f"[ERROR] 封面索引回调失败: {e}", flush=True)
+
+    def _watch(self, interval):
+        fd = _inotify_open(self.folder)
+        if fd is None:
+            print("[INFO] 封面目录监视: inotify 不可用，使用 mtime 轮询", flush=True)
+            while True:
+                time.sleep(interval)
+                if self.refresh_if_changed():
+                    self._notify()
+        print("[INFO] 封面目录监视: inotify", flush=True)
+        while True:
+            try:
+                readable, _, _ = select.select([fd], [], [], interval)
+            except OSError:
+                time.sleep(interval)
+                continue
+            if readable:
+                # 批量写入时合并事件，稍等片刻再扫描
+                time.sleep(1.0)
+                _drain(fd)
+            # 超时也检查一次：分片目录里的删除不会产生 inotify 事件
+            if self.refresh_if_changed():
+                self._notify()
+
+
+def _scan_dir(path, prefix, depth, names, mtimes):
+    """收集文件相对路径和各目录 mtime；只深入两字符的分片目录"""
+    # 先取 mtime 再列目录，列目录期间的修改会在下次比较时发现
+    mtimes[prefix] = os.stat(path).st_mtime_ns
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_file():
+                if '.tmp' not in entry.name:
+                    names.add(prefix + entry.name)
+            elif depth > 0 and len(entry.name) == 2 and entry.is_dir():
+                _scan_dir(entry.path, f"{prefix}{entry.name}/", depth - 1, names, mtimes)
+
+
+def _dir_mtimes(path, prefix, depth, mtimes):
+    """只收集顶层和分片目录的 mtime，不列出文件，开销与目录数成正比"""
+    mtimes[prefix] = os.stat(path).st_mtime_ns
+    if depth == 0:
+        return
+    with os.scandir(path) as it:
+        for entry in it:
+            if len(entry.name) == 2 and entry.is_dir():
+                _dir_mtimes(entry.path, f"{prefix}{entry.name}/", depth - 1, mtimes)
+
+
+def _inotify_open(folder):
+    """打开 inotify 并监视目录，失败返回 None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(0)
+        if fd < 0:
+            return None
+        wd = libc.inotify_add_watch(fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _drain(fd):
+    """读掉已排队的事件，避免同一批修改触发多次扫描"""
+    os.set_blocking(fd, False)
+    try:
+        while os.read(fd, 64 * 1024):
+            pass
+    except (BlockingIOError, OSError):
+        pass
+    finally:
+        os.set_blocking(fd, True)
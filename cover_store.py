@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的封面存储
+
+文件按 sha256 命名并放进两级分片目录: local_covers/ab/cd/abcd....jpg
+同一张图片无论被多少个标题引用都只存一份，cover_map.json 里记录 标题 -> 相对路径。
+"""
+import os
+import re
+import time
+import hashlib
+
+_CAS_RE = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})\.[A-Za-z0-9]{2,4}$')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def relpath_for(digest, ext):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def hash_from_relpath(relpath):
+    """从分片路径取出内容哈希，旧的平铺文件名返回 None"""
+    m = _CAS_RE.match(relpath or "")
+    if m and m.group(3).startswith(m.group(1) + m.group(2)):
+        return m.group(3)
+    return None
+
+
+def normalize_ext(ext):
+    ext = (ext or "").lower()
+    if len(ext) > 4 or len(ext) < 2 or not ext.isalnum():
+        return "jpg"
+    return ext
+
+
+def store_bytes(folder, data, ext):
+    """写入封面数据，返回 (相对路径, 是否新写入)。内容已存在时不重复写"""
+    digest = content_hash(data)
+    relpath = relpath_for(digest, normalize_ext(ext))
+    abspath = os.path.join(folder, *relpath.split('/'))
+    if os.path.exists(abspath):
+        return relpath, False
+    os.makedirs(os.path.dirname(abspath), exist_ok=True)
+    tmp = f"{abspath}.tmp{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, abspath)
+    # 分片子目录里的写入不会改变顶层目录 mtime，手动触碰一下通知封面索引的监视线程
+    touch_folder(folder)
+    return relpath, True
+
+
+def touch_folder(folder):
+    """
+    让顶层目录 mtime 严格增大：文件系统时间戳粒度较粗时，同一时钟周期内的两次 utime
+    会得到相同的 mtime，封面索引的 mtime 轮询就发现不了第二次写入
+    """
+    st = os.stat(folder)
+    mtime = max(time.time_ns(), st.st_mtime_ns + 1)
+    os.utime(folder, ns=(st.st_atime_ns, mtime))
+
+
+def adopt_file(folder, src_path, ext):
+    """
+    把已有文件收入内容寻址存储（迁移用）。
+    返回 (相对路径, 是否重复内容)；重复时不移动源文件。
+    """
+    with open(src_path, 'rb') as f:
+        digest = content_hash(f.read())
+    relpath = relpath_for(digest, normalize_ext(ext))
+    abspath = os.path.join(folder, *relpath.split('/'))
+    if os.path.exists(abspath):
+        return relpath, True
+    os.makedirs(os.path.dirname(abspath), exist_ok=True)
+    os.replace(src_path, abspath)
+    return relpath, False
@@ -4,11 +4,12 @@ import time
 import json
 import re
 import html
-import hashlib
-import urllib.parse
 import httpx
 from opencc import OpenCC
 from pypinyin import pinyin, Style
+from cover_index import CoverIndex
+import cover_store
+import backfill
 
 # ================= 配置区 =================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,10 +24,14 @@ CACHE_FILE = os.path.join(BASE_DIR, "static", "json", "cover_map.json")
 # [新增] 简介映射文件
 DESC_FILE = os.path.join(BASE_DIR, "static", "json", "desc_map.json")
 MANUAL_FIXES_FILE = os.path.join(BASE_DIR, "static", "json", "manual_fixes.json")
+# 上游地址（压测时可用环境变量指向 bench/fake_upstream.py）
+ANIME1_BASE = os.environ.get("ANIMEONE_UPSTREAM", "https://anime1.me").rstrip("/")
+BGM_API = os.environ.get("ANIMEONE_BGM_API", "https://api.bgm.tv").rstrip("/")
 
 COVER_MAP = {}
 DESC_MAP = {}  # [新增] 内存中存储简介
 MANUAL_FIXES = {}
+COVER_INDEX = CoverIndex(ABS_COVER_FOLDER)
 cc = OpenCC('tw2s')
 
 HEADERS = {
@@ -62,6 +67,9 @@ def load_data():
                 MANUAL_FIXES = json.load(f)
         except:
             MANUAL_FIXES = {}
+    
+    # 一次性扫描封面目录
+    COVER_INDEX.scan()
 
 def save_cache():
     """保存封面映射"""
@@ -92,28 +100,22 @@ def get_pinyin_initials(text):
     return "".join([i[0] for i in initials]).lower()
 
 def download_image(original_title, url):
+    """下载封面并按内容哈希存入分片目录，返回相对路径（相同图片只存一份）"""
     try:
         ext = url.split('.')[-1].split('?')[0]
-        if len(ext) > 4 or len(ext) < 2:
-            ext = "jpg"
-        filename = hashlib.md5(original_title.encode('utf-8')).hexdigest() + f".{ext}"
-        
-        abs_cover_folder = os.path.join(BASE_DIR, COVER_FOLDER)
-        filepath = os.path.join(abs_cover_folder, filename)
-        
-        if os.path.exists(filepath):
-            return filename
         
         for _ in range(2):
             try:
-                print(f"Downloading {url} -> {filename}")
+                print(f"Downloading {url} ({original_title})")
                 with httpx.Client(http2=False, verify=False, timeout=10.0) as dl_client:
                     dl_client.headers.update(HEADERS)
                     res = dl_client.get(url)
                     if res.status_code == 200:
-                        with open(filepath, 'wb') as f:
-                            f.write(res.content)
-                        return filename
+                        relpath, created = cover_store.store_bytes(ABS_COVER_FOLDER, res.content, ext)
+                        if not created:
+                            print(f"   [DEDUP] Same image already stored as {relpath}")
+                        COVER_INDEX.add(relpath)
+                        return relpath
             except Exception as e:
                 print(f"Download failed: {e}")
                 time.sleep(1)
@@ -126,7 +128,7 @@ def fetch_anime_list():
     print("[INFO] Fetching anime list...")
     try:
         timestamp = int(time.time() * 1000)
-        res = client.get(f"https://anime1.me/animelist.json?_={timestamp}")
+        res = client.get(f"{ANIME1_BASE}/animelist.json?_={timestamp}")
         raw_data = res.json()
         new_db = []
         
@@ -162,14 +164,9 @@ def fetch_anime_list():
         return []
 
 def is_cover_valid(title):
-    """检查封面是否有效且文件存在"""
-    if title in COVER_MAP:
-        filename = COVER_MAP[title]
-        if filename:
-            file_path = os.path.join(ABS_COVER_FOLDER, filename)
-            if os.path.exists(file_path):
-                return True
-    return False
+    """检查封面是否有效且文件存在（查内存索引）"""
+    filename = COVER_MAP.get(title)
+    return bool(filename) and filename in COVER_INDEX
 
 def search_and_download_cover(title):
     # Logic:
@@ -199,16 +196,12 @@ def search_and_download_cover(title):
     print(f"[INFO] Searching ({', '.join(missing_items)}) for: {title} (Query: {search_query})")
     
     try:
-        encoded_key = urllib.parse.quote(search_query)
-        # [修改] 将 responseGroup 改为 large 以获取 summary
-        url = f"https://api.bgm.tv/search/subject/{encoded_key}?type=2&responseGroup=large"
-        res = client.get(url)
-        data = res.json()
+        # 与服务端后台补全共用同一套查询逻辑
+        match_item = backfill.search_bgm(client.get, BGM_API, search_query)
         
         found_match = False
         
-        if 'list' in data and len(data['list']) > 0:
-            match_item = data['list'][0]
+        if match_item is not None:
             found_match = True
 
             # --- 处理简介 (新增) ---
@@ -223,9 +216,8 @@ def search_and_download_cover(title):
 
             # --- 处理封面 (维持原逻辑) ---
             if not cover_ok:
-                img_url = match_item.get('images', {}).get('large', '')
+                img_url = backfill.cover_url(match_item, BGM_API)
                 if img_url:
-                    img_url = img_url.replace('http://', 'https://')
                     filename = download_image(title, img_url)
                     if filename:
                         COVER_MAP[title] = filename
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+anime1 分类页的多页加载
+
+长篇番剧的分类页会分成多页 (?cat=<id>&paged=<n>，最新一集在第一页最上面)，
+这里负责把所有页取回并合并成一个从新到旧的列表：
+  - 根据番剧状态里的集数 (如 "1-24"、"连载中(13)")、第一页最新一集的集数或上次的页数
+    预估总页数，第一页返回后其余页在有界线程池里并发请求；预估不足时按批继续往后翻
+  - 每个分类缓存合并后的结果，再次打开时只重新请求第一页，
+    用第一页最后一条在缓存里的位置拼接旧的部分
+  - 播放令牌带时间戳，缓存超过 full_ttl 后整页重取
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+import episode_parser
+
+_STATUS_NUM_RE = re.compile(r'(\d+)\D*$')
+
+
+def expected_episode_count(status):
+    """从番剧状态估计集数，"1-12" -> 12、"连载中(04)" -> 4，无法判断时返回 None"""
+    if not status:
+        return None
+    m = _STATUS_NUM_RE.search(status)
+    return int(m.group(1)) if m else None
+
+
+def _newest_episode_number(articles):
+    """第一页最上面一集的集数，例如 "某番 [150]" -> 150，无法判断时返回 0"""
+    for title, _ in articles[:1]:
+        if title:
+            num = episode_parser.short_title(title)
+            if num.replace('.', '', 1).isdigit():
+                return int(float(num))
+    return 0
+
+
+def _article_key(article):
+    title, token = article
+    return token or ("title", title)
+
+
+def _dedupe(articles):
+    seen = set()
+    result = []
+    for art in articles:
+        key = _article_key(art)
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(art)
+    return result
+
+
+class _Entry:
+    __slots__ = ("articles", "pages", "full_at", "checked_at")
+
+    def __init__(self, articles, pages, full_at):
+        self.articles = articles
+        self.pages = pages
+        self.full_at = full_at
+        self.checked_at = time.time()  # 最后一次成功从上游确认的时间
+
+
+class EpisodeLoader:
+    """
+    fetch(cat_id, page) 返回页面 HTML，页不存在时返回 None；
+    load() 返回 [(繁体标题或 None, token), ...]，第一页找不到 #main 时返回 None。
+    """
+
+    def __init__(self, fetch, max_workers=8, cache_size=256, full_ttl=3600):
+        self.fetch = fetch
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.full_ttl = full_ttl
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="episode-page")
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._key_locks = {}
+        self.stats = {"pages_fetched": 0, "stitched": 0, "full_loads": 0}
+
+    # ---------- 缓存 ----------
+    def _get(self, cat_id):
+        with self._cache_lock:
+            entry = self._cache.get(cat_id)
+            if entry is not None:
+                self._cache.move_to_end(cat_id)
+            return entry
+
+    def _put(self, cat_id, entry):
+        with self._cache_lock:
+            self._cache[cat_id] = entry
+            self._cache.move_to_end(cat_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def cached(self, cat_id):
+        """上游不可用时的兜底：返回 (最后一次成功加载的列表, 距今秒数)，没有缓存时返回 None"""
+        entry = self._get(cat_id)
+        if entry is None:
+            return None
+        return entry.articles, time.time() - entry.checked_at
+
+    def invalidate(self, cat_id=None):
+        with self._cache_lock:
+            if cat_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(cat_id, None)
+
+    def _lock_for(self, cat_id):
+        # 同一分类的并发请求排队，第二个请求直接用上一个的结果拼接
+        with self._cache_lock:
+            lock = self._key_locks.get(cat_id)
+            if lock is None:
+                if len(self._key_locks) > self.cache_size * 4:
+                    self._key_locks = {k: v for k, v in self._key_locks.items() if v.locked()}
+                lock = self._key_locks[cat_id] = threading.Lock()
+            return lock
+
+    # ---------- 加载 ----------
+    def _fetch_page(self, cat_id, page):
+        self.stats["pages_fetched"] += 1
+        return self.fetch(cat_id, page)
+
+    def load(self, cat_id, expected_total=None):
+        with self._lock_for(cat_id):
+            first = self._fetch_page(cat_id, 1)
+            with tracing.span("parse"):
+                articles = episode_parser.extract_articles(first) if first is not None else None
+            if articles is None:
+                return None
+
+            now = time.time()
+            if not episode_parser.has_older_page(first):
+                self._put(cat_id, _Entry(articles, 1, now))
+                return articles
+
+            entry = self._get(cat_id)
+            if entry is not None and now - entry.full_at < self.full_ttl:
+                stitched = self._stitch(articles, entry.articles)
+                if stitched is not None:
+                    self.stats["stitched"] += 1
+                    self._put(cat_id, _Entry(stitched, entry.pages, entry.full_at))
+                    return stitched
+
+            self.stats["full_loads"] += 1
+            guess = entry.pages if entry is not None else 2
+            expected_total = max(expected_total or 0, _newest_episode_number(articles))
+            if expected_total and articles:
+                guess = max(guess, -(-expected_total // len(articles)))
+            rest, pages = self._fetch_rest(cat_id, guess)
+            merged = _dedupe(articles + rest)
+            self._put(cat_id, _Entry(merged, pages, now))
+            return merged
+
+    @staticmethod
+    def _stitch(first_page, cached):
+        """第一页最后一条还在缓存里时，新列表 = 第一页 + 缓存中它之后的部分"""
+        if not first_page:
+            return None
+        last = _article_key(first_page[-1])
+        for i, art in enumerate(cached):
+            if _article_key(art) == last:
+                return _dedupe(first_page + cached[i + 1:])
+        return None
+
+    def _fetch_rest(self, cat_id, guess):
+        """并发请求第 2 页起的所有页，返回 (文章列表, 总页数)"""
+        collected = []
+        page = 2
+        wave_end = max(guess, 2)
+        while True:
+            numbers = list(range(page, wave_end + 1))
+            fetch = tracing.bind(self._fetch_page)
+            futures = [self.pool.submit(fetch, cat_id, n) for n in numbers]
+            bodies = [f.result() for f in futures]
+
+            last_page = page - 1
+            more = False
+            for n, body in zip(numbers, bodies):
+                with tracing.span("parse"):
+                    arts = episode_parser.extract_articles(body) if body is not None else None
+                if not arts:
+                    more = False
+                    break
+                collected.extend(arts)
+                last_page = n
+                more = episode_parser.has_older_page(body)
+                if not more:
+                    break
+            if not more or last_page < wave_end:
+                return collected, last_page
+            # 预估不足，按线程池大小继续往后翻
+            page = wave_end + 1
+            wave_end = page + self.max_workers - 1
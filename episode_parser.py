@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+anime1 分类页的集数解析
+
+api_episodes 只需要每个 article 的 h2.entry-title 文本和 data-apireq 属性，
+不必为整页构建 BeautifulSoup 树：
+  - 用预编译正则直接扫描 #main 区域 (比 bs4 快约 20 倍，见 bench/parse_bench.py)
+  - 找不到 #main 时退回 BeautifulSoup
+"""
+import re
+import html
+
+# ================= 预编译正则 =================
+_MAIN_RE = re.compile(r'<(\w+)\b[^>]*\bid\s*=\s*["\']?main["\']?[\s>/]', re.IGNORECASE)
+_ARTICLE_SPLIT_RE = re.compile(r'<article\b', re.IGNORECASE)
+_ENTRY_TITLE_RE = re.compile(
+    r'<h2\b[^>]*\bclass\s*=\s*["\'][^"\']*\bentry-title\b[^"\']*["\'][^>]*>(.*?)</h2\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+_APIREQ_RE = re.compile(r'data-apireq="([^"]+)"')
+_TAG_RE = re.compile(r'<[^>]+>')
+_OLDER_PAGE_RE = re.compile(r'class\s*=\s*["\'][^"\']*\bnav-previous\b', re.IGNORECASE)
+
+# 单次扫描的集数简称：特殊集 (OVA/OAD/SP/Ep) > 括号里的数字 > 任意数字
+_SHORT_TITLE_RE = re.compile(
+    r'(?P<sp>OVA|OAD|SP|Ep)\.?\s*(?P<sp_num>\d+(?:\.\d+)?)'
+    r'|[\[\(【]\s*(?P<br_num>\d+(?:\.\d+)?)\s*[\]\)】]'
+    r'|(?P<num>\d+(?:\.\d+)?)',
+    re.IGNORECASE
+)
+
+
+def _pad(num):
+    if '.' not in num and num.isdigit() and int(num) < 10:
+        return num.zfill(2)
+    return num
+
+
+def short_title(full_title):
+    """从完整标题得到选集按钮上显示的简称，例如 "某番 [03]" -> "03"、"某番 OVA 2" -> "OVA 2" """
+    bracket_num = None
+    last_num = None
+    for m in _SHORT_TITLE_RE.finditer(full_title):
+        if m.group('sp'):
+            return f"{m.group('sp').upper()} {m.group('sp_num')}"
+        if m.group('br_num') is not None:
+            bracket_num = m.group('br_num')
+        else:
+            last_num = m.group('num')
+    if bracket_num is not None:
+        return _pad(bracket_num)
+    if last_num is not None:
+        return _pad(last_num)
+    return full_title
+
+
+# ================= 页面提取 =================
+def _extract_regex(page):
+    m = _MAIN_RE.search(page)
+    if not m:
+        return None
+    region = page[m.start():]
+    tag = m.group(1).lower()
+    if tag != 'div':
+        # <main id="main"> 不会嵌套，截到第一个闭合标签
+        close = re.search(r'</' + tag + r'\s*>', region, re.IGNORECASE)
+        if close:
+            region = region[:close.start()]
+    else:
+        # div 会嵌套，截到页脚前即可
+        footer = region.find('id="colophon"')
+        if footer != -1:
+            region = region[:footer]
+    result = []
+    pieces = _ARTICLE_SPLIT_RE.split(region)
+    for piece in pieces[1:]:
+        end = piece.find('</article')
+        if end != -1:
+            piece = piece[:end]
+        t = _ENTRY_TITLE_RE.search(piece)
+        title = html.unescape(_TAG_RE.sub('', t.group(1))).strip() if t else None
+        token = _APIREQ_RE.search(piece)
+        result.append((title, token.group(1) if token else ""))
+    return result
+
+
+def _extract_bs4(page):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page, 'html.parser')
+    main = soup.find(id='main')
+    if not main:
+        return None
+    result = []
+    for art in main.find_all('article'):
+        title_tag = art.find('h2', class_='entry-title')
+        title = title_tag.text.strip() if title_tag else None
+        match_token = _APIREQ_RE.search(str(art))
+        result.append((title, match_token.group(1) if match_token else ""))
+    return result
+
+
+def extract_articles(page, engine=None):
+    """
+    返回 [(繁体完整标题或 None, token), ...]，页面里没有 #main 时返回 None。
+    engine 可指定 "regex" / "bs4"，默认用正则，失败时退回 bs4。
+    """
+    if engine == "bs4":
+        return _extract_bs4(page)
+    if engine == "regex":
+        return _extract_regex(page)
+    try:
+        result = _extract_regex(page)
+    except Exception:
+        result = None
+    if result is None:
+        result = _extract_bs4(page)
+    return result
+
+
+def has_older_page(page):
+    """分类页底部有"上一頁"导航时说明还有更旧的一页"""
+    return _OLDER_PAGE_RE.search(page) is not None
+
+
+def build_episodes(articles, convert=None, start_index=0):
+    """
+    把提取结果转换成接口输出。convert 为繁转简函数，所有标题合并成一次调用以减少开销。
+    """
+    titles = [t if t is not None else f"第 {start_index + i + 1} 集" for i, (t, _) in enumerate(articles)]
+    if convert is not None and titles:
+        joined = convert("\n".join(titles))
+        converted = joined.split("\n")
+        if len(converted) == len(titles):
+            titles = converted
+        else:
+            titles = [convert(t) for t in titles]
+
+    eps = []
+    for i, ((_, token), full_title) in enumerate(zip(articles, titles)):
+        eps.append({
+            "index": start_index + i,
+            "title": short_title(full_title),
+            "full_title": full_title,
+            "token": token
+        })
+    return eps
+
+
+def parse_episode_page(page, convert=None, engine=None):
+    """解析整个分类页，找不到 #main 时返回 None"""
+    articles = extract_articles(page, engine)
+    if articles is None:
+        return None
+    return build_episodes(articles, convert)
@@ -12,7 +12,7 @@ from opencc import OpenCC
 # 配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SCHEDULE_FILE = os.path.join(BASE_DIR, "static", "json", "schedule.json")
-COVER_MAP_FILE = os.path.join(BASE_DIR, "static", "json", "cover_map.json")
+ANIME1_BASE = os.environ.get("ANIMEONE_UPSTREAM", "https://anime1.me").rstrip("/")
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -22,22 +22,13 @@ HEADERS = {
 client = httpx.Client(headers=HEADERS, timeout=30.0, follow_redirects=True)
 cc = OpenCC('t2s')
 
-# 加载封面映射
-COVER_MAP = {}
-if os.path.exists(COVER_MAP_FILE):
-    try:
-        with open(COVER_MAP_FILE, 'r', encoding='utf-8') as f:
-            COVER_MAP = json.load(f)
-    except:
-        pass
-
 # 获取 safe_id_set
 SAFE_ID_SET = set()
 def fetch_safe_ids():
     print("[INFO] 正在获取全站番剧白名单...")
     try:
         timestamp = int(time.time() * 1000)
-        res = client.get(f"https://anime1.me/animelist.json?_={timestamp}")
+        res = client.get(f"{ANIME1_BASE}/animelist.json?_={timestamp}")
         data = res.json()
         count = 0
         for item in data:
@@ -70,7 +61,7 @@ def get_season_score(year, season):
     return int(year) * 10 + s_map.get(season, 0)
 
 def fetch_single_season(year, season):
-    url = f"https://anime1.me/{year}年{season}新番"
+    url = f"{ANIME1_BASE}/{year}年{season}新番"
     print(f"🔄 正在爬取: {year} {season} ({url})...")
     
     try:
@@ -108,15 +99,11 @@ def fetch_single_season(year, season):
                         clean_tc = html.unescape(title_raw)
                         title_sc = cc.convert(clean_tc)
                         
-                        # 这里依然尝试获取一下，但主要依靠最后的统一刷新
-                        poster = ""
-                        if title_sc in COVER_MAP and COVER_MAP[title_sc]:
-                             poster = f"/covers/{COVER_MAP[title_sc]}"
-                             
+                        # 封面由服务端建季度表索引时按 cover_map 解析，这里不再保存
                         week_data[col_idx].append({
                             "id": cat_id,
                             "title": title_sc,
-                            "poster": poster,
+                            "poster": "",
                             "year": str(year),
                             "season": season
                         })
@@ -176,38 +163,12 @@ def main():
                 has_update = True
                 time.sleep(1.0)
 
-    # --- 新增逻辑：即使不爬取，也要刷新所有本地缓存的封面 ---
-    print("[INFO] 正在校验并刷新所有季度封面...")
-    updated_covers_count = 0
-    
-    # 遍历缓存中所有的季度
-    for key in schedule_cache:
-        week_data = schedule_cache[key]
-        # 遍历每一天
-        for day_list in week_data:
-            # 遍历每一部番
-            for anime in day_list:
-                title = anime.get('title')
-                # 检查 cover_map 里是否有这个番的封面
-                if title in COVER_MAP and COVER_MAP[title]:
-                    new_poster_path = f"/covers/{COVER_MAP[title]}"
-                    
-                    # 如果当前 JSON 里的封面地址和 Map 里的不一样（或者是空的）
-                    # 就更新它，并标记 has_update = True 以便保存
-                    if anime.get('poster') != new_poster_path:
-                        anime['poster'] = new_poster_path
-                        updated_covers_count += 1
-                        has_update = True
-
-    if updated_covers_count > 0:
-        print(f"[INFO] ♻️  已更新 {updated_covers_count} 个番剧的封面链接")
-
     # 5. 保存
     if has_update:
         try:
             with open(SCHEDULE_FILE, 'w', encoding='utf-8') as f:
                 json.dump(schedule_cache, f, ensure_ascii=False)
-            print("[SUCCESS] 所有更新（含封面）已保存到 schedule.json")
+            print("[SUCCESS] 所有更新已保存到 schedule.json")
         except Exception as e:
             print(f"[ERROR] 保存文件失败: {e}")
     else:
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+多进程部署配置
+
+    pip install -r requirements.txt
+    gunicorn -c gunicorn.conf.py app:app
+
+每个 worker 独立导入 app，通过 run/ 下的锁文件选出一个领导者负责定时刷新，
+其他 worker 加载领导者发布的目录快照；追番和播放记录的写入跨进程串行化。
+"""
+import os
+import multiprocessing
+
+bind = os.environ.get("ANIMEONE_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("ANIMEONE_WORKERS", multiprocessing.cpu_count()))
+
+# 视频代理是长连接流式响应，用线程 worker 避免一个播放占满一个进程。
+# /api/sync/events 的每条推送连接也一直占用一个线程 (每个打开的页面一条)。每个 worker 最多
+# ANIMEONE_SYNC_MAX_STREAMS 条，默认取 threads 的一半，另一半留给普通请求；超出的页面收到 503，
+# 改为每隔 30~60 秒重连并通过 /api/sync/delta 补齐。同时打开的页面多时应调大 ANIMEONE_THREADS
+worker_class = "gthread"
+threads = int(os.environ.get("ANIMEONE_THREADS", 32))
+timeout = 120
+graceful_timeout = 30
+
+# 不能预加载：选举和后台线程必须在各 worker 进程内启动
+preload_app = False
+raw_env = ["ANIMEONE_MULTIPROC=1"]
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+/api/list 的筛选、排序和分面索引
+
+在 build_anime_metadata 时按 ANIME_DB 的顺序 (id 倒序) 给每部番剧一个行号，
+每个筛选值对应一个 Python 整数位图 (第 i 位 = 第 i 行)：
+  - 年份 / 季度 / 状态分组 的位图在构建时一次生成
+  - 追番、有播放记录 的位图随用户操作增量维护
+筛选 = 位图按位与，计数 = popcount，分面计数 = 去掉该维度后的位图与各取值位图的交集计数。
+排序用预先排好的行号数组 (标题、年份) 或增量维护的有序列表 (最近播放、追番顺序)。
+"""
+import bisect
+import itertools
+from array import array
+
+FACET_DIMS = ("year", "season", "status")
+SORT_KEYS = ("id", "title", "year", "last_played", "favorite")
+
+_BLOCK_BITS = 1 << 14  # 跳过 offset 时按块计数
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+def status_group(status):
+    """把各式各样的状态归成几类：连载中 / 完结 / 剧场版 / OVA"""
+    if not status:
+        return "完结"
+    if status.startswith("连载"):
+        return "连载中"
+    if "剧场" in status:
+        return "剧场版"
+    upper = status.upper()
+    if "OVA" in upper or "OAD" in upper:
+        return "OVA"
+    return "完结"
+
+
+def mask_from_positions(positions, size):
+    """行号集合 -> 位图，O(n) 而不是逐位移位"""
+    buf = bytearray((size + 7) // 8)
+    for p in positions:
+        buf[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(buf, "little")
+
+
+def iter_bits(mask, start_bit=0, reverse=False):
+    """
+    按行号枚举位图中的行 (默认从小到大)。
+    先转成字节串再跳过全零字节，大整数移位是 O(n) 的，逐位移位会退化成平方级。
+    """
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    byte_range = range(len(data) - 1, (start_bit >> 3) - 1, -1) if reverse else range(start_bit >> 3, len(data))
+    bit_range = range(7, -1, -1) if reverse else range(8)
+    for bi in byte_range:
+        b = data[bi]
+        if not b:
+            continue
+        base = bi << 3
+        for k in bit_range:
+            if b >> k & 1 and base + k >= start_bit:
+                yield base + k
+
+
+def bit_tester(mask):
+    """返回判断某行是否在位图中的函数"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    size = len(data)
+    return lambda p: (p >> 3) < size and data[p >> 3] >> (p & 7) & 1
+
+
+class ListIndex:
+    def __init__(self, records, favorites=(), playback=None):
+        self.records = records
+        self.size = len(records)
+        self.all = (1 << self.size) - 1
+        self.pos = {r.id: i for i, r in enumerate(records)}
+
+        groups = {dim: {} for dim in FACET_DIMS}
+        for i, r in enumerate(records):
+            groups["year"].setdefault(r.year, []).append(i)
+            groups["season"].setdefault(r.season, []).append(i)
+            groups["status"].setdefault(status_group(r.status), []).append(i)
+        self.facets = {
+            dim: {value: mask_from_positions(rows, self.size) for value, rows in values.items()}
+            for dim, values in groups.items()
+        }
+
+        self.title_order = array("l", sorted(range(self.size), key=lambda i: records[i].title))
+        # 年份从新到旧 (按数值，与游标的比较键一致)，同年内保持 id 倒序 (sort 是稳定的)
+        self.year_order = array("l", sorted(range(self.size), key=lambda i: -_year_int(records[i].year)))
+        self._ranks = {}
+        self.user_version = 0  # 追番 / 播放记录每次变化加一，供依赖用户状态的缓存判断是否失效
+        self.reset_user_state(favorites, playback)
+
+    # ---------- 用户状态增量维护 ----------
+    def reset_user_state(self, favorites, playback):
+        self.user_version += 1
+        # 追番：按加入顺序保存行号，最新加入的在最后
+        self.fav_order = [self.pos[a] for a in favorites if a in self.pos]
+        self.fav_mask = mask_from_positions(self.fav_order, self.size)
+
+        # 播放记录：(时间戳, 行号) 升序
+        self._played_ts = {}
+        for anime_id, record in (playback or {}).items():
+            p = self.pos.get(anime_id)
+            if p is not None:
+                self._played_ts[p] = record.get("timestamp", "")
+        self._played_keys = sorted((ts, p) for p, ts in self._played_ts.items())
+        self.played_mask = mask_from_positions(self._played_ts, self.size)
+
+    def played_positions(self):
+        """有播放记录的行号 (无序)"""
+        return list(self._played_ts)
+
+    def set_favorite(self, anime_id, on):
+        p = self.pos.get(anime_id)
+        if p is None:
+            return
+        self.user_version += 1
+        if p in self.fav_order:
+            self.fav_order.remove(p)
+        if on:
+            self.fav_order.append(p)
+            self.fav_mask |= 1 << p
+        else:
+            self.fav_mask &= ~(1 << p)
+
+    def set_playback(self, anime_id, timestamp):
+        """timestamp 为 None 表示清除记录"""
+        p = self.pos.get(anime_id)
+        if p is None:
+            return
+        self.user_version += 1
+        old = self._played_ts.pop(p, None)
+        if old is not None:
+            i = bisect.bisect_left(self._played_keys, (old, p))
+            if i < len(self._played_keys) and self._played_keys[i] == (old, p):
+                del self._played_keys[i]
+        if timestamp is None:
+            self.played_mask &= ~(1 << p)
+            return
+        self._played_ts[p] = timestamp
+        bisect.insort(self._played_keys, (timestamp, p))
+        self.played_mask |= 1 << p
+
+    # ---------- 查询 ----------
+    def _dim_mask(self, dim, values):
+        table = self.facets[dim]
+        mask = 0
+        for v in values:
+            mask |= table.get(v, 0)
+        return mask
+
+    def filter_masks(self, filters, favorite=None, played=None, keyword_mask=None):
+        """返回 {维度: 位图}，供筛选和分面计数使用"""
+        masks = {}
+        for dim in FACET_DIMS:
+            values = filters.get(dim)
+            if values:
+                masks[dim] = self._dim_mask(dim, values)
+        if favorite is not None:
+            masks["favorite"] = self.fav_mask if favorite else self.all & ~self.fav_mask
+        if played is not None:
+            masks["played"] = self.played_mask if played else self.all & ~self.played_mask
+        if keyword_mask is not None:
+            masks["q"] = keyword_mask
+        return masks
+
+    def combine(self, masks, skip=None):
+        mask = self.all
+        for dim, m in masks.items():
+            if dim != skip:
+                mask &= m
+        return mask
+
+    def facet_counts(self, masks):
+        result = {}
+        for dim in FACET_DIMS:
+            base = self.combine(masks, skip=dim)
+            counts = {value: popcount(base & m) for value, m in self.facets[dim].items()}
+            result[dim] = {k: v for k, v in counts.items() if v}
+        base = self.combine(masks, skip="favorite")
+        result["favorite"] = popcount(base & self.fav_mask)
+        base = self.combine(masks, skip="played")
+        result["played"] = popcount(base & self.played_mask)
+        return result
+
+    def _rank(self, name, order):
+        rank = self._ranks.get(name)
+        if rank is None:
+            rank = array("l", [0]) * self.size
+            for r, p in enumerate(order):
+                rank[p] = r
+            self._ranks[name] = rank
+        return rank
+
+    def _ordered(self, mask, sort, reverse):
+        """
+        按排序键枚举位图中的行号。
+        last_played / favorite 先列出有播放记录 / 已追番的行 (默认最近的在前，reverse 时最早的在前)，
+        其余行随后按 id 排列 (reverse 时 id 升序，与 sort=id 一致)
+        """
+        if sort == "id":
+            return iter_bits(mask, reverse=reverse)
+        has = bit_tester(mask)
+        if sort in ("title", "year"):
+            order = self.title_order if sort == "title" else self.year_order
+            if popcount(mask) * 8 < self.size:
+                # 结果很少时直接取出行号按名次排序
+                rank = self._rank(sort, order)
+                rows = sorted(iter_bits(mask), key=rank.__getitem__, reverse=reverse)
+                return iter(rows)
+            seq = reversed(order) if reverse else order
+            return (p for p in seq if has(p))
+        if sort == "last_played":
+            keys = self._played_keys if reverse else reversed(self._played_keys)
+            first = (p for _, p in keys if has(p))
+            return self._then_rest(first, mask & ~self.played_mask, reverse)
+        if sort == "favorite":
+            order = self.fav_order if reverse else reversed(self.fav_order)
+            first = (p for p in order if has(p))
+            return self._then_rest(first, mask & ~self.fav_mask, reverse)
+        raise ValueError(sort)
+
+    def _then_rest(self, first, rest_mask, reverse, after_id=None):
+        """先枚举 first，再按 id 顺序枚举 rest_mask 中 (after_id 之后) 的行"""
+        yield from first
+        if not reverse:
+            yield from iter_bits(rest_mask, self._id_start(after_id) if after_id is not None else 0)
+            return
+        if after_id is not None:
+            end = _bisect(range(self.size), self._sort_key("id"), (-int(after_id),), right=False)
+            rest_mask &= (1 << end) - 1
+        yield from iter_bits(rest_mask, reverse=True)
+
+    def page(self, mask, sort="id", reverse=False, offset=0, limit=24):
+        """返回 (该页的行号列表, 总数)"""
+        total = popcount(mask)
+        if offset >= total or limit <= 0:
+            return [], total
+        start_bit = 0
+        if sort == "id" and not reverse and offset:
+            # 按块 popcount 跳过前面的行，不必逐位枚举
+            block_mask = (1 << _BLOCK_BITS) - 1
+            while True:
+                n = popcount((mask >> start_bit) & block_mask)
+                if n > offset:
+                    break
+                offset -= n
+                start_bit += _BLOCK_BITS
+            it = iter_bits(mask, start_bit)
+        else:
+            it = self._ordered(mask, sort, reverse)
+        rows = []
+        for p in it:
+            if offset:
+                offset -= 1
+                continue
+            rows.append(p)
+            if len(rows) >= limit:
+                break
+        return rows, total
+
+    # ---------- 游标分页 ----------
+    # 游标只记录上一页最后一条的排序键 (标题、年份、id 等)，而不是行号或偏移量，
+    # 目录刷新后行号变化也能从正确的位置继续。
+
+    def ordered_rows(self, mask, sort="id", reverse=False):
+        """位图中的全部行号，按排序键排好"""
+        return list(self._ordered(mask, sort, reverse))
+
+    def _sort_key(self, sort):
+        """与排序顺序一致的升序比较键"""
+        records = self.records
+        if sort == "title":
+            return lambda p: (records[p].title, -int(records[p].id))
+        if sort == "year":
+            return lambda p: (-_year_int(records[p].year), -int(records[p].id))
+        return lambda p: (-int(records[p].id),)
+
+    def cursor_key(self, p, sort):
+        r = self.records[p]
+        if sort == "last_played":
+            ts = self._played_ts.get(p)
+            return ["p", ts, r.id] if ts is not None else ["r", r.id]
+        if sort == "favorite":
+            return ["f", r.id] if self.fav_mask >> p & 1 else ["r", r.id]
+        if sort == "title":
+            return [r.title, r.id]
+        if sort == "year":
+            return [r.year, r.id]
+        return [r.id]
+
+    @staticmethod
+    def _target(sort, key):
+        if sort == "title":
+            return (key[0], -int(key[1]))
+        if sort == "year":
+            return (-_year_int(key[0]), -int(key[1]))
+        return (-int(key[0]),)
+
+    def _ordered_after(self, mask, sort, reverse, key):
+        if sort == "last_played":
+            rest = mask & ~self.played_mask
+            if key[0] == "p":
+                has = bit_tester(mask)
+                # 同一时间戳按行号排列，游标行不在目录里时跳过整个时间戳
+                if reverse:
+                    p = self.pos.get(key[2], self.size)
+                    start = bisect.bisect_right(self._played_keys, (key[1], p))
+                    first = (p for _, p in self._played_keys[start:] if has(p))
+                else:
+                    p = self.pos.get(key[2], -1)
+                    end = bisect.bisect_left(self._played_keys, (key[1], p))
+                    first = (p for _, p in reversed(self._played_keys[:end]) if has(p))
+                return self._then_rest(first, rest, reverse)
+            return self._then_rest((), rest, reverse, key[1])
+        if sort == "favorite":
+            rest = mask & ~self.fav_mask
+            if key[0] == "f":
+                has = bit_tester(mask)
+                p = self.pos.get(key[1])
+                # 游标行已取消追番时直接进入其余行
+                if reverse:
+                    start = self.fav_order.index(p) + 1 if p in self.fav_order else len(self.fav_order)
+                    first = (q for q in self.fav_order[start:] if has(q))
+                else:
+                    end = self.fav_order.index(p) if p in self.fav_order else 0
+                    first = (q for q in reversed(self.fav_order[:end]) if has(q))
+                return self._then_rest(first, rest, reverse)
+            return self._then_rest((), rest, reverse, key[1])
+
+        keyfn = self._sort_key(sort)
+        target = self._target(sort, key)
+        if sort == "id":
+            if not reverse:
+                return iter_bits(mask, _bisect(range(self.size), keyfn, target, right=True))
+            end = _bisect(range(self.size), keyfn, target, right=False)
+            return iter_bits(mask & ((1 << end) - 1), reverse=True)
+
+        order = self.title_order if sort == "title" else self.year_order
+        if popcount(mask) * 8 < self.size:
+            if reverse:
+                rows = [p for p in iter_bits(mask) if keyfn(p) < target]
+            else:
+                rows = [p for p in iter_bits(mask) if keyfn(p) > target]
+            return iter(sorted(rows, key=keyfn, reverse=reverse))
+        has = bit_tester(mask)
+        if reverse:
+            end = _bisect(order, keyfn, target, right=False)
+            seq = reversed(order[:end])
+        else:
+            seq = itertools.islice(order, _bisect(order, keyfn, target, right=True), None)
+        return (p for p in seq if has(p))
+
+    def _id_start(self, anime_id):
+        return _bisect(range(self.size), self._sort_key("id"), (-int(anime_id),), right=True)
+
+    def keyset_page(self, mask, sort="id", reverse=False, after=None, limit=24):
+        """返回 (该页的行号列表, 下一页的游标键或 None)"""
+        if after is None:
+            it = self._ordered(mask, sort, reverse)
+        else:
+            it = self._ordered_after(mask, sort, reverse, after)
+        rows = list(itertools.islice(it, limit + 1))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, self.cursor_key(rows[-1], sort)
+        return rows, None
+
+
+def _year_int(year):
+    return int(year) if year.isdigit() else 0
+
+
+def _bisect(seq, keyfn, target, right):
+    """在按 keyfn 升序排列的 seq 中二分查找 (bisect 的 key 参数要 Python 3.10+)"""
+    lo, hi = 0, len(seq)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        k = keyfn(seq[mid])
+        if k < target or (right and k == target):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+轻量的 Prometheus 文本格式指标
+
+不依赖 prometheus_client：计数器 / 仪表 / 直方图都只是加锁的字典操作，
+每次记录的开销在微秒级，可以在生产环境常开。通过 /metrics 暴露。
+"""
+import time
+import bisect
+import threading
+import urllib.parse
+
+import tracing
+
+# 默认延迟分桶 (秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_REGISTRY = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(v):
+    if v == float('inf'):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, doc):
+        self.name = name
+        self.doc = doc
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, key, None, v
+
+
+class Gauge:
+    """仪表；传入 callback 时在抓取时计算，返回 {标签字典(元组): 值} 或单个数值"""
+    kind = "gauge"
+
+    def __init__(self, name, doc, callback=None):
+        self.name = name
+        self.doc = doc
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                result = self.callback()
+            except Exception:
+                return
+            if isinstance(result, dict):
+                for labels, v in result.items():
+                    yield self.name, _label_key(dict(labels)), None, v
+            else:
+                yield self.name, (), None, result
+            return
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield self.name, key, None, v
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, doc, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket_counts..., sum, count]
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 3)
+            row[idx] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, row in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets + (float('inf'),)):
+                cumulative += row[i]
+                yield self.name + "_bucket", key, ("le", _format_value(float(bound))), cumulative
+            yield self.name + "_sum", key, None, row[-2]
+            yield self.name + "_count", key, None, row[-1]
+
+
+class _Timer:
+    def __init__(self, hist, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+def render():
+    """导出 Prometheus 文本格式"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.doc}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, extra, v in metric.samples():
+            lines.append(f"{name}{_format_labels(key, extra)} {_format_value(v)}")
+    return "\n".join(lines) + "\n"
+
+
+# ================= 通用指标 =================
+HTTP_REQUESTS = Counter("animeone_http_requests_total", "HTTP 请求数")
+HTTP_LATENCY = Histogram("animeone_http_request_duration_seconds", "HTTP 请求处理耗时（流式响应计到首字节）")
+UPSTREAM_REQUESTS = Counter("animeone_upstream_requests_total", "上游 HTTP 请求数")
+UPSTREAM_LATENCY = Histogram("animeone_upstream_request_duration_seconds", "上游 HTTP 请求耗时（到响应头）")
+PROXY_BYTES = Counter("animeone_proxy_bytes_total", "视频代理转发给客户端的字节数")
+REFRESH_DURATION = Histogram(
+    "animeone_refresh_duration_seconds", "定时刷新任务耗时",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+LOCK_WAIT = Histogram(
+    "animeone_lock_wait_seconds", "等待锁的时间",
+    buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+)
+
+
+def upstream_host_label(host):
+    """把上游主机归类为固定的几个标签，避免 CDN 域名导致标签爆炸"""
+    if host in ("anime1.me", "v.anime1.me"):
+        return host
+    if host.endswith("bgm.tv"):
+        return "bgm.tv"
+    return "cdn"
+
+
+def _on_upstream_request(request):
+    request.extensions["animeone_t0"] = time.perf_counter()
+
+
+def _on_upstream_response(response):
+    request = response.request
+    t0 = request.extensions.get("animeone_t0")
+    host = upstream_host_label(request.url.host)
+    if t0 is not None:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - t0, host=host)
+    UPSTREAM_REQUESTS.inc(host=host, status=f"{response.status_code // 100}xx")
+
+
+def httpx_hooks():
+    """给 httpx.Client 使用的 event_hooks"""
+    return {"request": [_on_upstream_request], "response": [_on_upstream_response]}
+
+
+def record_upstream_error(url, exc):
+    host = upstream_host_label(urllib.parse.urlsplit(str(url)).hostname or "")
+    UPSTREAM_REQUESTS.inc(host=host, status=type(exc).__name__)
+
+
+class TimedLock:
+    """带等待时间统计的互斥锁，用法同 threading.Lock"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        t0 = time.perf_counter()
+        ok = self._lock.acquire(blocking, timeout)
+        waited = time.perf_counter() - t0
+        LOCK_WAIT.observe(waited, lock=self.name)
+        tracing.add(f"lock:{self.name}", waited)
+        return ok
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        return False
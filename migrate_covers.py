@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+把旧的平铺封面目录 (local_covers/<md5(标题)>.jpg) 迁移到按内容寻址的分片存储
+
+- 相同内容的图片只保留一份
+- cover_map.json 中的文件名改写为分片相对路径，schedule.json 中的封面地址同步改写
+- 默认在原位置留下指向新文件的硬链接，旧的 /covers/xxx.jpg 地址仍然可用且不占额外空间；
+  确认客户端都已更新后可用 --prune-legacy 删除
+
+用法:
+    python migrate_covers.py [--dry-run] [--prune-legacy]
+"""
+import os
+import json
+import argparse
+
+import cover_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COVER_FOLDER = os.path.join(BASE_DIR, "local_covers")
+CACHE_FILE = os.path.join(BASE_DIR, "static", "json", "cover_map.json")
+SCHEDULE_FILE = os.path.join(BASE_DIR, "static", "json", "schedule.json")
+
+
+def load_json(path, default):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] 读取 {path} 失败: {e}")
+    return default
+
+
+def save_json(path, data, **kwargs):
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def migrate(dry_run=False, prune_legacy=False):
+    if not os.path.isdir(COVER_FOLDER):
+        print(f"[INFO] 封面目录不存在: {COVER_FOLDER}")
+        return
+
+    renamed = {}        # 旧文件名 -> 分片相对路径
+    duplicates = 0
+    saved_bytes = 0
+
+    legacy_files = sorted(
+        e.name for e in os.scandir(COVER_FOLDER)
+        if e.is_file() and '.tmp' not in e.name
+    )
+    print(f"[INFO] 发现 {len(legacy_files)} 个平铺封面文件")
+
+    for name in legacy_files:
+        src = os.path.join(COVER_FOLDER, name)
+        ext = name.rsplit('.', 1)[-1] if '.' in name else ''
+        if dry_run:
+            with open(src, 'rb') as f:
+                data = f.read()
+            relpath = cover_store.relpath_for(cover_store.content_hash(data), cover_store.normalize_ext(ext))
+            if relpath in renamed.values():
+                duplicates += 1
+                saved_bytes += len(data)
+            renamed[name] = relpath
+            continue
+
+        size = os.path.getsize(src)
+        relpath, is_dup = cover_store.adopt_file(COVER_FOLDER, src, ext)
+        target = os.path.join(COVER_FOLDER, *relpath.split('/'))
+        renamed[name] = relpath
+        if is_dup and os.path.samefile(src, target):
+            # 上次迁移留下的硬链接
+            if prune_legacy:
+                os.remove(src)
+            continue
+        if is_dup:
+            duplicates += 1
+            saved_bytes += size
+            os.remove(src)
+        if not prune_legacy:
+            # 旧地址保留为硬链接
+            os.link(target, src)
+
+    # 改写 cover_map.json
+    cover_map = load_json(CACHE_FILE, {})
+    map_updates = 0
+    for title, filename in cover_map.items():
+        if filename in renamed:
+            cover_map[title] = renamed[filename]
+            map_updates += 1
+
+    # 改写 schedule.json 中的封面地址
+    schedule = load_json(SCHEDULE_FILE, {})
+    poster_updates = 0
+    for week_data in schedule.values():
+        for day_list in week_data:
+            for anime in day_list:
+                poster = anime.get('poster') or ''
+                if poster.startswith('/covers/') and poster[len('/covers/'):] in renamed:
+                    anime['poster'] = '/covers/' + renamed[poster[len('/covers/'):]]
+                    poster_updates += 1
+
+    print("=" * 40)
+    print(f"唯一图片: {len(set(renamed.values()))}")
+    print(f"重复图片: {duplicates} (节省 {saved_bytes / 1024 / 1024:.1f} MB)")
+    print(f"封面映射改写: {map_updates} 条")
+    print(f"季度表封面改写: {poster_updates} 条")
+    print("=" * 40)
+
+    if dry_run:
+        print("[INFO] --dry-run 模式，未修改任何文件")
+        return
+
+    save_json(CACHE_FILE, cover_map, indent=2)
+    if poster_updates:
+        save_json(SCHEDULE_FILE, schedule)
+    os.utime(COVER_FOLDER)
+    print("[SUCCESS] 迁移完成")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="封面目录迁移到内容寻址存储")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不修改文件")
+    parser.add_argument("--prune-legacy", action="store_true", help="不保留旧文件名的硬链接")
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run, prune_legacy=args.prune_legacy)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+多进程部署 (gunicorn) 时的进程间协调
+
+  - 领导者选举：flock 独占 run/leader.lock，持有者负责定时刷新并发布目录快照；
+    进程退出时内核自动释放锁，其他进程轮询到后接任
+  - 目录快照：领导者把番剧列表、封面映射、介绍、季度表写成带代号的快照文件，
+    再原子替换 catalogue.current 指针；其他进程轮询指针，mmap 读入新代号后整体替换
+  - 用户状态：追番和播放记录的写入用 flock 串行化，写前先合并磁盘上其他进程的修改，
+    写入用临时文件 + os.replace，其他进程按 mtime 重新加载
+
+只依赖标准库，fcntl 仅在类 Unix 系统上可用 (gunicorn 本身也只支持类 Unix)。
+"""
+import os
+import json
+import mmap
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ENABLED = os.environ.get("ANIMEONE_MULTIPROC", "") == "1"
+RUN_DIR = os.environ.get(
+    "ANIMEONE_RUN_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "run")
+)
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """先写临时文件再 os.replace，读者永远看不到写了一半的文件"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp, path)
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class FileLock:
+    """flock 实现的跨进程互斥锁；同进程内的线程先经过 threading.Lock"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except Exception:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        finally:
+            self._thread_lock.release()
+        return False
+
+
+# ================= 领导者选举 =================
+class LeaderElection:
+    """非阻塞地尝试持有 leader.lock，成功后调用一次 on_elected"""
+
+    def __init__(self, path, on_elected, interval=5.0):
+        self.path = path
+        self.on_elected = on_elected
+        self.interval = interval
+        self.is_leader = False
+        self._fd = None
+
+    def try_acquire(self):
+        if self.is_leader:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        # 文件描述符保持打开直到进程退出，锁随之释放
+        self._fd = fd
+        self.is_leader = True
+        print(f"[INFO] 进程 {os.getpid()} 成为领导者，负责定时刷新", flush=True)
+        self.on_elected()
+        return True
+
+    def start(self):
+        if self.try_acquire():
+            return
+
+        def loop():
+            while not self.try_acquire():
+                time.sleep(self.interval)
+
+        threading.Thread(target=loop, daemon=True, name="leader-election").start()
+
+
+# ================= 目录快照 =================
+class SnapshotStore:
+    """带代号的只读快照：<name>.<gen>.json + 指向当前代号的 <name>.current"""
+
+    KEEP = 2  # 保留最近几代，正在读取旧代号的进程不受影响
+
+    def __init__(self, run_dir, name="catalogue"):
+        self.run_dir = run_dir
+        self.name = name
+        self.pointer = os.path.join(run_dir, f"{name}.current")
+        self.generation = 0  # 本进程已加载的代号
+
+    def _path(self, gen):
+        return os.path.join(self.run_dir, f"{self.name}.{gen}.json")
+
+    def current_generation(self):
+        try:
+            with open(self.pointer, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def publish(self, payload):
+        gen = max(self.current_generation(), self.generation) + 1
+        write_json_atomic(self._path(gen), payload)
+        tmp = f"{self.pointer}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(str(gen))
+        os.replace(tmp, self.pointer)
+        self.generation = gen
+        self._prune(gen)
+        return gen
+
+    def _prune(self, gen):
+        prefix = f"{self.name}."
+        for name in os.listdir(self.run_dir):
+            if not (name.startswith(prefix) and name.endswith(".json")):
+                continue
+            try:
+                old = int(name[len(prefix):-len(".json")])
+            except ValueError:
+                continue
+            if old <= gen - self.KEEP:
+                try:
+                    os.remove(os.path.join(self.run_dir, name))
+                except OSError:
+                    pass
+
+    def load(self, gen):
+        """mmap 读取快照 (页缓存在各进程间共享)，返回解析后的内容"""
+        with open(self._path(gen), 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return json.loads(mm[:])
+
+    def load_latest(self):
+        """有比本进程更新的代号时返回其内容，否则返回 None"""
+        gen = self.current_generation()
+        if gen <= self.generation:
+            return None
+        try:
+            payload = self.load(gen)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] 读取快照 {gen} 失败: {e}", flush=True)
+            return None
+        self.generation = gen
+        return payload
+
+    def follow(self, on_load, interval=1.0):
+        def loop():
+            while True:
+                time.sleep(interval)
+                payload = self.load_latest()
+                if payload is not None:
+                    try:
+                        on_load(payload)
+                    except Exception as e:
+                        print(f"[ERROR] 应用快照失败: {e}", flush=True)
+
+        threading.Thread(target=loop, daemon=True, name="snapshot-follower").start()
+
+
+# ================= 用户状态 =================
+class UserStateSync:
+    """
+    files: {名称: (文件路径, 重新加载函数)}
+    writing(名称) 期间持有该文件的跨进程锁，进入时若磁盘上有其他进程的修改先重新加载。
+    未启用时 writing 不做任何事，行为与单进程一致。
+    """
+
+    def __init__(self, run_dir, files, enabled):
+        self.enabled = enabled
+        self.files = files
+        self._seen = {}
+        self._locks = {name: FileLock(os.path.join(run_dir, f"{name}.lock")) for name in files} if enabled else {}
+
+    def _reload_if_changed(self, name):
+        path, reload = self.files[name]
+        mtime = _mtime_ns(path)
+        if mtime != self._seen.get(name):
+            self._seen[name] = mtime
+            reload()
+
+    @contextmanager
+    def writing(self, name):
+        if not self.enabled:
+            yield
+            return
+        with self._locks[name]:
+            self._reload_if_changed(name)
+            yield
+            self._seen[name] = _mtime_ns(self.files[name][0])
+
+    def refresh(self):
+        """立即加载其他进程已写入的修改 (调用方持有内存缓存的锁)"""
+        if self.enabled:
+            for name in self.files:
+                self._reload_if_changed(name)
+
+    def mark_loaded(self):
+        for name, (path, _) in self.files.items():
+            self._seen[name] = _mtime_ns(path)
+
+    def poll(self, lock, interval=1.0):
+        """后台轮询其他进程的写入；lock 为保护内存缓存的锁"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                for name in self.files:
+                    try:
+                        with lock:
+                            self._reload_if_changed(name)
+                    except Exception as e:
+                        print(f"[ERROR] 重新加载 {name} 失败: {e}", flush=True)
+
+        threading.Thread(target=loop, daemon=True, name="user-state-poll").start()
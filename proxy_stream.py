@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+视频代理的上游流复用
+
+浏览器播放时常常并发打开多个重叠的 Range 请求然后很快中断，
+每个请求都直连上游会造成大量连接抖动。这里把 Range 起点向下对齐，
+同一资源上重叠的并发请求共享一条上游连接：
+  - 由消费者按需拉取数据（没人要数据就不读上游）
+  - 最后一个消费者断开时立即关闭上游
+  - 根据实测吞吐自适应调整分块大小
+"""
+import re
+import time
+import threading
+from collections import deque
+
+# ================= 配置区 =================
+ALIGN = 64 * 1024                  # 上游 Range 起点对齐粒度
+JOIN_AHEAD = 2 * 1024 * 1024       # 新请求起点领先当前读取位置多少字节内仍可复用
+MAX_BUFFER = 16 * 1024 * 1024      # 单条共享流最多缓存的字节数
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024
+TARGET_CHUNK_SECONDS = 0.05        # 每个块期望的读取耗时
+
+_RANGE_RE = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.IGNORECASE)
+_CONTENT_RANGE_RE = re.compile(r'^\s*bytes\s+(\d+)-(\d+)/(\d+)\s*$', re.IGNORECASE)
+
+# 透传给客户端的上游响应头
+PASS_HEADERS = ('content-type', 'accept-ranges', 'last-modified', 'etag', 'cache-control')
+
+STATS = {"upstream_opens": 0, "upstream_bytes": 0, "shared_joins": 0}
+
+
+def parse_range(header):
+    """解析单段 Range 头，返回 (start, end)，end 为 None 表示开放区间；无法处理时返回 None"""
+    if not header:
+        return 0, None
+    m = _RANGE_RE.match(header)
+    if not m or not m.group(1):
+        # 多段 Range 或后缀 Range (bytes=-N) 交给透传逻辑
+        return None
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else None
+    if end is not None and end < start:
+        return None
+    return start, end
+
+
+def align_down(offset):
+    return offset - offset % ALIGN
+
+
+class AdaptiveChunker:
+    """根据吞吐的滑动平均选择块大小 (2 的幂, MIN_CHUNK ~ MAX_CHUNK)"""
+
+    def __init__(self, initial=64 * 1024):
+        self.size = initial
+        self._rate = None
+
+    def observe(self, nbytes, seconds):
+        if seconds <= 0 or nbytes <= 0:
+            return
+        rate = nbytes / seconds
+        self._rate = rate if self._rate is None else self._rate * 0.7 + rate * 0.3
+        target = self._rate * TARGET_CHUNK_SECONDS
+        size = MIN_CHUNK
+        while size * 2 <= target and size < MAX_CHUNK:
+            size *= 2
+        self.size = size
+
+
+class StreamUnavailable(Exception):
+    """共享流不可用（上游不支持 Range / 打开失败 / 消费者落后于缓冲区）"""
+
+
+class SharedStream:
+    def __init__(self, key, start, opener):
+        self.key = key
+        self.start = start
+        self._opener = opener
+        self.cond = threading.Condition()
+        self.chunks = deque()
+        self.buf_start = start     # 缓冲区首字节的绝对偏移
+        self.pos = start           # 已从上游读到的绝对偏移
+        self.consumers = {}        # consumer_id -> 下一个要读的绝对偏移
+        self._next_cid = 0
+        self.reading = False
+        self.opened = False
+        self.closed = False
+        self.eof = False
+        self.error = None
+        self.response = None
+        self.total = None
+        self.headers = {}
+        self.chunker = AdaptiveChunker()
+        self._iter = None
+
+    # ---------- 打开 ----------
+    def open(self):
+        """打开上游，判断能否共享；不能共享时把响应留给调用方透传"""
+        try:
+            r = self._opener(self.start)
+            STATS["upstream_opens"] += 1
+        except Exception as e:
+            with self.cond:
+                self.error = e
+                self.opened = True
+                self.closed = True
+                self.cond.notify_all()
+            raise StreamUnavailable(str(e))
+
+        total = None
+        if r.status_code == 206:
+            m = _CONTENT_RANGE_RE.match(r.headers.get('content-range', ''))
+            if m and int(m.group(1)) == self.start:
+                total = int(m.group(3))
+        elif r.status_code == 200 and self.start == 0 and 'content-length' in r.headers:
+            total = int(r.headers['content-length'])
+
+        with self.cond:
+            self.response = r
+            self.opened = True
+            if total is None:
+                # 不可共享：标记关闭，原响应由调用方接管
+                self.closed = True
+                self.error = StreamUnavailable(f"upstream status {r.status_code}")
+            else:
+                self.total = total
+                self.headers = {k: v for k, v in r.headers.items() if k.lower() in PASS_HEADERS}
+                self._iter = r.iter_bytes()
+            self.cond.notify_all()
+        return total is not None
+
+    def wait_open(self, timeout=30.0):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.opened, timeout):
+                raise StreamUnavailable("open timeout")
+            if self.error is not None:
+                raise StreamUnavailable(str(self.error))
+
+    # ---------- 消费者管理 (调用方持有注册表锁) ----------
+    def joinable(self, start):
+        with self.cond:
+            if self.closed or self.eof:
+                return False
+            if self.total is not None and start >= self.total:
+                return False
+            return self.buf_start <= start <= self.pos + JOIN_AHEAD
+
+    def attach(self, start):
+        with self.cond:
+            cid = self._next_cid
+            self._next_cid += 1
+            self.consumers[cid] = start
+            return cid
+
+    def detach(self, cid):
+        """移除消费者，返回是否已无人使用"""
+        with self.cond:
+            self.consumers.pop(cid, None)
+            if self.consumers:
+                self._trim()
+                return False
+            self.closed = True
+            self.chunks.clear()
+            self.cond.notify_all()
+        self._close_upstream()
+        return True
+
+    def _close_upstream(self):
+        r = self.response
+        if r is not None:
+            try:
+                r.close()
+            except Exception:
+                pass
+
+    # ---------- 读取 ----------
+    def _trim(self):
+        """丢弃所有消费者都已读过的数据；超过上限时强制丢弃最旧的块"""
+        low = min(self.consumers.values()) if self.consumers else self.pos
+        buffered = self.pos - self.buf_start
+        while self.chunks:
+            head = len(self.chunks[0])
+            if self.buf_start + head <= low or buffered > MAX_BUFFER:
+                self.chunks.popleft()
+                self.buf_start += head
+                buffered -= head
+            else:
+                break
+
+    def _slice(self, offset, end):
+        """从缓冲区取出 offset 开始的一段数据 (不跨块)"""
+        base = self.buf_start
+        for chunk in self.chunks:
+            if offset < base + len(chunk):
+                lo = offset - base
+                hi = len(chunk)
+                if end is not None:
+                    hi = min(hi, end - base + 1)
+                return chunk[lo:hi]
+            base += len(chunk)
+        return b""
+
+    def _fill(self):
+        """从上游读取一个自适应大小的块（仅由持有读取权的消费者调用）"""
+        want = self.chunker.size
+        parts = []
+        got = 0
+        t0 = time.perf_counter()
+        done = False
+        try:
+            while got < want:
+                piece = next(self._iter)
+                parts.append(piece)
+                got += len(piece)
+        except StopIteration:
+            done = True
+        self.chunker.observe(got, time.perf_counter() - t0)
+        data = b"".join(parts)
+        STATS["upstream_bytes"] += len(data)
+        with self.cond:
+            if data:
+                self.chunks.append(data)
+                self.pos += len(data)
+            if done:
+                self.eof = True
+            self._trim()
+
+    def read(self, cid, end):
+        """按消费者偏移逐块产出数据，end 为包含的结束偏移"""
+        while True:
+            with self.cond:
+                if cid not in self.consumers:
+                    return
+                offset = self.consumers[cid]
+                if (end is not None and offset > end) or offset >= self.total:
+                    return
+                if offset < self.buf_start:
+                    raise StreamUnavailable("consumer fell behind shared buffer")
+                data = None
+                if offset < self.pos:
+                    data = self._slice(offset, end)
+                    self.consumers[cid] = offset + len(data)
+                    self._trim()
+                elif self.error is not None:
+                    raise StreamUnavailable(str(self.error))
+                elif self.eof or self.closed:
+                    return
+                elif self.reading:
+                    self.cond.wait(1.0)
+                    continue
+                else:
+                    self.reading = True
+            if data:
+                yield data
+                continue
+            try:
+                self._fill()
+            except Exception as e:
+                with self.cond:
+                    self.error = e
+            finally:
+                with self.cond:
+                    self.reading = False
+                    self.cond.notify_all()
+
+
+class StreamRegistry:
+    """按 (url, cookie) 管理可复用的共享流"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    def acquire(self, key, start, opener):
+        """返回 (stream, consumer_id, passthrough_response)；不可共享时 stream 为 None"""
+        owner = False
+        with self._lock:
+            stream = None
+            for s in self._streams.get(key, []):
+                if s.joinable(start):
+                    stream = s
+                    STATS["shared_joins"] += 1
+                    break
+            if stream is None:
+                stream = SharedStream(key, align_down(start), opener)
+                self._streams.setdefault(key, []).append(stream)
+                owner = True
+            cid = stream.attach(start)
+
+        if owner:
+            try:
+                shareable = stream.open()
+            except StreamUnavailable:
+                self._remove(stream)
+                raise
+            if not shareable:
+                self._remove(stream)
+                return None, None, stream.response
+        else:
+            try:
+                stream.wait_open()
+            except StreamUnavailable:
+                self.release(stream, cid)
+                raise
+        return stream, cid, None
+
+    def release(self, stream, cid):
+        if stream.detach(cid):
+            self._remove(stream)
+
+    def _remove(self, stream):
+        with self._lock:
+            lst = self._streams.get(stream.key)
+            if lst and stream in lst:
+                lst.remove(stream)
+                if not lst:
+                    del self._streams[stream.key]
+
+    def active_count(self):
+        with self._lock:
+            return sum(len(v) for v in self._streams.values())
+
+
+REGISTRY = StreamRegistry()
+
+
+def serve_range(key, start, end, opener):
+    """
+    为一个客户端 Range 请求准备响应。
+    返回 (status, headers, body_iter) ；上游不可共享时返回 (None, None, upstream_response)
+    """
+    stream, cid, passthrough = REGISTRY.acquire(key, start, opener)
+    if stream is None:
+        return None, None, passthrough
+
+    total = stream.total
+    if start >= total:
+        REGISTRY.release(stream, cid)
+        return 416, [('Content-Range', f'bytes */{total}')], iter(())
+
+    last = total - 1 if end is None else min(end, total - 1)
+    headers = list(stream.headers.items())
+    headers.append(('Content-Range', f'bytes {start}-{last}/{total}'))
+    headers.append(('Content-Length', str(last - start + 1)))
+
+    def body():
+        current, current_cid = stream, cid
+        offset = start
+        try:
+            while offset <= last:
+                try:
+                    for data in current.read(current_cid, last):
+                        offset += len(data)
+                        yield data
+                    break
+                except StreamUnavailable:
+                    # 落后于共享缓冲区：从当前偏移改用另一条流继续
+                    REGISTRY.release(current, current_cid)
+                    current = None
+                    try:
+                        current, current_cid, passthrough = REGISTRY.acquire(key, offset, opener)
+                    except StreamUnavailable:
+                        return
+                    if current is None:
+                        passthrough.close()
+                        return
+        finally:
+            if current is not None:
+                REGISTRY.release(current, current_cid)
+
+    return 206, headers, body()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+按客户端的限速与公平调度
+
+/api/episodes、/api/play_info、/video_proxy 的每个请求都会变成上游请求。前端失败后会重试，
+一个陷入重试循环的客户端就能占满出站连接和工作线程。这里提供两样东西：
+
+  - TokenBucket / ClientBuckets：每个客户端一个令牌桶，元数据接口按请求数计，视频按字节数计，
+    两者预算分开。请求数超出时直接返回 429 和 Retry-After；视频字节超出时放慢该客户端的转发
+  - FairScheduler：有限个并发名额，名额用完后请求排队而不是开新线程去等上游。
+    每个客户端同时占用的名额有上限，空出的名额在排队的客户端之间轮转分配，
+    重试刷屏的客户端只会排在自己的队列里；排队超过截止时间或队列已满时返回 503
+
+客户端按 IP 区分，请求带 X-AnimeOne-Client 头时再按它细分 (同一出口 IP 后的多台设备)。
+注意浏览器 <video> 元素发出的 /video_proxy 请求无法带自定义头，只能按 IP 区分：
+同一 NAT 后的所有设备共用一份视频预算 (VIDEO_STREAMS_PER_CLIENT 个流、同一个字节令牌桶)，
+家里多台设备同时播放时需要相应调大这些值。
+状态保存在进程内，多进程部署时每个 worker 各有一份预算。
+"""
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import metrics
+
+REJECTED = metrics.Counter("animeone_rate_limited_total", "被限速或排队超时拒绝的请求数（按预算和原因）")
+QUEUE_WAIT = metrics.Histogram("animeone_fair_queue_wait_seconds", "公平调度的排队等待时间")
+
+
+class Throttled(Exception):
+    """请求被拒绝；retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, budget, reason, retry_after):
+        super().__init__(f"{budget} 请求过多 ({reason})，{max(1, math.ceil(retry_after))} 秒后重试")
+        self.budget = budget
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ================= 令牌桶 =================
+class TokenBucket:
+    """每秒补充 rate 个令牌，最多积攒 burst 个"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1, now=None):
+        """取不到时不扣令牌，返回还需等待的秒数；取到返回 0"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now=None):
+        """无论够不够都扣除 (可以欠账)，返回为还清欠账需要等待的秒数，用于按字节限速"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class ClientBuckets:
+    """客户端 -> 令牌桶，超过 max_clients 时淘汰最久未活动的客户端"""
+
+    def __init__(self, name, rate, burst, max_clients=4096):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.stats = {"allowed": 0, "limited": 0}
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, client, now):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket
+
+    def check(self, client, amount=1):
+        """令牌不足时抛 Throttled"""
+        now = time.monotonic()
+        with self._lock:
+            wait = self._bucket(client, now).take(amount, now)
+        if wait:
+            self.stats["limited"] += 1
+            REJECTED.inc(budget=self.name, reason="rate")
+            raise Throttled(self.name, "rate", wait)
+        self.stats["allowed"] += 1
+
+    def consume(self, client, amount):
+        """扣除 amount 个令牌，返回调用方应当暂停的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            wait = self._bucket(client, now).consume(amount, now)
+        if wait:
+            self.stats["limited"] += 1
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# ================= 公平调度 =================
+class _Waiter:
+    __slots__ = ("client", "event", "granted")
+
+    def __init__(self, client):
+        self.client = client
+        self.event = threading.Event()
+        self.granted = False
+
+
+class FairScheduler:
+    """
+    slots        同时进行的请求总数
+    per_client   单个客户端同时占用的名额上限
+    max_waiting  排队请求总数上限，超出时直接拒绝
+    """
+
+    def __init__(self, name, slots, per_client, max_waiting=64):
+        self.name = name
+        self.slots = slots
+        self.per_client = per_client
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self.running = {}             # 客户端 -> 占用的名额数
+        self.queues = OrderedDict()   # 客户端 -> deque[_Waiter]，按轮转顺序排列
+        self.stats = {"granted": 0, "queued": 0, "queue_full": 0, "deadline": 0}
+        self._lock = threading.Lock()
+
+    def _can_run(self, client):
+        return self.active < self.slots and self.running.get(client, 0) < self.per_client
+
+    def _grant(self, client):
+        self.active += 1
+        self.running[client] = self.running.get(client, 0) + 1
+        self.stats["granted"] += 1
+
+    def _dispatch(self):
+        """把空出的名额轮流分给排队的客户端 (每次一个，分完后该客户端移到队尾)"""
+        progressed = True
+        while self.active < self.slots and self.queues and progressed:
+            progressed = False
+            for client in list(self.queues):
+                if not self._can_run(client):
+                    continue
+                queue = self.queues.pop(client)
+                waiter = queue.popleft()
+                if queue:
+                    self.queues[client] = queue
+                self.waiting -= 1
+                self._grant(client)
+                waiter.granted = True
+                waiter.event.set()
+                progressed = True
+                break
+
+    def acquire(self, client, timeout):
+        """取得一个名额；排队 timeout 秒仍未轮到时抛 Throttled"""
+        with self._lock:
+            if client not in self.queues and self._can_run(client):
+                self._grant(client)
+                return
+            if self.waiting >= self.max_waiting:
+                self.stats["queue_full"] += 1
+                REJECTED.inc(budget=self.name, reason="queue_full")
+                raise Throttled(self.name, "queue_full", max(1.0, timeout))
+            waiter = _Waiter(client)
+            self.queues.setdefault(client, deque()).append(waiter)
+            self.waiting += 1
+            self.stats["queued"] += 1
+        t0 = time.monotonic()
+        waiter.event.wait(timeout)
+        with self._lock:
+            QUEUE_WAIT.observe(time.monotonic() - t0, scheduler=self.name)
+            if waiter.granted:
+                return
+            queue = self.queues.get(client)
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[client]
+            self.waiting -= 1
+            self.stats["deadline"] += 1
+        REJECTED.inc(budget=self.name, reason="deadline")
+        raise Throttled(self.name, "deadline", max(1.0, timeout))
+
+    def release(self, client):
+        with self._lock:
+            self.active -= 1
+            count = self.running.get(client, 0) - 1
+            if count > 0:
+                self.running[client] = count
+            else:
+                self.running.pop(client, None)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, client, timeout):
+        self.acquire(client, timeout)
+        try:
+            yield
+        finally:
+            self.release(client)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, active=self.active, waiting=self.waiting, clients=len(self.running))
+
+
+# ================= 视频转发 =================
+class ThrottledBody:
+    """
+    包装流式响应体：每转发一块按客户端的字节预算扣除令牌，欠账时暂停；
+    响应关闭时 (包括还没开始转发就断开) 调用一次 on_close，用来归还调度名额。
+    """
+
+    def __init__(self, body, buckets, client, on_close=None):
+        self.body = body
+        self.buckets = buckets
+        self.client = client
+        self.on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self.body:
+            wait = self.buckets.consume(self.client, len(chunk))
+            if wait:
+                time.sleep(wait)
+            yield chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self.body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+番剧列表的自适应刷新
+
+原先每 2 小时无条件重建一次目录：新集数最多晚 2 小时出现，深夜没有变化时也要整表重建。
+现在分成两步：
+  - 轻量轮询：带 If-None-Match / If-Modified-Since 请求 animelist.json，
+    304 或内容哈希与上次相同都视为没有变化，不解析、不重建
+  - 自适应间隔：基础间隔按下面几项伸缩，限制在 [min_interval, max_interval]
+      今天 / 昨天在播的番剧数相对季度日均 (anime1 多在播出次日上传)
+      过去各小时观察到变化的频率 (逐次衰减的直方图，旧的规律会慢慢淡出)
+      连续没有变化的次数 (每次乘 QUIET_BACKOFF)
+    刚发现变化时下一次立即用最短间隔，同一批上传往往陆续到达
+
+只有状态字符串变化的番剧才需要让其集数缓存失效，见 changed_statuses()。
+"""
+import time
+import hashlib
+import datetime
+
+QUIET_BACKOFF = 1.5     # 每连续一次没有变化，间隔乘以该系数
+MAX_QUIET_STEPS = 6
+HOUR_DECAY = 0.97       # 每记录一次变化，小时直方图整体衰减一次，约 23 次之前的变化权重减半
+ACTIVITY_RANGE = (0.25, 4.0)
+
+
+def changed_statuses(old_records, new_records):
+    """返回状态字符串变化了的番剧 id (新出现或消失的番剧不算，它们没有集数缓存可以失效)"""
+    old_status = {r.id: r.status for r in old_records}
+    return [r.id for r in new_records if r.id in old_status and old_status[r.id] != r.status]
+
+
+class ConditionalFetch:
+    """记住上次响应的校验头和内容哈希，判断 animelist.json 是否变化"""
+
+    def __init__(self):
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self._pending = None  # 尚未成功应用的响应的 (ETag, Last-Modified)
+        self.stats = {"polls": 0, "not_modified": 0, "same_hash": 0, "changed": 0}
+
+    def headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def check(self, response):
+        """返回变化后的内容 (bytes)，没有变化时返回 None；非 200 / 304 抛 httpx.HTTPStatusError"""
+        self.stats["polls"] += 1
+        if response.status_code == 304:
+            self.stats["not_modified"] += 1
+            return None
+        response.raise_for_status()
+        body = response.content
+        digest = hashlib.sha1(body).hexdigest()
+        validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        if digest == self.digest:
+            # 内容就是已应用的那份，校验头可以直接记下
+            self.etag, self.last_modified = validators
+            self.stats["same_hash"] += 1
+            return None
+        # 校验头等 commit() 时才记录：解析或重建失败时下次不能带着它们拿到 304
+        self._pending = validators
+        self.stats["changed"] += 1
+        return body
+
+    def commit(self, body):
+        """内容成功应用后再记录哈希和校验头，解析失败时下次仍会重试"""
+        self.digest = hashlib.sha1(body).hexdigest()
+        if self._pending is not None:
+            self.etag, self.last_modified = self._pending
+            self._pending = None
+
+
+class RefreshScheduler:
+    """
+    airing_counts() 返回 (今天在播数, 昨天在播数, 季度日均在播数)，没有季度表时返回 None。
+    """
+
+    def __init__(self, airing_counts=None, base_interval=1800, min_interval=300, max_interval=7200):
+        self.airing_counts = airing_counts
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hourly = [0.0] * 24
+        self.quiet = 0
+        self.just_changed = False
+        self.next_delay = min_interval
+        self.last_change = None
+
+    # ---------- 记录 ----------
+    def record(self, changed, now=None):
+        now = now or time.time()
+        if changed:
+            hour = datetime.datetime.fromtimestamp(now).hour
+            self.hourly = [v * HOUR_DECAY for v in self.hourly]
+            self.hourly[hour] += 1
+            self.quiet = 0
+            self.last_change = now
+        else:
+            self.quiet = min(MAX_QUIET_STEPS, self.quiet + 1)
+        self.just_changed = changed
+
+    # ---------- 间隔 ----------
+    def _airing_factor(self):
+        counts = self.airing_counts() if self.airing_counts else None
+        if not counts:
+            return 1.0
+        today, yesterday, mean = counts
+        if mean <= 0:
+            return 1.0
+        return (today + yesterday) / (2 * mean)
+
+    def _hour_factor(self, now):
+        total = sum(self.hourly)
+        if total < 1:
+            return 1.0
+        hour = datetime.datetime.fromtimestamp(now).hour
+        # 本小时及前后各一小时的平均值相对全天均值
+        window = sum(self.hourly[(hour + d) % 24] for d in (-1, 0, 1)) / 3
+        return window / (total / 24)
+
+    def activity(self, now=None):
+        now = now or time.time()
+        lo, hi = ACTIVITY_RANGE
+        return min(hi, max(lo, self._airing_factor() * self._hour_factor(now)))
+
+    def delay(self, now=None):
+        """距下一次轮询的秒数"""
+        if self.just_changed:
+            delay = self.min_interval
+        else:
+            delay = self.base_interval * QUIET_BACKOFF ** self.quiet / self.activity(now)
+        self.next_delay = min(self.max_interval, max(self.min_interval, delay))
+        return self.next_delay
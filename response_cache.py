@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+只读接口的响应缓存
+
+两次目录刷新之间，同样参数的 /api/list、/api/season_schedule 等请求结果完全相同。
+用 @cache.cached("catalogue", "favorites") 装饰视图函数后：
+  - 缓存键 = 路径 + 排好序的查询参数 + 所依赖数据的代号 (如目录代号、追番代号、播放记录代号)
+  - 代号由调用方提供的函数给出；数据变化后代号随之变化，旧响应不会再被命中。
+    视图只声明自己实际读取的数据，无关数据的变化不会让它失效
+  - 本地后端按 (依赖名, 代号) 索引条目，某类代号变化时只删除依赖其旧代号的条目，
+    开销与失效的条目数成正比，与缓存总条目数无关
+  - 只缓存 GET 的非流式 200 响应；命中时重新套用 ETag 条件请求
+
+本地后端是按字节数限额的 LRU；可选的 Redis 后端供多进程共享 (需要安装 redis 包)，
+条目带 TTL，代号需要在各进程间一致 (例如目录快照代号、变更日志位置)。
+"""
+import json
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+
+from flask import request, make_response, Response
+
+import metrics
+
+ENTRY_OVERHEAD = 256  # 估算每个条目除响应体外的内存开销 (键、头部、容器)
+_SKIP_HEADERS = frozenset(("content-length", "set-cookie"))
+
+REQUESTS = metrics.Counter("animeone_response_cache_requests_total", "响应缓存查询次数（按路由和命中/未命中）")
+
+
+class LocalBackend:
+    """进程内 LRU，按响应体字节数限额"""
+
+    def __init__(self, max_bytes, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self._data = OrderedDict()  # key -> (entry, size)
+        self._deps = {}  # 依赖名 -> {代号: 依赖该代号的键集合}
+        self.bytes = 0
+        self.stats = {"evicted": 0, "purged": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, entry):
+        size = len(entry[2]) + ENTRY_OVERHEAD
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._data[key] = (entry, size)
+            self.bytes += size
+            for kind, token in key[2]:
+                self._deps.setdefault(kind, {}).setdefault(token, set()).add(key)
+            while self.bytes > self.max_bytes and self._data:
+                self._drop(next(iter(self._data)))
+                self.stats["evicted"] += 1
+
+    def _drop(self, key):
+        """删除一个条目及其索引，调用方持有锁"""
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        self.bytes -= item[1]
+        for kind, token in key[2]:
+            keys = self._deps[kind][token]
+            keys.discard(key)
+            if not keys:
+                del self._deps[kind][token]
+
+    def purge(self, kind, token):
+        """删除依赖 kind 但代号不是 token 的条目"""
+        with self._lock:
+            groups = self._deps.get(kind, {})
+            for old in [t for t in groups if t != token]:
+                stale = list(groups.get(old, ()))
+                for k in stale:
+                    self._drop(k)
+                self.stats["purged"] += len(stale)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """多进程共享：条目序列化为 头部 JSON + 换行 + 响应体，带 TTL"""
+
+    def __init__(self, url, ttl=600, max_entry_bytes=4 * 1024 * 1024, prefix="animeone:rc:"):
+        import redis  # 可选依赖，只在配置了 Redis 时导入
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.prefix = prefix
+        self.bytes = 0
+        self.stats = {"errors": 0}
+        self._warned = False
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def _failed(self, e):
+        self.stats["errors"] += 1
+        if not self._warned:
+            self._warned = True
+            print(f"[WARN] 响应缓存 Redis 不可用，暂按未命中处理: {e}", flush=True)
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            self._failed(e)
+            return None
+        if raw is None:
+            return None
+        head, _, body = raw.partition(b"\n")
+        status, headers = json.loads(head)
+        return status, [tuple(h) for h in headers], body
+
+    def set(self, key, entry):
+        status, headers, body = entry
+        if len(body) > self.max_entry_bytes:
+            return
+        raw = json.dumps([status, headers], ensure_ascii=False).encode() + b"\n" + body
+        try:
+            self.client.setex(self._key(key), self.ttl, raw)
+            self._warned = False
+        except Exception as e:
+            self._failed(e)
+
+    def purge(self, kind, token):
+        # 键里带代号，旧条目不会再被命中，靠 TTL 过期
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class ResponseCache:
+    """
+    tokens: {依赖名: 返回当前代号的函数}
+    before_miss(depends): 未命中、计算响应之前调用 (如先加载其他进程写入的用户状态)
+    """
+
+    def __init__(self, backend, tokens, before_miss=None, enabled=True):
+        self.backend = backend
+        self.tokens = tokens
+        self.before_miss = before_miss
+        self.enabled = enabled
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self._seen = {}
+
+    def _current(self, depends):
+        return tuple((kind, self.tokens[kind]()) for kind in depends)
+
+    def _observe(self, tokens):
+        for kind, token in tokens:
+            if self._seen.get(kind, token) != token:
+                self.backend.purge(kind, token)
+            self._seen[kind] = token
+
+    def cached(self, *depends):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method != "GET":
+                    return view(*args, **kwargs)
+                tokens = self._current(depends)
+                self._observe(tokens)
+                key = (request.path, tuple(sorted(request.args.items(multi=True))), tokens)
+                route = request.url_rule.rule if request.url_rule is not None else request.path
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.stats["hits"] += 1
+                    REQUESTS.inc(route=route, result="hit")
+                    return self._restore(entry)
+                self.stats["misses"] += 1
+                REQUESTS.inc(route=route, result="miss")
+                if self.before_miss is not None:
+                    self.before_miss(depends)
+                response = make_response(view(*args, **kwargs))
+                # 计算期间数据变了 (代号不同) 的结果不存，避免旧键下存入新数据
+                if self._cacheable(response) and self._current(depends) == tokens:
+                    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS]
+                    self.backend.set(key, (response.status_code, headers, response.get_data()))
+                    self.stats["stored"] += 1
+                return response
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _cacheable(response):
+        return response.status_code == 200 and not response.is_streamed and not response.direct_passthrough
+
+    @staticmethod
+    def _restore(entry):
+        status, headers, body = entry
+        response = Response(body, status=status, headers=headers)
+        if response.get_etag()[0]:
+            response = response.make_conditional(request)
+        return response
+
+    def snapshot(self):
+        stats = dict(self.stats, entries=len(self.backend), bytes=self.backend.bytes)
+        stats.update(self.backend.stats)
+        total = self.stats["hits"] + self.stats["misses"]
+        stats["hit_ratio"] = self.stats["hits"] / total if total else 0.0
+        return stats
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+季度表索引
+
+schedule.json 是 "年_季" -> 7 个列表 (周日到周六) 的原始抓取结果。
+加载时一次性建好：
+  - 每个季度按星期排好的条目，封面地址已按 cover_map 解析好
+  - 番剧 id -> [(年, 季, 星期)] 的反向索引
+  - 按时间从新到旧排列的季度列表
+请求时只需按 key 取出，不再逐天逐部遍历。
+"""
+import datetime
+
+SEASON_ORDER = {"冬季": 1, "春季": 2, "夏季": 3, "秋季": 4}
+
+
+def season_of(date):
+    """日期所在的季度，例如 2024-05-01 -> (2024, "春季")"""
+    season = ("冬季", "春季", "夏季", "秋季")[(date.month - 1) // 3]
+    return date.year, season
+
+
+def season_key(year, season):
+    return f"{year}_{season}"
+
+
+def _season_score(key):
+    year, _, season = key.partition("_")
+    try:
+        return int(year) * 10 + SEASON_ORDER.get(season, 0)
+    except ValueError:
+        return 0
+
+
+class ScheduleIndex:
+    """
+    resolve_poster(title, stored_poster) 返回该番剧应使用的封面地址，
+    在建索引时对每个条目调用一次。
+    """
+
+    def __init__(self, schedule=None, resolve_poster=None):
+        self.days = {}        # key -> 7 个元组，每个元素是条目字典
+        self.by_anime = {}    # 番剧 id -> [(year, season, weekday), ...]，从新到旧
+        self.seasons = []     # [(year, season), ...]，从新到旧
+        if schedule:
+            self._build(schedule, resolve_poster)
+
+    def _build(self, schedule, resolve_poster):
+        for key in sorted(schedule, key=_season_score, reverse=True):
+            week = schedule[key] or []
+            if not any(week):
+                continue
+            year, _, season = key.partition("_")
+            days = []
+            for weekday in range(7):
+                day_list = week[weekday] if weekday < len(week) else []
+                entries = []
+                for anime in day_list:
+                    anime_id = str(anime.get('id', ''))
+                    title = anime.get('title', '')
+                    poster = anime.get('poster', '')
+                    if resolve_poster is not None:
+                        poster = resolve_poster(title, poster)
+                    entries.append({
+                        "id": anime_id,
+                        "title": title,
+                        "poster": poster,
+                        "year": str(anime.get('year', year)),
+                        "season": anime.get('season', season),
+                    })
+                    self.by_anime.setdefault(anime_id, []).append((year, season, weekday))
+                days.append(tuple(entries))
+            self.days[key] = tuple(days)
+            self.seasons.append((year, season))
+
+    def __len__(self):
+        return len(self.days)
+
+    def __contains__(self, key):
+        return key in self.days
+
+    def week(self, year, season):
+        """某个季度按星期排好的条目，没有数据时返回 None"""
+        return self.days.get(season_key(year, season))
+
+    def appearances(self, anime_id):
+        return self.by_anime.get(str(anime_id), [])
+
+    def current_season(self, today=None):
+        """今天所在的季度；该季度还没有数据时退回最新的一个季度"""
+        year, season = season_of(today or datetime.date.today())
+        if season_key(year, season) in self.days:
+            return str(year), season
+        return self.seasons[0] if self.seasons else None
+
+    def today(self, today=None):
+        """返回 (year, season, weekday, 条目元组)，weekday 0 为周日，与季度表列顺序一致"""
+        today = today or datetime.date.today()
+        current = self.current_season(today)
+        if current is None:
+            return None
+        weekday = (today.weekday() + 1) % 7
+        return current[0], current[1], weekday, self.week(*current)[weekday]
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+番剧搜索：按相关度排序的精确 + 模糊匹配
+
+每部番剧的搜索字段 (AnimeRecord.search) 含四部分：简体标题、繁体标题、拼音首字母、全拼。
+同一部分的所有番剧拼成一个大字符串 (以换行分隔)，查询时用 str.find 在 C 层扫描，
+命中位置通过各条目的起始偏移二分换算成行号，比逐条 `in` 快得多。
+
+  - 精确匹配：查询原文、繁转简后的查询在标题中查找；纯字母查询再查首字母和全拼；
+    含汉字的查询 (包括 "jin击" 这种混写) 转成全拼后再查全拼
+  - 模糊匹配：精确结果太少时，用全拼的三元组倒排索引找共有三元组足够多的候选，
+    容忍少量错字 / 漏字 / 同音字
+  - 打分：命中字段 (标题 > 全拼 > 首字母)、是否前缀、命中位置、标题长度，
+    再加上是否追番、是否有播放记录；同分按 id 倒序
+结果按 (规范化查询, 用户状态版本) 缓存。
+
+输入联想 (SuggestIndex) 只做前缀匹配：四个字段的取值排成一个有序数组，
+查询前缀用二分定位区间，取区间内最新的几部。
+"""
+import re
+import bisect
+import heapq
+import threading
+from array import array
+from collections import Counter, OrderedDict
+
+FIELD_SEP = "\x1f"
+_FIELDS = ("sc", "tc", "initials", "pinyin")
+_FIELD_BASE = {"sc": 100, "tc": 100, "pinyin": 80, "initials": 70}
+FAVORITE_BOOST = 15
+PLAYED_BOOST = 10
+FUZZY_MIN_RESULTS = 5  # 精确结果少于该数时补充模糊匹配
+FUZZY_MAX_RESULTS = 50
+CACHE_SIZE = 512
+SUGGEST_SCAN = 256  # 前缀区间超过该长度时用堆取前 k 个，不整体排序
+
+_NORMALIZE_RE = re.compile(r"[\s　·・:：!！?？,，.。\-_~～'\"“”‘’()（）\[\]【】]+")
+_ASCII_RE = re.compile(r"^[a-z0-9]+$")
+_CJK_RE = re.compile(r"[㐀-鿿]")
+
+
+def normalize(text):
+    """小写并去掉空白和常见标点"""
+    return _NORMALIZE_RE.sub("", text.lower())
+
+
+def build_search_field(title_sc, title_tc, initials, full_pinyin):
+    return FIELD_SEP.join((title_sc, title_tc, initials, full_pinyin)).lower()
+
+
+def split_search_field(search):
+    """返回 (简体, 繁体, 首字母, 全拼)；兼容旧的 "简体|繁体|首字母" 格式 (没有全拼)"""
+    if FIELD_SEP in search:
+        parts = search.split(FIELD_SEP)
+        if len(parts) == 4:
+            return tuple(parts)
+    head, _, initials = search.rpartition("|")
+    sc, _, tc = head.partition("|")
+    return sc, tc, initials, ""
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Corpus:
+    """一个字段的所有取值，以及拼成的大字符串和每条的起始偏移"""
+    __slots__ = ("values", "text", "starts")
+
+    def __init__(self, values):
+        self.values = values
+        self.text = "\n".join(values)
+        starts = []
+        offset = 0
+        for v in values:
+            starts.append(offset)
+            offset += len(v) + 1
+        self.starts = starts
+
+    def find_all(self, query):
+        """[(行号, 命中位置)]，每行只取第一次命中"""
+        text = self.text
+        if text.count(query) * 16 > len(self.values):
+            # 命中很多时逐条查找更快 (每条的 in / find 都在 C 层)
+            return [(row, v.find(query)) for row, v in enumerate(self.values) if query in v]
+        starts, find = self.starts, text.find
+        out = []
+        i = find(query)
+        n = len(starts)
+        while i != -1:
+            row = bisect.bisect_right(starts, i) - 1
+            out.append((row, i - starts[row]))
+            if row + 1 >= n:
+                break
+            i = find(query, starts[row + 1])
+        return out
+
+
+class _TrigramIndex:
+    """全拼的三元组倒排索引：三元组 -> 行号数组"""
+
+    def __init__(self, values):
+        postings = {}
+        for row, v in enumerate(values):
+            for g in trigrams(v):
+                lst = postings.get(g)
+                if lst is None:
+                    lst = postings[g] = array("l")
+                lst.append(row)
+        self.postings = postings
+
+    def candidates(self, query, max_errors):
+        """
+        共有三元组数不少于 (三元组数 - 3 × 容错数) 的行，返回 [(行号, 共有数)]；
+        查询很短时该下限没有意义，至少要求共有一半以上
+        """
+        grams = trigrams(query)
+        if not grams:
+            return [], 0
+        need = max(len(grams) - 3 * max_errors, len(grams) // 2 + 1)
+        counts = Counter()
+        for g in grams:
+            lst = self.postings.get(g)
+            if lst is not None:
+                counts.update(lst)
+        return [(row, c) for row, c in counts.items() if c >= need], len(grams)
+
+
+class SearchEngine:
+    def __init__(self, index, to_pinyin=None, convert=None, previous=None):
+        """
+        index: ListIndex，行号与之一致，追番 / 播放记录从它读取
+        to_pinyin: 查询中含汉字时转全拼的函数；convert: 繁转简函数
+        previous: 上一个引擎，全拼未变时复用其三元组索引
+        """
+        self.index = index
+        self.to_pinyin = to_pinyin
+        self.convert = convert
+        fields = [tuple(normalize(v) for v in split_search_field(r.search)) for r in index.records]
+        self.corpora = {name: _Corpus([f[i] for f in fields]) for i, name in enumerate(_FIELDS)}
+        self._trigram = None
+        if previous is not None and previous.corpora["pinyin"].text == self.corpora["pinyin"].text:
+            self._trigram = previous._trigram
+        if previous is not None and all(
+                previous.corpora[f].text == self.corpora[f].text for f in _FIELDS):
+            self.suggest_index = previous.suggest_index
+        else:
+            self.suggest_index = SuggestIndex(self.corpora)
+        self._trigram_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.stats = {"queries": 0, "cache_hits": 0, "fuzzy": 0, "suggest": 0}
+
+    # ---------- 索引 ----------
+    def _trigram_index(self):
+        # 只有模糊匹配用得到，第一次需要时再建
+        if self._trigram is None:
+            with self._trigram_lock:
+                if self._trigram is None:
+                    pinyin = self.corpora["pinyin"].text
+                    self._trigram = _TrigramIndex(pinyin.split("\n") if pinyin else [])
+        return self._trigram
+
+    # ---------- 查询 ----------
+    def search(self, query):
+        """返回按相关度排好的行号列表"""
+        q = normalize(query)
+        if not q:
+            return []
+        key = (q, self.index.user_version)
+        self.stats["queries"] += 1
+        with self._cache_lock:
+            rows = self._cache.get(key)
+            if rows is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return rows
+        rows = self._rank(q)
+        with self._cache_lock:
+            self._cache[key] = rows
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return rows
+
+    def suggest(self, query, limit=8):
+        """
+        输入联想：标题 / 繁体标题 / 首字母 / 全拼以 query 开头的番剧行号。
+        含汉字的查询同时按繁转简和全拼查找，不足 limit 个时依次补充。
+        结果只取决于目录，不受追番和播放记录影响。
+        """
+        q = normalize(query)
+        if not q:
+            return []
+        self.stats["suggest"] += 1
+        index = self.suggest_index
+        rows = index.prefix(q, limit)
+        if len(rows) < limit:
+            variants = []
+            if self.convert is not None:
+                variants.append(normalize(self.convert(q)))
+            if self.to_pinyin is not None and _CJK_RE.search(q):
+                variants.append(normalize(self.to_pinyin(q)))
+            for v in variants:
+                if v and v != q:
+                    for row in index.prefix(v, limit):
+                        if row not in rows:
+                            rows.append(row)
+                if len(rows) >= limit:
+                    break
+        return rows[:limit]
+
+    def _rank(self, q):
+        scores = {}
+
+        def hit(field, query, bonus=0):
+            base = _FIELD_BASE[field] + bonus
+            corpus = self.corpora[field]
+            values = corpus.values
+            n = len(query)
+            get = scores.get
+            for row, pos in corpus.find_all(query):
+                length = len(values[row])
+                if pos == 0:
+                    s = base + (80 if length == n else 30) - length / 20
+                else:
+                    s = base - (pos if pos < 20 else 20) - length / 20
+                if s > get(row, -1e9):
+                    scores[row] = s
+
+        variants = {q}
+        if self.convert is not None:
+            variants.add(normalize(self.convert(q)))
+        for v in variants:
+            hit("sc", v)
+            hit("tc", v)
+
+        pinyin_q = None
+        if _ASCII_RE.match(q):
+            hit("initials", q)
+            pinyin_q = q
+        elif self.to_pinyin is not None and _CJK_RE.search(q):
+            pinyin_q = normalize(self.to_pinyin(q))
+            if _ASCII_RE.match(pinyin_q or ""):
+                # 汉字查询转拼音后的命中排在原文命中之后
+                hit("pinyin", pinyin_q, bonus=-20)
+            else:
+                pinyin_q = None
+        if pinyin_q and pinyin_q == q:
+            hit("pinyin", pinyin_q)
+
+        if len(scores) < FUZZY_MIN_RESULTS and pinyin_q and len(pinyin_q) >= 4:
+            self.stats["fuzzy"] += 1
+            max_errors = 1 if len(pinyin_q) < 8 else 2
+            candidates, total = self._trigram_index().candidates(pinyin_q, max_errors)
+            candidates.sort(key=lambda x: (-x[1], x[0]))
+            for row, common in candidates[:FUZZY_MAX_RESULTS]:
+                s = 40 * common / total
+                if row not in scores:
+                    scores[row] = s
+
+        # 追番和播放记录通常很少，直接遍历它们加分
+        index = self.index
+        for row in index.fav_order:
+            if row in scores:
+                scores[row] += FAVORITE_BOOST
+        for row in index.played_positions():
+            if row in scores:
+                scores[row] += PLAYED_BOOST
+        # 先按行号排好 (行号小 = id 大)，稳定排序后同分时新番在前
+        ranked = sorted(scores)
+        ranked.sort(key=scores.__getitem__, reverse=True)
+        return ranked
+
+
+class SuggestIndex:
+    """
+    输入联想的前缀索引：(字段取值, 行号) 按取值排序后拆成两个平行数组。
+    前缀 q 对应的条目是 [bisect_left(q), bisect_left(q + 最大码位)) 这一段；
+    与 q 完全相同的条目排在区间最前面，优先返回，其余按行号 (新番在前) 取前 k 个。
+    """
+
+    def __init__(self, corpora):
+        entries = sorted(
+            (value, row)
+            for name in _FIELDS
+            for row, value in enumerate(corpora[name].values)
+            if value
+        )
+        self.keys = [k for k, _ in entries]
+        self.rows = array("l", [r for _, r in entries])
+        # 只缓存区间很长的短前缀 (一两个字)，其数量受条目数 / SUGGEST_SCAN 限制
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix(self, q, limit):
+        """返回前缀为 q 的行号，最多 limit 个"""
+        keys = self.keys
+        lo = bisect.bisect_left(keys, q)
+        hi = bisect.bisect_left(keys, q + "\U0010ffff", lo)
+        if lo >= hi:
+            return []
+        out = []
+        i = lo
+        while i < hi and keys[i] == q:
+            if self.rows[i] not in out:
+                out.append(self.rows[i])
+            i += 1
+        if len(out) >= limit or i >= hi:
+            return out[:limit]
+        rest = self.rows[i:hi]
+        need = limit - len(out)
+        if hi - i > SUGGEST_SCAN:
+            key = (q, limit)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return list(cached)
+            # 同一部番剧最多出现四次 (四个字段)，多取一些再去重
+            picked = heapq.nsmallest(need * 4, set(rest))
+        else:
+            picked = sorted(set(rest))
+        seen = set(out)
+        for row in picked:
+            if row not in seen:
+                out.append(row)
+                if len(out) >= limit:
+                    break
+        if hi - i > SUGGEST_SCAN:
+            self._cache[(q, limit)] = tuple(out)
+        return out
@@ -1,4 +1,4 @@
-const { createApp, ref, onMounted, nextTick } = Vue;
+const { createApp, ref, computed, onMounted, nextTick } = Vue;
 
 createApp({
     setup() {
@@ -18,7 +18,11 @@ createApp({
             config.__retryCount = config.__retryCount || 0;
             if (config.__retryCount >= config.retry) return Promise.reject(err);
             config.__retryCount += 1;
-            await new Promise(r => setTimeout(r, config.retryDelay || 1000));
+            // 被限速 (429) 或排队超时 (503) 时按服务端给出的 Retry-After 等待，否则指数退避
+            const res = err.response;
+            const retryAfter = res && (res.status === 429 || res.status === 503) ? Number(res.headers["retry-after"]) : 0;
+            const delay = retryAfter > 0 ? retryAfter * 1000 : (config.retryDelay || 1000) * 2 ** (config.__retryCount - 1);
+            await new Promise(r => setTimeout(r, delay));
             return axios(config);
         });
 
@@ -31,8 +35,15 @@ createApp({
         const page = ref(1);
         const hasMore = ref(true);
         const searchQuery = ref("");
+        const searchSuggestions = ref([]);
         const animeMetaCache = ref({});
 
+        // 首页筛选与排序（由服务端位图索引计算，facets 为各取值的计数）
+        const PAGE_SIZE = 24;
+        const listFilters = ref({ year: "", season: "", status: "", sort: "" });
+        const listFacets = ref({ year: {}, season: {}, status: {} });
+        const facetYears = computed(() => Object.keys(listFacets.value.year || {}).sort((a, b) => b - a));
+
         // 季度逻辑
         const years = ref([]);
         const now = new Date();
@@ -71,7 +82,7 @@ createApp({
         const favoritesList = ref([]);
         const lastWatchedEpisode = ref(null);
         const historyList = ref([]);  // 历史记录列表
-        const descMap = ref({});  // 番剧介绍映射表
+        const descMap = ref({});  // 番剧介绍映射表 (打开详情页时按需加载)
 
         // ================== 辅助函数 ==================
         const rotateArray = (arr, startIndex) => [...arr.slice(startIndex), ...arr.slice(0, startIndex)];
@@ -85,28 +96,38 @@ createApp({
             return `${m}:${s < 10 ? '0' + s : s}`;
         };
 
-        // 加载番剧介绍数据
-        const loadDescMap = async () => {
-            try {
-                const res = await axios.get('/static/json/desc_map.json');
-                descMap.value = res.data || {};
-            } catch (e) {
-                console.error('加载介绍数据失败:', e);
+        // 批量获取番剧元数据 (封面/状态/追番/播放记录/介绍)
+        const BATCH_META_LIMIT = 200;
+        const fetchMetaBatch = async (ids, withDesc = false) => {
+            const metas = {};
+            const uniqueIds = [...new Set(ids.map(id => String(id)))];
+            for (let i = 0; i < uniqueIds.length; i += BATCH_META_LIMIT) {
+                const res = await axios.post('/api/meta/batch', { ids: uniqueIds.slice(i, i + BATCH_META_LIMIT), desc: withDesc });
+                if (res.data.code === 200) Object.assign(metas, res.data.data);
             }
+            return metas;
         };
 
         // ================== 核心业务 ==================
+        // 下一页游标：记录上一页最后一条的位置，后台刷新目录后翻页也不会重复或漏掉
+        let listCursor = null;
         const fetchList = async (reset = false) => {
-            if (reset) { page.value = 1; animeList.value = []; hasMore.value = true; }
+            if (reset) { page.value = 1; animeList.value = []; hasMore.value = true; listCursor = null; }
             loading.value = true;
             try {
-                const res = await axios.get(`/api/list?page=${page.value}&q=${searchQuery.value}`);
+                const params = { size: PAGE_SIZE, q: searchQuery.value };
+                for (const [k, v] of Object.entries(listFilters.value)) if (v) params[k] = v;
+                if (listCursor) params.cursor = listCursor; else params.page = page.value;
+                if (reset) params.facets = 1;
+                const res = await axios.get('/api/list', { params });
                 if (res.data.code === 200) {
-                    if (res.data.data.length < 24) hasMore.value = false;
+                    if (res.data.facets) listFacets.value = res.data.facets;
+                    listCursor = res.data.next_cursor || null;
+                    if (!listCursor) hasMore.value = false;
                     const newData = res.data.data.map(item => ({ ...item, posterLoading: false, coverFailed: false }));
                     updateCache(newData);
                     animeList.value = reset ? newData : [...animeList.value, ...newData];
-                    animeList.value.forEach(item => loadCover(item));
+                    loadCovers(animeList.value);
                 }
             } catch (e) { showError("获取列表失败"); } finally { loading.value = false; }
         };
@@ -124,26 +145,38 @@ createApp({
                     const sortedData = rotateArray(rawData, startIndex);
                     rawData.flat().forEach(item => { if (item.id) animeMetaCache.value[item.id] = { ...item }; });
                     weekData.value = sortedData.map(dayList => dayList.map(item => ({ ...item, posterLoading: false, coverFailed: false })));
-                    weekData.value.forEach(dayList => { dayList.forEach(item => loadCover(item)); });
+                    loadCovers(weekData.value.flat());
                 }
             } catch (e) { showError("获取新番表失败"); } finally { loading.value = false; }
         };
 
-        const loadCover = async (item) => {
-            if (item.poster || item.posterLoading || item.coverFailed) return;
-            if (animeMetaCache.value[item.id] && animeMetaCache.value[item.id].poster) {
-                item.poster = animeMetaCache.value[item.id].poster;
-                return;
-            }
-            item.posterLoading = true;
+        // 🔥 批量补全缺失的封面：一屏卡片只发一次请求
+        const loadCovers = async (items) => {
+            const pending = [];
+            items.forEach(item => {
+                if (item.poster || item.posterLoading || item.coverFailed) return;
+                if (animeMetaCache.value[item.id] && animeMetaCache.value[item.id].poster) {
+                    item.poster = animeMetaCache.value[item.id].poster;
+                    return;
+                }
+                item.posterLoading = true;
+                pending.push(item);
+            });
+            if (pending.length === 0) return;
+
+            let metas = {};
             try {
-                const res = await axios.get(`/api/get_cover_lazy?title=${encodeURIComponent(item.title)}`);
-                if (res.data.url) {
-                    item.poster = res.data.url;
+                metas = await fetchMetaBatch(pending.map(item => item.id));
+            } catch (e) { }
+            pending.forEach(item => {
+                const meta = metas[String(item.id)];
+                if (meta && meta.poster) {
+                    item.poster = meta.poster;
                     item.coverFailed = false;
-                    if (animeMetaCache.value[item.id]) animeMetaCache.value[item.id].poster = res.data.url;
+                    if (animeMetaCache.value[item.id]) animeMetaCache.value[item.id].poster = meta.poster;
                 } else { item.coverFailed = true; }
-            } catch (e) { item.coverFailed = true; } finally { item.posterLoading = false; }
+                item.posterLoading = false;
+            });
         };
 
         const loadFavoritesIds = async () => {
@@ -204,7 +237,7 @@ createApp({
                 updateCache(animeList.value);
 
                 // 加载封面（如果还没有）
-                animeList.value.forEach(item => loadCover(item));
+                loadCovers(animeList.value);
             } catch (e) {
                 showError('获取追番列表失败');
             } finally {
@@ -250,7 +283,7 @@ createApp({
                 updateCache(animeList.value);
 
                 // 加载封面（如果还没有）
-                animeList.value.forEach(item => loadCover(item));
+                loadCovers(animeList.value);
             } catch (e) {
                 showError('加载历史记录失败');
             } finally {
@@ -258,16 +291,20 @@ createApp({
             }
         };
 
-        const loadPlaybackHistory = async (animeId) => {
+        // 详情页：一次请求拿到播放记录和番剧介绍
+        const loadDetailMeta = async (anime) => {
             lastWatchedEpisode.value = null;
             try {
-                const res = await axios.get(`/api/playback/get/${animeId}`);
-                if (res.data.code === 200 && res.data.data && res.data.data.episode_title) {
+                const metas = await fetchMetaBatch([anime.id], true);
+                const meta = metas[String(anime.id)];
+                if (!meta) return;
+                if (meta.playback && meta.playback.episode_title) {
                     lastWatchedEpisode.value = {
-                        title: res.data.data.episode_title,
-                        time: res.data.data.playback_position || 0
+                        title: meta.playback.episode_title,
+                        time: meta.playback.position || 0
                     };
                 }
+                if (meta.description) descMap.value[anime.title] = meta.description;
             } catch (e) {
                 // 服务器无数据或请求失败
             }
@@ -284,12 +321,30 @@ createApp({
                         const position = Math.floor(time);
 
                         // 🔥 只保存，不清除（清除由 timeupdate 事件处理）
-                        axios.post('/api/playback/save', { anime_id: animeId, episode_title: epTitle, playback_position: position }).catch(() => { });
+                        axios.post('/api/playback/save', { anime_id: animeId, episode_title: epTitle, playback_position: position })
+                            .catch(() => queueOfflineProgress(animeId, epTitle, position));
                     }
                 }
             }, 5000);
         };
 
+        // 🔥 离线时进度先存在本地，恢复网络后批量上传（服务端按观看时间取最新）
+        const OFFLINE_KEY = 'pendingPlayback';
+        const queueOfflineProgress = (animeId, epTitle, position) => {
+            const pending = JSON.parse(localStorage.getItem(OFFLINE_KEY) || '{}');
+            pending[animeId] = { anime_id: animeId, episode_title: epTitle, playback_position: position, timestamp: new Date().toISOString() };
+            localStorage.setItem(OFFLINE_KEY, JSON.stringify(pending));
+        };
+        const flushOfflineProgress = async () => {
+            const pending = JSON.parse(localStorage.getItem(OFFLINE_KEY) || '{}');
+            const updates = Object.values(pending);
+            if (!updates.length) return;
+            try {
+                const res = await axios.post('/api/playback/batch', { updates });
+                if (res.data.code === 200) localStorage.removeItem(OFFLINE_KEY);
+            } catch (e) { }
+        };
+
         const stopSavingProgress = () => { if (saveTimer) { clearInterval(saveTimer); saveTimer = null; } };
 
         const resumePlay = () => {
@@ -320,7 +375,26 @@ createApp({
         };
 
         const handleImageError = (item) => { item.poster = ""; item.posterLoading = false; item.coverFailed = true; };
-        const doSearch = () => { switchMode('home'); fetchList(true); };
+        const doSearch = () => { searchSuggestions.value = []; switchMode('home'); fetchList(true); };
+
+        // 输入联想：停止输入 150ms 后请求 /api/suggest，选中联想项直接搜索
+        let suggestTimer = null;
+        let suggestSeq = 0;
+        const onSearchInput = () => {
+            clearTimeout(suggestTimer);
+            const q = searchQuery.value.trim();
+            if (searchSuggestions.value.some(s => s.title === q)) { doSearch(); return; }
+            if (!q) { searchSuggestions.value = []; return; }
+            suggestTimer = setTimeout(async () => {
+                const seq = ++suggestSeq;
+                try {
+                    const res = await axios.get('/api/suggest', { params: { q } });
+                    // 只采用最后一次请求的结果，避免慢响应覆盖新输入
+                    if (seq === suggestSeq && res.data.code === 200) searchSuggestions.value = res.data.data;
+                } catch (e) { /* 联想失败不影响搜索 */ }
+            }, 150);
+        };
+        const applyFilters = () => { if (mode.value === 'home') fetchList(true); };
         const switchMode = (m) => {
             if (m === mode.value) return;
             if (m === 'player') { lastMode.value = mode.value; mode.value = m; return; }
@@ -359,7 +433,7 @@ createApp({
             }
 
             // 先加载历史记录，再加载选集，确保 playEp 能获取到最新的历史记录
-            await loadPlaybackHistory(anime.id);
+            await loadDetailMeta(anime);
             fetchEpisodes(anime.id);
         };
 
@@ -644,10 +718,71 @@ createApp({
             }
         };
 
+        // 🔥 其他设备上的追番 / 播放记录变更由服务端推送，不再轮询全量数据
+        const applySyncChange = (ev) => {
+            const id = ev.anime_id;
+            if (ev.type === 'favorite') {
+                const has = favoritesList.value.includes(id);
+                if (ev.data.is_favorite && !has) favoritesList.value.push(id);
+                if (!ev.data.is_favorite && has) favoritesList.value = favoritesList.value.filter(x => x !== id);
+            } else if (ev.type === 'playback') {
+                const rest = historyList.value.filter(h => h.animeId !== id);
+                if (ev.data) {
+                    rest.unshift({
+                        animeId: id,
+                        episodeTitle: ev.data.episode_title,
+                        timestamp: new Date(ev.data.timestamp),
+                        position: ev.data.playback_position || 0
+                    });
+                }
+                historyList.value = rest;
+            }
+        };
+
+        // 断线太久时按上次同步到的位置取增量，只有服务端无法给出增量时才拉全量
+        let syncPosition = null;
+        const syncDelta = async () => {
+            try {
+                const res = await axios.get('/api/sync/delta', { params: syncPosition ? { since: syncPosition } : {} });
+                if (res.data.code !== 200) return;
+                const d = res.data;
+                if (d.full) {
+                    loadFavoritesIds();
+                    loadHistoryData();
+                } else {
+                    d.favorites.added.forEach(id => applySyncChange({ type: 'favorite', anime_id: id, data: { is_favorite: true } }));
+                    d.favorites.removed.forEach(id => applySyncChange({ type: 'favorite', anime_id: id, data: { is_favorite: false } }));
+                    Object.entries(d.playback.updated).forEach(([id, rec]) => applySyncChange({ type: 'playback', anime_id: id, data: rec }));
+                    d.playback.removed.forEach(id => applySyncChange({ type: 'playback', anime_id: id, data: null }));
+                }
+                syncPosition = d.position;
+            } catch (e) { }
+        };
+
+        const connectSync = () => {
+            if (!window.EventSource) return;
+            const source = new EventSource('/api/sync/events');
+            source.addEventListener('ready', (e) => {
+                if (!syncPosition) syncPosition = JSON.parse(e.data).position;
+                flushOfflineProgress();
+            });
+            source.addEventListener('change', (e) => {
+                applySyncChange(JSON.parse(e.data));
+                syncPosition = e.lastEventId;
+            });
+            source.addEventListener('reset', syncDelta);
+            source.onerror = () => {
+                // 服务端推送连接已满 (503) 等非 200 响应时浏览器不会自动重连，稍后自行重连并补齐
+                if (source.readyState !== EventSource.CLOSED) return;
+                setTimeout(() => { connectSync(); syncDelta(); }, 30000 + Math.random() * 30000);
+            };
+        };
+
         onMounted(() => {
+            connectSync();  // 先连上推送再拉全量，中间的变更不会漏掉
+            window.addEventListener('online', flushOfflineProgress);
             loadFavoritesIds();
             loadHistoryData();  // 加载播放历史数据
-            loadDescMap();  // 加载介绍数据
             fetchSchedule();
 
             // 🔥 添加滚动监听
@@ -682,11 +817,12 @@ createApp({
 
         return {
             mode, years, selectedYear, selectedSeason, weekDays, weekData, currentDayTab,
-            animeList, loading, page, hasMore, searchQuery,
+            animeList, loading, page, hasMore, searchQuery, searchSuggestions, onSearchInput,
+            listFilters, listFacets, facetYears, applyFilters,
             currentAnime, episodes, loadingEps, loadingEpsError, currentEp,
             videoUrl, loadingVideo, videoPlayer, errorMsg,
             favoritesList, lastWatchedEpisode, historyList, descMap,
-            fetchList, fetchSchedule, loadCover, handleImageError,
+            fetchList, fetchSchedule, loadCovers, handleImageError,
             doSearch, switchMode, reloadHome,
             openDetail, playEp, closePlayer, fetchEpisodes,
             toggleFavorite, isFavorited, fetchFavorites, fetchHistory,
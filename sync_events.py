@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+追番 / 播放记录的变更推送
+
+每次提交用户状态修改后发布一条带递增序号的事件：
+  {"seq": 12, "type": "favorite", "anime_id": "123", "data": {"is_favorite": true}}
+  {"seq": 13, "type": "playback", "anime_id": "123", "data": {...} 或 null (清除)}
+最近 history 条事件保留在内存环形缓冲里，客户端断线重连时带上最后收到的
+"epoch:seq" 即可补发；缓冲已覆盖不到，或 epoch 不同 (服务重启) 时，
+客户端会收到 reset，需要重新拉取全量状态。
+
+每个订阅连接有自己的有界队列，消费太慢导致溢出时同样以 reset 结束该连接，
+不会拖累发布者或占用无限内存。
+
+序号和 epoch 由 VersionStore 持久化：它记录每个追番 / 播放记录条目最后一次变更的
+序号 (删除的条目留下墓碑)，客户端带着上次同步到的位置来取增量，开销只与变更数有关。
+版本文件不在每次变更时重写：累计 SAVE_EVERY 条或距上次落盘超过 SAVE_INTERVAL 秒时写一次，
+正常退出时再写一次。单进程没有正常退出时最后几条可能丢失，下次启动跳过这些序号，
+之前的位置一律全量同步；多进程时从共享日志回放补上。
+
+多进程部署时事件追加写入 run/ 下的共享日志 (flock 保护)，序号全局递增，
+各 worker 轮询日志把其他进程的事件转发给自己的订阅者，同时记入自己的 VersionStore。
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import threading
+from collections import deque, OrderedDict
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+import multiproc
+
+KINDS = ("favorite", "playback")
+SAVE_EVERY = 32  # 版本文件每累计多少条变更落盘一次，应小于变更推送保留的事件数
+SAVE_INTERVAL = 5  # 有未落盘的变更时，最多隔多少秒落盘一次
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+# ================= 时间戳 =================
+def utc_iso(dt=None):
+    """定宽的 UTC 时间戳 (毫秒精度，Z 结尾)，字符串顺序即时间顺序"""
+    dt = (dt or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f"{dt.microsecond // 1000:03d}Z"
+
+
+def parse_ts(value):
+    """解析 ISO 时间戳；没有时区的旧数据按服务器本地时间处理。无法解析时返回 None"""
+    if not isinstance(value, str) or not value:
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return dt
+
+
+def normalize_timestamps(playback):
+    """把播放记录里的时间戳统一成 utc_iso 格式，返回修改的条数"""
+    changed = 0
+    for record in playback.values():
+        ts = record.get('timestamp')
+        dt = parse_ts(ts)
+        if dt is not None and utc_iso(dt) != ts:
+            record['timestamp'] = utc_iso(dt)
+            changed += 1
+    return changed
+
+
+# ================= 条目版本 =================
+class VersionStore:
+    """
+    持久化的变更序号：
+      {"epoch": ..., "seq": 最新序号, "floor": 已清理墓碑的最大序号,
+       "entries": {"favorite:<id>": [seq, 1/0, 变更时间], "playback:<id>": [...]},
+       "clean": 是否为正常退出时写入}
+    entries 按序号升序排列 (每次变更移到末尾)，取增量时从尾部倒序扫描即可。
+    dirty 为上次落盘后的变更数，何时落盘由 ChangeFeed 决定。
+    """
+
+    MAX_TOMBSTONES = 5000
+
+    def __init__(self, path):
+        self.path = path
+        self.epoch = None
+        self.seq = 0
+        self.floor = 0
+        self.entries = OrderedDict()
+        self._dead = 0
+        self._mtime = None
+        self.dirty = 0
+        self.clean = True
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.epoch = data.get("epoch") or uuid.uuid4().hex[:8]
+        self.seq = data.get("seq", 0)
+        self.floor = data.get("floor", 0)
+        items = sorted(data.get("entries", {}).items(), key=lambda kv: kv[1][0])
+        self.entries = OrderedDict((k, list(v)) for k, v in items)
+        self._dead = sum(1 for v in self.entries.values() if not v[1])
+        self._mtime = _mtime_ns(self.path)
+        self.dirty = 0
+        self.clean = data.get("clean", True)
+
+    def recover(self):
+        """
+        单进程启动时调用。上次没有正常退出时，最后不到 SAVE_EVERY 条变更可能没有落盘：
+        跳过这些可能已发给客户端的序号，更早的位置不再给增量，并立即落盘
+        """
+        if self.clean:
+            return
+        self.seq += SAVE_EVERY
+        self.floor = self.seq
+        self.save()
+        print(f"[WARN] 同步版本文件未正常保存，序号跳到 {self.seq}，旧位置的客户端将全量同步", flush=True)
+
+    def save(self, clean=False):
+        multiproc.write_json_atomic(self.path, {
+            "epoch": self.epoch, "seq": self.seq, "floor": self.floor, "entries": self.entries,
+            "clean": clean,
+        })
+        self._mtime = _mtime_ns(self.path)
+        self.dirty = 0
+        self.clean = clean
+
+    def record(self, kind, anime_id, alive, seq, at):
+        key = f"{kind}:{anime_id}"
+        old = self.entries.get(key)
+        if old is not None and old[0] >= seq:
+            return  # 已记录过 (多进程下回放共享日志)
+        self.entries.pop(key, None)
+        if old is not None and not old[1]:
+            self._dead -= 1
+        self.entries[key] = [seq, 1 if alive else 0, at]
+        if not alive:
+            self._dead += 1
+        self.seq = max(self.seq, seq)
+        self.dirty += 1
+        if self._dead > self.MAX_TOMBSTONES:
+            self._prune()
+
+    def _prune(self):
+        """清理最早的一半墓碑；floor 之前的位置无法再取增量"""
+        target = self.MAX_TOMBSTONES // 2
+        for key in list(self.entries):
+            if self._dead <= target:
+                break
+            seq, alive = self.entries[key][:2]
+            if not alive:
+                del self.entries[key]
+                self._dead -= 1
+                self.floor = max(self.floor, seq)
+
+    def changes_since(self, seq):
+        """
+        seq 之后变更过的条目 [(kind, id, alive)]，按序号升序；
+        seq 早于已清理的墓碑时返回 None，需要全量同步
+        """
+        if seq < self.floor:
+            return None
+        out = []
+        for key in reversed(self.entries):
+            entry_seq, alive = self.entries[key][:2]
+            if entry_seq <= seq:
+                break
+            kind, anime_id = key.split(":", 1)
+            out.append((kind, anime_id, bool(alive)))
+        out.reverse()
+        return out
+
+    def latest(self):
+        """各类条目最近一次变更的序号 {kind: seq}"""
+        out = {}
+        for key in reversed(self.entries):
+            kind = key.split(":", 1)[0]
+            if kind not in out:
+                out[kind] = self.entries[key][0]
+                if len(out) == len(KINDS):
+                    break
+        return out
+
+    def removed_at(self, kind, anime_id):
+        """条目被删除的时间 (time.time())，没有墓碑时返回 None"""
+        entry = self.entries.get(f"{kind}:{anime_id}")
+        if entry is None or entry[1]:
+            return None
+        return entry[2]
+
+
+# ================= 推送 =================
+class Overflow(Exception):
+    """订阅者队列溢出，连接需要重置"""
+
+
+class TooManySubscribers(Exception):
+    """推送连接数已达上限"""
+
+
+class Subscription:
+    def __init__(self, feed, maxlen):
+        self._feed = feed
+        self._queue = deque()
+        self._maxlen = maxlen
+        self._cond = threading.Condition()
+        self.overflowed = False
+
+    def _push(self, event):
+        """返回本次是否刚刚溢出"""
+        with self._cond:
+            if self.overflowed:
+                return False
+            if len(self._queue) >= self._maxlen:
+                self.overflowed = True
+                self._queue.clear()
+            else:
+                self._queue.append(event)
+            self._cond.notify()
+            return self.overflowed
+
+    def get(self, timeout):
+        """等待新事件，返回事件列表；超时返回空列表，溢出时抛 Overflow"""
+        with self._cond:
+            if not self._queue and not self.overflowed:
+                self._cond.wait(timeout)
+            if self.overflowed:
+                raise Overflow()
+            events = list(self._queue)
+            self._queue.clear()
+            return events
+
+    def close(self):
+        self._feed._unsubscribe(self)
+
+
+class ChangeFeed:
+    LOG_MAX_BYTES = 1 << 20  # 共享日志超过该大小时压缩为最近 history 条
+
+    def __init__(self, versions, history=1024, queue_size=256, log_path=None, max_subscribers=0):
+        self.versions = versions
+        self.history_size = history
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers  # 同时订阅的连接数上限，0 表示不限
+        self.epoch = versions.epoch
+        self.seq = versions.seq
+        self._history = deque(maxlen=history)
+        self.kind_seq = {}  # 类型 -> 该类型最近一次事件的序号
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "overflows": 0, "rejected": 0, "saves": 0}
+        self._saved_at = time.monotonic()
+        self._flusher = None
+        # 多进程共享日志
+        self._log_path = log_path
+        self._file_lock = multiproc.FileLock(f"{log_path}.lock") if log_path else None
+        self._offset = 0
+        self._inode = None
+        if log_path:
+            with self._file_lock:
+                # 以文件为准 (先启动的 worker 可能已经写过，沿用它的 epoch)，没有时由本进程写出；
+                # 未落盘的变更都在共享日志里，下面回放即可补上
+                if _mtime_ns(versions.path) is None:
+                    versions.save()
+                else:
+                    versions.load()
+                self.epoch, self.seq = versions.epoch, versions.seq
+                self._ingest()
+                if self._inode is None or self.epoch != versions.epoch:
+                    # 没有日志，或日志属于旧的 epoch (版本文件才是准的)
+                    self.epoch, self.seq = versions.epoch, versions.seq
+                    self._history.clear()
+                    self._rewrite([])
+        else:
+            versions.recover()
+            self.seq = versions.seq
+        for kind, seq in versions.latest().items():
+            self.kind_seq[kind] = max(self.kind_seq.get(kind, 0), seq)
+
+    # ---------- 发布 ----------
+    def publish(self, type_, anime_id, data=None):
+        """
+        在用户状态的写锁内调用，保证事件顺序与提交顺序一致。
+        type_ 为 favorite (data={"is_favorite": bool}) 或 playback (data 为记录，None 表示清除)
+        """
+        with self._file_lock or nullcontext():
+            if self._log_path:
+                self._ingest()
+            event = {"seq": max(self.seq, self.versions.seq) + 1, "type": type_, "anime_id": anime_id,
+                     "data": data, "ts": time.time()}
+            self._record(event)
+            if self._log_path:
+                self._append(event)
+            self._save_if_due()
+        self._dispatch(event)
+        if self._flusher is None:
+            self._start_flusher()
+        return event
+
+    def _record(self, event):
+        alive = event["data"]["is_favorite"] if event["type"] == "favorite" else event["data"] is not None
+        self.versions.record(event["type"], event["anime_id"], alive, event["seq"], event["ts"])
+
+    # ---------- 版本文件落盘 ----------
+    def _save_if_due(self, force=False, clean=False):
+        """调用方持有文件锁"""
+        versions = self.versions
+        now = time.monotonic()
+        if not (versions.dirty or clean):
+            return
+        if force or versions.dirty >= SAVE_EVERY or now - self._saved_at >= SAVE_INTERVAL:
+            versions.save(clean=clean)
+            self._saved_at = now
+            self.stats["saves"] += 1
+
+    def flush(self, clean=False):
+        """把未落盘的变更写入版本文件；clean 表示正常退出 (只有单进程时才能确定没有其他写入者)"""
+        with self._file_lock or nullcontext():
+            if self._log_path:
+                self._ingest()
+            self._save_if_due(force=True, clean=clean and not self._log_path)
+
+    def _start_flusher(self):
+        """第一次发布时启动：定时落盘，并在进程退出时写最后一次"""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="change-feed-flush")
+        self._flusher.start()
+        atexit.register(self.flush, clean=True)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(SAVE_INTERVAL)
+            try:
+                if self.versions.dirty:
+                    self.flush()
+            except Exception as e:
+                print(f"[ERROR] 保存同步版本文件失败: {e}", flush=True)
+
+    def changes_since(self, position):
+        """
+        增量同步：返回 (当前位置, [(kind, id, alive)])；
+        position 无效、属于其他 epoch 或太旧时返回 (当前位置, None)，需要全量同步
+        """
+        with self._file_lock or nullcontext():
+            if self._log_path:
+                self._ingest()
+            versions = self.versions
+            current = f"{versions.epoch}:{versions.seq}"
+            try:
+                epoch, seq = position.rsplit(":", 1)
+                seq = int(seq)
+            except (AttributeError, ValueError):
+                return current, None
+            if epoch != versions.epoch or seq > versions.seq:
+                return current, None
+            return current, versions.changes_since(seq)
+
+    def _dispatch(self, event):
+        with self._lock:
+            if event["seq"] <= self.seq:
+                return
+            self.seq = event["seq"]
+            self.kind_seq[event["type"]] = event["seq"]
+            self._history.append(event)
+            self.stats["published"] += 1
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub._push(event):
+                self.stats["overflows"] += 1
+
+    # ---------- 订阅 ----------
+    def subscribe(self):
+        """连接数已达 max_subscribers 时抛 TooManySubscribers"""
+        sub = Subscription(self, self.queue_size)
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                self.stats["rejected"] += 1
+                raise TooManySubscribers()
+            self._subscribers.add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def position(self, kind=None):
+        """当前位置 "epoch:seq"；指定 kind 时为该类型最近一次事件的位置，只随该类型的变更前进"""
+        if kind is None:
+            return f"{self.epoch}:{self.seq}"
+        return f"{self.epoch}:{self.kind_seq.get(kind, 0)}"
+
+    def since(self, position):
+        """
+        position 为 "epoch:seq"，返回之后的事件列表；
+        无法补全 (epoch 不同、序号超前或已被挤出缓冲) 时返回 None
+        """
+        try:
+            epoch, seq = position.rsplit(":", 1)
+            seq = int(seq)
+        except (AttributeError, ValueError):
+            return None
+        with self._lock:
+            if epoch != self.epoch or seq > self.seq:
+                return None
+            if seq == self.seq:
+                return []
+            if not self._history or self._history[0]["seq"] > seq + 1:
+                return None
+            return [e for e in self._history if e["seq"] > seq]
+
+    # ---------- 多进程共享日志 ----------
+    def _ingest(self):
+        """读入其他进程追加的事件，调用方持有文件锁"""
+        try:
+            st = os.stat(self._log_path)
+        except OSError:
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._inode, self._offset = st.st_ino, 0
+        if st.st_size == self._offset:
+            return
+        with open(self._log_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # 只处理完整的行，写了一半的行留到下次
+        end = chunk.rfind(b"\n") + 1
+        self._offset += end
+        for line in chunk[:end].splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if "epoch" in item:
+                if item["epoch"] != self.epoch:
+                    with self._lock:
+                        self.epoch = item["epoch"]
+                        self.seq = max(self.seq, item.get("seq", 0))
+                        self._history.clear()
+                continue
+            if self.epoch == self.versions.epoch:
+                self._record(item)
+            self._dispatch(item)
+
+    def _append(self, event):
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        if self._offset + len(line) > self.LOG_MAX_BYTES:
+            self._rewrite(list(self._history) + [event])
+            return
+        with open(self._log_path, 'ab') as f:
+            f.write(line)
+        self._offset += len(line)
+
+    def _rewrite(self, events):
+        """重写日志：头部记录 epoch 和起始序号，再写最近的事件"""
+        events = events[-self.history_size:]
+        base = events[0]["seq"] - 1 if events else self.seq
+        lines = [json.dumps({"epoch": self.epoch, "seq": base})]
+        lines += [json.dumps(e, ensure_ascii=False) for e in events]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        tmp = f"{self._log_path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._log_path)
+        st = os.stat(self._log_path)
+        self._inode, self._offset = st.st_ino, len(data)
+
+    def follow(self, interval=0.5):
+        """多进程模式下轮询共享日志"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    with self._file_lock:
+                        self._ingest()
+                except Exception as e:
+                    print(f"[ERROR] 读取变更日志失败: {e}", flush=True)
+
+        threading.Thread(target=loop, daemon=True, name="change-feed-follow").start()
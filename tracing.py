@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+请求内的耗时分段与采样分析
+
+/api/episodes、/api/play_info 变慢时，需要知道时间花在了上游请求、页面解析、OpenCC 转换、
+DATA_LOCK 等待还是 JSON 序列化上：
+  - 每个请求开始时 start() 一个 Trace，代码里用 `with span("upstream"):` 标出各阶段，
+    同名阶段累加耗时和次数；不在请求内 (没有当前 Trace) 时 span() 只多一次线程局部变量读取
+  - 线程池里的工作用 bind(fn) 包装后，耗时记到提交它的请求上
+  - SlowLog：总耗时超过阈值的请求打印各阶段耗时，并保留最近若干条供接口查询
+  - sample_stacks()：按固定间隔采样所有线程的调用栈，输出 flamegraph.pl / speedscope
+    可直接读取的折叠栈格式 (每行 "帧;帧;帧 次数")；只在调用期间运行，平时没有任何开销
+
+并发阶段 (如同时抓取多个分类页) 的耗时按各线程分别累加，可能超过请求的总耗时。
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+
+_local = threading.local()
+
+# 采样时视为空闲的最内层帧 (文件名, 函数名)：等待锁、等待连接、线程池等任务
+IDLE_FRAMES = frozenset((
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+))
+
+
+class Trace:
+    __slots__ = ("name", "started", "spans", "covered", "_lock")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = {}      # 阶段名 -> [累计秒数, 次数]，按首次出现的顺序
+        self.covered = 0.0   # 最外层阶段的累计耗时，用于计算未归入任何阶段的时间
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, top_level=False):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                self.spans[name] = [seconds, 1]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+            if top_level:
+                self.covered += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def breakdown(self, total=None):
+        """[(阶段名, 毫秒, 次数)]，最后一项为未归入任何阶段的时间"""
+        total = self.elapsed() if total is None else total
+        with self._lock:
+            rows = [(name, seconds * 1000, count) for name, (seconds, count) in self.spans.items()]
+            rows.append(("其他", max(0.0, total - self.covered) * 1000, 1))
+        return rows
+
+
+# ================= 当前请求 =================
+def start(name):
+    trace = Trace(name)
+    _local.trace = trace
+    _local.depth = 0
+    return trace
+
+
+def finish():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace
+
+
+def current():
+    return getattr(_local, "trace", None)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "depth", "t0")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.depth = _local.depth
+        _local.depth = self.depth + 1
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        _local.depth = self.depth
+        self.trace.add(self.name, time.perf_counter() - self.t0, top_level=self.depth == 0)
+        return False
+
+
+def span(name):
+    """with span("parse"): ...；没有当前请求时返回共享的空上下文"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name)
+
+
+def add(name, seconds):
+    """记录一段在别处计时的耗时 (如锁等待)，没有当前请求时忽略"""
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.add(name, seconds, top_level=_local.depth == 0)
+
+
+def wrap(name, fn):
+    """返回在 span(name) 内调用 fn 的函数，用于被频繁调用的函数 (如 OpenCC 转换)"""
+    def wrapper(*args, **kwargs):
+        if getattr(_local, "trace", None) is None:
+            return fn(*args, **kwargs)
+        with span(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def bind(fn):
+    """把当前请求带到其他线程：返回的函数在线程池中执行时，其中的阶段记到提交时的请求上"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        saved = getattr(_local, "trace", None), getattr(_local, "depth", 0)
+        # 视为调用方某个阶段内部的工作，不计入最外层覆盖时间
+        _local.trace, _local.depth = trace, 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.trace, _local.depth = saved
+    return bound
+
+
+# ================= 慢请求日志 =================
+class SlowLog:
+    def __init__(self, threshold=1.0, keep=50):
+        self.threshold = threshold
+        self.recent = deque(maxlen=keep)
+        self.count = 0
+
+    def record(self, trace, label, status):
+        """请求结束时调用；超过阈值时打印并保存各阶段耗时，返回是否为慢请求"""
+        total = trace.elapsed()
+        if total < self.threshold:
+            return False
+        rows = trace.breakdown(total)
+        self.count += 1
+        self.recent.append({
+            "at": time.time(),
+            "request": label,
+            "status": status,
+            "total_ms": round(total * 1000, 1),
+            "spans": [{"name": n, "ms": round(ms, 1), "count": c} for n, ms, c in rows],
+        })
+        parts = ", ".join(f"{n} {ms:.0f}ms" + (f"×{c}" if c > 1 else "") for n, ms, c in rows)
+        print(f"[WARN] 慢请求 {total * 1000:.0f} ms {label} {status}: {parts}", flush=True)
+        return True
+
+
+# ================= 采样分析 =================
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=0.005, include_idle=False):
+    """
+    采样 seconds 秒内所有其他线程的调用栈，返回 Counter{折叠栈: 次数}。
+    栈根为线程名；include_idle=False 时丢弃停在等待上的样本 (见 IDLE_FRAMES)。
+    """
+    me = threading.get_ident()
+    counts = Counter()
+    names = {}
+    deadline = time.monotonic() + seconds
+    next_names = 0.0
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        if now >= next_names:
+            # 线程名每秒刷新一次
+            names = {t.ident: t.name.replace(";", "_").replace(" ", "_") for t in threading.enumerate()}
+            next_names = now + 1.0
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            counts[";".join(stack)] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapsed(counts):
+    """折叠栈文本，每行 "帧;帧;帧 次数"，按次数从多到少"""
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+按主机的上游健康状态：熔断、自适应超时、并发上限
+
+  - 熔断：连续失败 failure_threshold 次 (连接错误、超时、5xx) 后断开，冷却期内的请求
+    立即抛 CircuitOpen，不再占用工作线程等超时；冷却结束后进入半开，只放一个探测请求，
+    成功则恢复，失败则冷却时间翻倍 (上限 max_cooldown)
+  - 自适应超时：按 TCP RTO 的方式维护延迟的平滑均值和偏差，超时 = 均值 + 4 × 偏差，
+    限制在 [min_timeout, max_timeout]；超时失败一次就翻倍
+  - 并发上限：同一主机同时进行的请求超过 max_inflight 时直接拒绝，上游变慢时线程不会越积越多
+
+调用方捕获 CircuitOpen 后可以返回缓存中的旧数据 (附带过期标记) 或 503。
+"""
+import time
+import threading
+import urllib.parse
+
+import httpx
+
+import metrics
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpen(Exception):
+    """上游熔断中或并发已满，请求没有发出"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"上游 {host} 暂不可用，{retry_after:.0f} 秒后重试")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class HostHealth:
+    def __init__(self, host, policy):
+        self.host = host
+        self.policy = policy
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = policy.cooldown
+        self.opened_at = 0.0
+        self.probing = False
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = policy.max_timeout
+        self.inflight = 0
+        self.last_success = None
+        self.stats = {"ok": 0, "failed": 0, "rejected": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    # ---------- 放行 ----------
+    def acquire(self):
+        """返回 (本次超时, 是否为半开探测)；不放行时抛 CircuitOpen"""
+        p = self.policy
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpen(self.host, remaining)
+                self.state = HALF_OPEN
+            probe = False
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpen(self.host, 1)
+                self.probing = probe = True
+            if self.inflight >= p.max_inflight:
+                self.stats["rejected"] += 1
+                raise CircuitOpen(self.host, 1)
+            self.inflight += 1
+            return self.rto, probe
+
+    # ---------- 结果 ----------
+    def success(self, elapsed, probe):
+        p = self.policy
+        with self._lock:
+            self.inflight -= 1
+            self.stats["ok"] += 1
+            self.last_success = time.time()
+            if probe:
+                self.probing = False
+            if self.state != CLOSED:
+                print(f"[SUCCESS] 上游 {self.host} 恢复", flush=True)
+            self.state = CLOSED
+            self.failures = 0
+            self.cooldown = p.cooldown
+            if self.srtt is None:
+                self.srtt, self.rttvar = elapsed, elapsed / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - elapsed)
+                self.srtt = 0.875 * self.srtt + 0.125 * elapsed
+            self.rto = min(p.max_timeout, max(p.min_timeout, self.srtt + 4 * self.rttvar))
+
+    def failure(self, timed_out, probe, timeout=None):
+        p = self.policy
+        with self._lock:
+            self.inflight -= 1
+            self.stats["failed"] += 1
+            if probe:
+                self.probing = False
+            if timed_out:
+                # 按本次使用的超时翻倍，同一时刻并发超时的请求只翻一次
+                self.rto = min(p.max_timeout, max(self.rto, (timeout or self.rto) * 2))
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.cooldown = min(p.max_cooldown, self.cooldown * 2)
+                self._open()
+            elif self.state == CLOSED and self.failures >= p.failure_threshold:
+                self._open()
+
+    def release(self, probe):
+        """请求因与上游无关的原因中断，不计入成败"""
+        with self._lock:
+            self.inflight -= 1
+            if probe:
+                self.probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        print(f"[WARN] 上游 {self.host} 连续失败 {self.failures} 次，熔断 {self.cooldown:.0f} 秒", flush=True)
+
+    @property
+    def is_open(self):
+        return self.state != CLOSED
+
+
+class UpstreamHealth:
+    def __init__(self, failure_threshold=5, cooldown=10.0, max_cooldown=300.0,
+                 min_timeout=2.0, max_timeout=15.0, max_inflight=32):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.max_inflight = max_inflight
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def host(self, url):
+        name = urllib.parse.urlsplit(str(url)).hostname or ""
+        h = self._hosts.get(name)
+        if h is None:
+            with self._lock:
+                h = self._hosts.get(name)
+                if h is None:
+                    h = self._hosts[name] = HostHealth(name, self)
+        return h
+
+    def is_open(self, url):
+        return self.host(url).is_open
+
+    def request(self, client, method, url, min_timeout=None, **kwargs):
+        """
+        经过熔断器发出请求并记录结果。min_timeout 用于本来就慢的请求 (如完整番剧列表)，
+        只抬高超时下限，熔断和并发上限照常生效。
+        5xx 计为失败但仍返回响应，由调用方决定如何处理。
+        """
+        h = self.host(url)
+        timeout, probe = h.acquire()
+        if min_timeout is not None:
+            timeout = max(timeout, min_timeout)
+        # 连接阶段不需要太久，上游宕机时尽快失败
+        kwargs.setdefault("timeout", httpx.Timeout(timeout, connect=min(timeout, 5.0)))
+        t0 = time.perf_counter()
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            h.failure(isinstance(e, httpx.TimeoutException), probe, timeout)
+            metrics.record_upstream_error(url, e)
+            raise
+        except BaseException:
+            h.release(probe)
+            raise
+        if response.status_code >= 500:
+            h.failure(False, probe)
+        else:
+            h.success(time.perf_counter() - t0, probe)
+        return response
+
+    # ---------- 监控 ----------
+    def states(self):
+        """{主机: (状态, 当前超时, 连续失败次数)}"""
+        return {name: (h.state, h.rto, h.failures) for name, h in list(self._hosts.items())}
+
+    def stats(self):
+        return {name: dict(h.stats) for name, h in list(self._hosts.items())}